@@ -0,0 +1,69 @@
+# Port expression benchmarks. Run from the repository root:
+#   python -m benchmarks.bench_ports [--min-time 0.5] [--output results.json]
+from typing import Any, Callable
+from benchmarks.common import measure, result, run_benchmarks
+from lspnetd.common.expression import PortSet, parse_ports_expression, port_segments_to_expression, ports_to_segments
+
+
+INPUTS = {
+    "full": "1-65535",
+    # 2000 ranges of 10 ports
+    "fragmented": ",".join("{}-{}".format(i * 30 + 1, i * 30 + 10) for i in range(2000)),
+    # 1000 single ports
+    "sparse": ",".join(str(i * 61 + 7) for i in range(1000)),
+}
+
+
+def bench_parse(min_time: float):
+    results: list[dict[str, Any]] = []
+    for input_name, expr in INPUTS.items():
+        iterations, seconds = measure(lambda: PortSet.parse(expr), min_time)
+        results.append(result("portset_parse", iterations, seconds, input=input_name))
+
+        port_set = PortSet.parse(expr)
+        iterations, seconds = measure(port_set.format, min_time)
+        results.append(result("portset_format", iterations, seconds, input=input_name))
+
+        iterations, seconds = measure(port_set.multiport_chunks, min_time)
+        results.append(result("portset_multiport_chunks", iterations, seconds, input=input_name))
+
+        # list based helpers, expand every port
+        iterations, seconds = measure(lambda: port_segments_to_expression(ports_to_segments(parse_ports_expression(expr))), min_time)
+        results.append(result("ports_list_roundtrip", iterations, seconds, input=input_name))
+    return results
+
+
+def bench_setops(min_time: float):
+    results: list[dict[str, Any]] = []
+    for input_name, expr in INPUTS.items():
+        a = PortSet.parse(expr)
+        # same shape shifted by 5, so about half of every range overlaps
+        b = PortSet((begin_port + 5, min(end_port + 5, 65535)) for begin_port, end_port in a.segments)
+
+        for op_name, op in (("union", a.union), ("intersection", a.intersection), ("difference", a.difference), ("issubset", a.issubset)):
+            iterations, seconds = measure(lambda: op(b), min_time)
+            results.append(result("portset_" + op_name, iterations, seconds, input=input_name))
+
+        probes = list(range(1, 65536, 97))
+
+        def contains():
+            for port in probes:
+                port in a
+
+        iterations, seconds = measure(contains, min_time)
+        results.append(result("portset_contains_x{}".format(len(probes)), iterations, seconds, input=input_name))
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[float], list[dict[str, Any]]]] = {
+    "parse": bench_parse,
+    "setops": bench_setops,
+}
+
+
+def main():
+    run_benchmarks("lspnetd port expression benchmarks", BENCHMARKS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+# Secure channel benchmarks. Run from the repository root:
+#   python -m benchmarks.bench_secure [--min-time 0.5] [--output results.json]
+# Results are a JSON document so runs of different releases can be diffed.
+import secrets
+import time
+from typing import Any, Callable
+import cryptography
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from benchmarks.common import measure, result, run_benchmarks
+from lspnetd.secure.channel import SecureChannelClient
+from lspnetd.secure.http_client import SecureChannelHTTPClient
+from tests.local_controller import LocalController
+from lspnetd.secure.message import SecureMessage
+
+
+PAYLOAD_SIZES = [64, 1024, 16 * 1024, 256 * 1024]
+E2E_PAYLOAD_SIZES = [64, 16 * 1024]
+# messages encrypted ahead of one timed decrypt run
+DECRYPT_BATCH = 64
+
+
+def make_channel_pair(version: int):
+    client_key = Ed25519PrivateKey.generate()
+    server_key = Ed25519PrivateKey.generate()
+    client = SecureChannelClient(client_key, server_key.public_key())
+    server = SecureChannelClient(server_key, client_key.public_key())
+
+    shared_secret = secrets.token_bytes(32)
+    for channel in (client, server):
+        channel.shared_secret = shared_secret
+        channel.connection_id = 1
+        channel.handshake_private_key = None
+        if version == 2:
+            channel.enable_session_keys()
+    return client, server
+
+
+def bench_channel(min_time: float):
+    results: list[dict[str, Any]] = []
+    for size in PAYLOAD_SIZES:
+        payload = secrets.token_bytes(size)
+        for version in (1, 2):
+            client, server = make_channel_pair(version)
+            encrypt = client.encrypt_v2 if version == 2 else client.encrypt
+
+            iterations, seconds = measure(lambda: encrypt(payload), min_time)
+            results.append(result("channel_encrypt", iterations, seconds, size, version=version))
+
+            # v2 rejects replays, so every decrypt needs its own message. messages are encrypted in small batches,
+            # each on a fresh channel pair, so memory stays flat however many iterations encrypt ran.
+            elapsed = 0.0
+            remaining = iterations
+            while remaining > 0:
+                client, server = make_channel_pair(version)
+                encrypt = client.encrypt_v2 if version == 2 else client.encrypt
+                decrypt = server.decrypt_v2 if version == 2 else server.decrypt
+                messages = [encrypt(payload) for _ in range(min(DECRYPT_BATCH, remaining))]
+                started = time.perf_counter()
+                for message in messages:
+                    decrypt(message)
+                elapsed += time.perf_counter() - started
+                remaining -= len(messages)
+            results.append(result("channel_decrypt", iterations, elapsed / iterations, size, version=version))
+    return results
+
+
+def bench_message(min_time: float):
+    results: list[dict[str, Any]] = []
+    for size in PAYLOAD_SIZES:
+        client, _ = make_channel_pair(1)
+        frame = client.encrypt(secrets.token_bytes(size)).to_bytes()
+
+        iterations, seconds = measure(lambda: SecureMessage.from_bytes(frame), min_time)
+        results.append(result("message_parse", iterations, seconds, size))
+
+        message = SecureMessage.from_bytes(frame)
+
+        def serialize():
+            # fresh message, so the cached frame is rebuilt like on the send path
+            m = SecureMessage(message.cid, message.timestamp, message.salt, message.ciphertext, message.nonce, message.tag, b'')
+            m.get_bytes_to_sign()
+            m.signature = message.signature
+            return m.to_bytes()
+
+        iterations, seconds = measure(serialize, min_time)
+        results.append(result("message_serialize", iterations, seconds, size))
+    return results
+
+
+def bench_channel_handshake(min_time: float):
+    client_key = Ed25519PrivateKey.generate()
+    server_key = Ed25519PrivateKey.generate()
+
+    def handshake():
+        client = SecureChannelClient(client_key, server_key.public_key())
+        client.get_handshake()
+        # peer side: X25519 key, signature over key + cid
+        peer = SecureChannelClient(server_key, client_key.public_key())
+        assert peer.handshake_private_key is not None
+        peer_public = peer.handshake_private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        client.complete_handshake(peer_public, server_key.sign(peer_public + (1).to_bytes(8, 'big')), 1)
+
+    iterations, seconds = measure(handshake, min_time)
+    return [result("channel_handshake", iterations, seconds)]
+
+
+def bench_http(min_time: float):
+    client_key = Ed25519PrivateKey.generate()
+    server_key = Ed25519PrivateKey.generate()
+    client_key_der = client_key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    server_public_der = server_key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    results: list[dict[str, Any]] = []
+    with LocalController(server_key, {"bench": client_key.public_key()}) as controller:
+        for version in (1, 2):
+            client = SecureChannelHTTPClient("bench", controller.address, client_key_der, server_public_der, scheme="http", protocol_version=version)
+
+            def handshake():
+                client.reset()
+                client.handshake()
+
+            iterations, seconds = measure(handshake, min_time)
+            results.append(result("http_handshake", iterations, seconds, version=version))
+
+            for size in E2E_PAYLOAD_SIZES:
+                data = {"data": "x" * size}
+                iterations, seconds = measure(lambda: client.send(data), min_time)
+                results.append(result("http_send", iterations, seconds, size, version=version))
+
+            client.close()
+    return results
+
+
+BENCHMARKS: dict[str, Callable[[float], list[dict[str, Any]]]] = {
+    "channel": bench_channel,
+    "message": bench_message,
+    "handshake": bench_channel_handshake,
+    "http": bench_http,
+}
+
+
+def main():
+    run_benchmarks("lspnetd secure channel benchmarks", BENCHMARKS, cryptography=cryptography.__version__)
+
+
+if __name__ == "__main__":
+    main()
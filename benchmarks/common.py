@@ -0,0 +1,92 @@
+# Shared helpers of the benchmark scripts: timing, result entries, JSON report and baseline comparison.
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable
+
+
+def measure(func: Callable[[], object], min_time: float):
+    "-> (iterations, seconds per iteration)"
+
+    iterations = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        func()
+        iterations += 1
+        elapsed = time.perf_counter() - started
+    return iterations, elapsed / iterations
+
+
+def result(name: str, iterations: int, seconds: float, payload_size: int = 0, **params: Any):
+    entry: dict[str, Any] = {
+        "name": name,
+        **params,
+        "iterations": iterations,
+        "seconds_per_op": seconds,
+        "ops_per_second": 1 / seconds,
+    }
+    if payload_size:
+        entry["payload_size"] = payload_size
+        entry["mib_per_second"] = payload_size / seconds / 1024 / 1024
+    return entry
+
+
+MEASUREMENT_FIELDS = {"iterations", "seconds_per_op", "ops_per_second", "mib_per_second", "baseline_ratio"}
+
+
+def result_key(entry: dict[str, Any]):
+    # name plus every benchmark parameter (version, payload_size, input, ...)
+    return tuple(sorted((k, str(v)) for k, v in entry.items() if k not in MEASUREMENT_FIELDS))
+
+
+def compare(baseline: dict[str, Any], report: dict[str, Any], tolerance: float):
+    "-> entries slower than baseline by more than tolerance (0.2 = 20%)"
+
+    baseline_results = {result_key(entry): entry for entry in baseline["results"]}
+    regressions: list[dict[str, Any]] = []
+    for entry in report["results"]:
+        old = baseline_results.get(result_key(entry))
+        if old is None:
+            continue
+        ratio = entry["ops_per_second"] / old["ops_per_second"]
+        entry["baseline_ratio"] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(entry)
+    return regressions
+
+
+def run_benchmarks(description: str, benchmarks: dict[str, Callable[[float], list[dict[str, Any]]]], **report_fields: Any):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--min-time", type=float, default=0.5, help="minimum seconds per measurement")
+    parser.add_argument("--only", choices=sorted(benchmarks), action="append", help="run only these groups")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against baseline")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        **report_fields,
+        "started_at": int(time.time()),
+        "results": [entry for name in (args.only or benchmarks) for entry in benchmarks[name](args.min_time)],
+    }
+
+    regressions: list[dict[str, Any]] = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if regressions:
+        sys.exit(1)
@@ -1,63 +1,200 @@
-import socket
+import bisect
+import heapq
+from typing import Iterable, Iterator
+from lspnetd.common.resolver import endpoint_resolver
+
+
+MIN_PORT = 0
+MAX_PORT = 65535
+# iptables multiport accepts up to 15 ports per rule, a range uses two of them
+MULTIPORT_LIMIT = 15
+
+
+class PortSet:
+    """
+    Immutable set of ports stored as sorted, disjoint, non-adjacent (begin, end) ranges.
+    Set operations, parsing and formatting are O(number of ranges), never O(number of ports).
+    """
+
+    __slots__ = ("segments",)
+
+    def __init__(self, segments: Iterable[tuple[int, int]] = ()):
+        self.segments: tuple[tuple[int, int], ...] = self._normalize(segments)
+
+    @staticmethod
+    def _normalize(segments: Iterable[tuple[int, int]]):
+        merged: list[tuple[int, int]] = []
+        for begin_port, end_port in sorted((int(begin), int(end)) for begin, end in segments):
+            if begin_port > end_port or begin_port < MIN_PORT or end_port > MAX_PORT:
+                raise ValueError("invalid port range: {}-{}".format(begin_port, end_port))
+            if merged and begin_port <= merged[-1][1] + 1:
+                if end_port > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end_port)
+            else:
+                merged.append((begin_port, end_port))
+        return tuple(merged)
+
+    @classmethod
+    def _from_normalized(cls, segments: list[tuple[int, int]]):
+        port_set = cls.__new__(cls)
+        port_set.segments = tuple(segments)
+        return port_set
+
+    @classmethod
+    def from_ports(cls, ports: Iterable[int]):
+        return cls((port, port) for port in ports)
+
+    @classmethod
+    def parse(cls, port_expr: str):
+        "'10-13,20' -> PortSet. iptables style '10:13' ranges are accepted too."
+
+        segments: list[tuple[int, int]] = []
+        for s in port_expr.split(','):
+            s = s.strip()
+            if not s:
+                continue
+            sep = '-' if '-' in s else ':'
+            if sep in s:
+                begin_port, end_port = s.split(sep)
+                segments.append((int(begin_port), int(end_port)))
+            else:
+                segments.append((int(s), int(s)))
+        return cls(segments)
+
+    def format(self, range_sep: str = '-'):
+        "PortSet -> '10-13,20'"
+
+        return ','.join('{}{}{}'.format(begin_port, range_sep, end_port) if end_port != begin_port else str(begin_port)
+                        for begin_port, end_port in self.segments)
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return "PortSet({!r})".format(self.format())
+
+    def __len__(self):
+        return sum(end_port - begin_port + 1 for begin_port, end_port in self.segments)
+
+    def __bool__(self):
+        return bool(self.segments)
+
+    def __iter__(self) -> Iterator[int]:
+        for begin_port, end_port in self.segments:
+            yield from range(begin_port, end_port + 1)
+
+    def __eq__(self, other: object):
+        if not isinstance(other, PortSet):
+            return NotImplemented
+        return self.segments == other.segments
+
+    def __hash__(self):
+        return hash(self.segments)
+
+    def __contains__(self, port: object):
+        if not isinstance(port, int):
+            return False
+        i = bisect.bisect_right(self.segments, (port, MAX_PORT + 1)) - 1
+        return i >= 0 and self.segments[i][0] <= port <= self.segments[i][1]
+
+    def union(self, other: "PortSet"):
+        # both inputs are sorted, a merge of the two lists is already sorted
+        merged: list[tuple[int, int]] = []
+        for begin_port, end_port in heapq.merge(self.segments, other.segments):
+            if merged and begin_port <= merged[-1][1] + 1:
+                if end_port > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], end_port)
+            else:
+                merged.append((begin_port, end_port))
+        return PortSet._from_normalized(merged)
+
+    def intersection(self, other: "PortSet"):
+        result: list[tuple[int, int]] = []
+        a, b = self.segments, other.segments
+        i = j = 0
+        while i < len(a) and j < len(b):
+            begin_port = max(a[i][0], b[j][0])
+            end_port = min(a[i][1], b[j][1])
+            if begin_port <= end_port:
+                result.append((begin_port, end_port))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return PortSet._from_normalized(result)
+
+    def difference(self, other: "PortSet"):
+        result: list[tuple[int, int]] = []
+        b = other.segments
+        j = 0
+        for begin_port, end_port in self.segments:
+            while j < len(b) and b[j][1] < begin_port:
+                j += 1
+            k = j
+            while k < len(b) and b[k][0] <= end_port:
+                if b[k][0] > begin_port:
+                    result.append((begin_port, b[k][0] - 1))
+                begin_port = b[k][1] + 1
+                k += 1
+            if begin_port <= end_port:
+                result.append((begin_port, end_port))
+        return PortSet._from_normalized(result)
+
+    def issubset(self, other: "PortSet"):
+        return not self.difference(other)
+
+    def issuperset(self, other: "PortSet"):
+        return other.issubset(self)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __le__ = issubset
+    __ge__ = issuperset
+
+    def multiport_chunks(self, limit: int = MULTIPORT_LIMIT):
+        "port lists for `-m multiport --dports`, each using at most `limit` slots (a range takes two)"
+
+        chunks: list[str] = []
+        current: list[str] = []
+        used = 0
+        for begin_port, end_port in self.segments:
+            cost = 1 if begin_port == end_port else 2
+            if used + cost > limit:
+                chunks.append(','.join(current))
+                current = []
+                used = 0
+            current.append(str(begin_port) if begin_port == end_port else '{}:{}'.format(begin_port, end_port))
+            used += cost
+        if current:
+            chunks.append(','.join(current))
+        return chunks
+
+    def iptables_match_args(self, direction: str = "dport"):
+        "one argument list per rule needed to match these ports, e.g. [['--dport', '80']] or [['-m', 'multiport', '--dports', '80,443,8000:8100']]"
+
+        if len(self.segments) == 1:
+            begin_port, end_port = self.segments[0]
+            return [["--{}".format(direction), str(begin_port) if begin_port == end_port else '{}:{}'.format(begin_port, end_port)]]
+        return [["-m", "multiport", "--{}s".format(direction), chunk] for chunk in self.multiport_chunks()]
 
 
 def ports_to_segments(ports: list[int]):
     "[10,11,12,13,20] -> [(10,13), (20,20)]"
-    
-    sorted_ports = sorted(set([int(x) for x in ports]))
-    segs: list[tuple[int, int]] = []
-    
-    begin_port = 0
-    end_port = 0
-    for port in sorted_ports:
-        if not begin_port:
-            begin_port = port
-            end_port = port
-            continue
-        
-        if port - end_port > 1:
-            # not-continuous
-            segs.append((begin_port, end_port))
-            begin_port = port
-            end_port = port
-            continue
-
-        # continous
-        end_port = port
-
-    if begin_port:
-        segs.append((begin_port, end_port))
-
-    return segs
+
+    return list(PortSet.from_ports(ports).segments)
 
 
 def port_segments_to_expression(segments: list[tuple[int, int]]):
     "[(10,13), (20,20)] -> '10-13,20'"
-    
-    output: list[str] = []
-    for seg in segments:
-        begin_port, end_port = seg
-        if end_port != begin_port:
-            output.append('{}-{}'.format(begin_port, end_port))
-        else:
-            output.append('{}'.format(begin_port))
-    
-    return ','.join(output)
+
+    return PortSet(segments).format()
 
 
 def parse_ports_expression(port_expr: str):
-    "10-13,20 -> [10,11,12,13,20]"
-    
-    parts = [s for s in port_expr.split(',') if s]
-    all_ports: set[int] = set()
-    for s in parts:
-        if '-' in s:
-            begin_port, end_port = s.split('-')
-            all_ports.update(range(int(begin_port), int(end_port)+1))
-        else:
-            all_ports.add(int(s))
+    "10-13,20 -> [10,11,12,13,20]. Use PortSet.parse to keep ranges as ranges."
 
-    return list(all_ports)
+    return list(PortSet.parse(port_expr))
 
 
 def parse_endpoint_expression(endpoint_expr: str):
@@ -70,10 +207,10 @@ def parse_endpoint_expression(endpoint_expr: str):
             return parts[0][1:], '', 0
 
         assert len(parts) == 2, "Invalid hostport format, detected invalid [ipv6]:<port-expression>"
-        return parts[0][1:], parts[0][1:], parse_ports_expression(parts[1])
+        return parts[0][1:], parts[0][1:], parse_ports_expression(parts[1].lstrip(':'))
     
     parts = endpoint_expr.split(':')
-    real_host = socket.gethostbyname(parts[0])
+    real_host = endpoint_resolver.resolve(parts[0])
     if len(parts) < 2:
         return parts[0], real_host, 0
 
@@ -0,0 +1,152 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from lspnetd.common import utils
+from lspnetd.common.logger import get_logger
+
+
+logger = get_logger("nsworker")
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nsworker_main.py")
+
+
+class NamespaceWorker:
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.process = subprocess.Popen(utils.sudo_wrap([sys.executable, WORKER_SCRIPT, namespace]),
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding='utf-8', bufsize=1)
+
+        ready = self._read()
+        if not ready.get("ready"):
+            self.close()
+            raise RuntimeError("failed to start worker for namespace {}: {}".format(namespace, ready.get("error")))
+
+    def _read(self) -> dict:
+        assert self.process.stdout is not None
+        line = self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("worker for namespace {} exited unexpectedly".format(self.namespace))
+        return json.loads(line)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, args: list[str], input: str | None = None):
+        assert self.process.stdin is not None
+        with self.lock:
+            self.process.stdin.write(json.dumps({"args": args, "input": input}) + "\n")
+            self.process.stdin.flush()
+            response = self._read()
+            self.last_used = time.monotonic()
+
+        return subprocess.CompletedProcess(args, response["returncode"], response["stdout"], response["stderr"])
+
+    def close(self):
+        if self.process.stdin:
+            self.process.stdin.close()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class NamespaceWorkerPool:
+    def __init__(self, idle_timeout: float = 60):
+        self.idle_timeout = idle_timeout
+        self.workers: dict[str, NamespaceWorker] = {}
+        # namespace -> worker being started. other callers for the namespace wait on it, other namespaces don't
+        self.starting: dict[str, Future[NamespaceWorker]] = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.reaper = threading.Thread(target=self._reap_loop, daemon=True)
+        self.reaper.start()
+
+    def get(self, namespace: str):
+        dead = None
+        with self.lock:
+            worker = self.workers.get(namespace)
+            if worker is not None and worker.alive():
+                # keep the reaper away until the command is sent
+                worker.last_used = time.monotonic()
+                return worker
+
+            future = self.starting.get(namespace)
+            if future is None:
+                future = self.starting[namespace] = Future()
+                dead = self.workers.pop(namespace, None)
+                starter = True
+            else:
+                starter = False
+
+        if not starter:
+            return future.result()
+
+        if dead is not None:
+            logger.info('worker for namespace {} exited, replacing it'.format(namespace))
+            dead.close()
+
+        # the worker blocks until it is ready, start it without holding the pool lock
+        logger.info('starting worker for namespace {}'.format(namespace))
+        try:
+            worker = NamespaceWorker(namespace)
+        except BaseException as e:
+            with self.lock:
+                del self.starting[namespace]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.starting[namespace]
+            self.workers[namespace] = worker
+        future.set_result(worker)
+        return worker
+
+    def run(self, namespace: str, args: list[str], input: str | None = None):
+        p = self.get(namespace).run(args, input)
+        if p.returncode != 0:
+            raise subprocess.CalledProcessError(p.returncode, ["ip", "netns", "exec", namespace] + args, p.stdout, p.stderr)
+        return p
+
+    def reap_idle(self):
+        now = time.monotonic()
+        with self.lock:
+            idle = [ns for ns, worker in self.workers.items() if not worker.alive() or (now - worker.last_used > self.idle_timeout and not worker.lock.locked())]
+            reaped = [self.workers.pop(ns) for ns in idle]
+
+        for worker in reaped:
+            logger.info('stopping idle worker for namespace {}'.format(worker.namespace))
+            worker.close()
+
+    def _reap_loop(self):
+        while not self.stopped.wait(max(self.idle_timeout / 2, 1)):
+            self.reap_idle()
+
+    def close(self):
+        self.stopped.set()
+        with self.lock:
+            workers = list(self.workers.values())
+            self.workers = {}
+        for worker in workers:
+            worker.close()
+
+
+def enable_ns_workers(idle_timeout: float = 60):
+    "route `ip netns exec <ns> ...` commands issued through sudo_call* to persistent per-namespace workers."
+
+    if utils.ns_worker_pool is None:
+        utils.ns_worker_pool = NamespaceWorkerPool(idle_timeout)
+    return utils.ns_worker_pool
+
+
+def disable_ns_workers():
+    pool = utils.ns_worker_pool
+    utils.ns_worker_pool = None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,47 @@
+# Namespace worker process. Started (as root) by lspnetd.common.nsworker with the namespace name as argv[1].
+# This file is executed as a script, so it must only depend on the standard library.
+#
+# Protocol: one JSON object per line on stdin {"args": [...], "input": str | null},
+# one JSON object per line on stdout {"returncode": int, "stdout": str, "stderr": str}.
+# The first line written after startup is {"ready": true} or {"ready": false, "error": str}.
+#
+# Unlike `ip netns exec`, only the network namespace is switched. /etc/netns/<ns> bind mounts and
+# a namespace-private /sys are not set up, which is fine for ip/wg/iptables.
+import json
+import os
+import subprocess
+import sys
+
+
+def reply(obj: dict):
+    sys.stdout.write(json.dumps(obj) + "\n")
+    sys.stdout.flush()
+
+
+def main():
+    namespace = sys.argv[1]
+
+    try:
+        netns_path = f"/run/netns/{namespace}" if os.path.exists(f"/run/netns/{namespace}") else f"/var/run/netns/{namespace}"
+        with open(netns_path, "rb") as f:
+            os.setns(f.fileno(), os.CLONE_NEWNET)
+    except OSError as e:
+        reply({"ready": False, "error": str(e)})
+        return
+
+    reply({"ready": True})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        request = json.loads(line)
+        try:
+            p = subprocess.run(request["args"], input=request.get("input"), stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding='utf-8')
+            reply({"returncode": p.returncode, "stdout": p.stdout, "stderr": p.stderr})
+        except OSError as e:
+            reply({"returncode": 127, "stdout": "", "stderr": str(e)})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import ipaddress
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, TypeVar
+
+
+K = TypeVar("K")
+
+
+def getaddrinfo_resolve(host: str) -> list[str]:
+    "A and AAAA records of host, in resolver order, duplicates removed"
+
+    addresses: list[str] = []
+    for _, _, _, _, sockaddr in socket.getaddrinfo(host, None, type=socket.SOCK_DGRAM):
+        address = str(sockaddr[0])
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+@dataclass
+class ResolverCacheEntry:
+    addresses: list[str]
+    # set for negative entries
+    error: str
+    expire_at: float
+
+
+class EndpointResolver:
+    """
+    Host name -> address cache in front of getaddrinfo, with separate TTLs for answers and failures.
+    IPv4 addresses are preferred (like the gethostbyname calls this replaces), IPv6 is used when there is no A record.
+    `resolve_func` (host -> list of addresses, raising OSError on failure) can be swapped out, e.g. for tests.
+    """
+
+    def __init__(self, ttl: float = 300, negative_ttl: float = 30, max_workers: int = 8,
+                 resolve_func: Callable[[str], list[str]] = getaddrinfo_resolve, prefer_ipv4: bool = True, last_seen_ttl: float = 3600):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        self.resolve_func = resolve_func
+        self.prefer_ipv4 = prefer_ipv4
+        self.cache: dict[str, ResolverCacheEntry] = {}
+        self.lock = threading.Lock()
+        # refresh() key -> (address reported last time, when). keys not refreshed for last_seen_ttl are forgotten
+        self.last_seen: dict[object, tuple[str | None, float]] = {}
+        self.last_seen_ttl = last_seen_ttl
+
+    def _lookup(self, host: str):
+        try:
+            addresses = self.resolve_func(host)
+            if not addresses:
+                raise socket.gaierror(socket.EAI_NONAME, "no address for {}".format(host))
+            if self.prefer_ipv4:
+                # stable sort keeps resolver order inside each family
+                addresses = sorted(addresses, key=lambda address: ':' in address)
+            entry = ResolverCacheEntry(addresses, '', time.monotonic() + self.ttl)
+        except OSError as e:
+            entry = ResolverCacheEntry([], e.strerror or str(e) or type(e).__name__, time.monotonic() + self.negative_ttl)
+
+        with self.lock:
+            self.cache[host.lower()] = entry
+        return entry
+
+    def _cached(self, host: str):
+        with self.lock:
+            entry = self.cache.get(host.lower())
+        if entry is not None and entry.expire_at > time.monotonic():
+            return entry
+        return None
+
+    def resolve_all(self, host: str, refresh: bool = False) -> list[str]:
+        "every address of host, preferred first. Raises socket.gaierror, also for cached failures."
+
+        try:
+            return [str(ipaddress.ip_address(host))]
+        except ValueError:
+            pass
+
+        entry = None if refresh else self._cached(host)
+        if entry is None:
+            entry = self._lookup(host)
+        if entry.error:
+            raise socket.gaierror(socket.EAI_NONAME, entry.error)
+        return list(entry.addresses)
+
+    def resolve(self, host: str, refresh: bool = False) -> str:
+        return self.resolve_all(host, refresh)[0]
+
+    def resolve_many(self, hosts: Iterable[str], refresh: bool = False) -> dict[str, str | None]:
+        "resolve hosts concurrently. host -> preferred address, None if it does not resolve."
+
+        results: dict[str, str | None] = {}
+        pending: list[str] = []
+        for host in dict.fromkeys(hosts):
+            try:
+                results[host] = str(ipaddress.ip_address(host))
+                continue
+            except ValueError:
+                pass
+
+            entry = None if refresh else self._cached(host)
+            if entry is None:
+                pending.append(host)
+            else:
+                results[host] = entry.addresses[0] if not entry.error else None
+
+        if len(pending) == 1:
+            entry = self._lookup(pending[0])
+            results[pending[0]] = entry.addresses[0] if not entry.error else None
+        elif pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending)), thread_name_prefix="resolver") as executor:
+                for host, entry in zip(pending, executor.map(self._lookup, pending)):
+                    results[host] = entry.addresses[0] if not entry.error else None
+
+        return results
+
+    def refresh(self, hosts: dict[K, str]) -> dict[K, str | None]:
+        """
+        Re-resolve every host, bypassing the cache, and return only the keys whose address differs
+        from the one reported by the previous refresh (None: no longer resolves). The first call reports everything.
+        """
+
+        changed = self.refresh_changes(hosts)
+        self.commit_changes(changed)
+        return changed
+
+    def refresh_changes(self, hosts: dict[K, str]) -> dict[K, str | None]:
+        "like refresh(), but changed keys are reported again until commit_changes() records them, e.g. once they are applied"
+
+        addresses = self.resolve_many(hosts.values(), refresh=True)
+        changed: dict[K, str | None] = {}
+        now = time.monotonic()
+        with self.lock:
+            for key, host in hosts.items():
+                address = addresses[host]
+                if key not in self.last_seen or self.last_seen[key][0] != address:
+                    changed[key] = address
+                else:
+                    self.last_seen[key] = (address, now)
+        return changed
+
+    def commit_changes(self, changes: dict[K, str | None]):
+        now = time.monotonic()
+        with self.lock:
+            for key, address in changes.items():
+                self.last_seen[key] = (address, now)
+            self._prune(now)
+
+    def _prune(self, now: float):
+        # caller holds the lock
+        for host in [host for host, entry in self.cache.items() if entry.expire_at <= now]:
+            del self.cache[host]
+        for key in [key for key, (_, seen_at) in self.last_seen.items() if seen_at + self.last_seen_ttl <= now]:
+            del self.last_seen[key]
+
+    def invalidate(self, host: str | None = None):
+        with self.lock:
+            if host is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(host.lower(), None)
+
+
+endpoint_resolver = EndpointResolver()
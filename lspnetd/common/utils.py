@@ -1,11 +1,19 @@
 import os
-import socket
 import subprocess
+import sys
+from typing import TYPE_CHECKING
 from lspnetd.common.logger import get_logger
+from lspnetd.common.resolver import endpoint_resolver
+
+if TYPE_CHECKING:
+    from lspnetd.common.nsworker import NamespaceWorkerPool
 
 
 logger = get_logger("utils")
 
+# set by lspnetd.common.nsworker.enable_ns_workers
+ns_worker_pool: "NamespaceWorkerPool | None" = None
+
 
 def ns_wrap(namespace: str, args: list[str]):
     if namespace:
@@ -20,15 +28,69 @@ def sudo_wrap(args: list[str]):
     return args
 
 
+def ns_unwrap(args: list[str]):
+    "reverse of ns_wrap: -> namespace, args"
+
+    if len(args) > 4 and args[:3] == ["ip", "netns", "exec"]:
+        return args[3], args[4:]
+    return '', args
+
+
 def sudo_call(args: list[str]):
+    namespace, ns_args = ns_unwrap(args)
+    if namespace and ns_worker_pool is not None:
+        p = ns_worker_pool.run(namespace, ns_args)
+        sys.stdout.write(p.stdout)
+        sys.stderr.write(p.stderr)
+        return 0
+
     return subprocess.check_call(sudo_wrap(args))
 
 
 def sudo_call_output(args: list[str]):
+    namespace, ns_args = ns_unwrap(args)
+    if namespace and ns_worker_pool is not None:
+        return ns_worker_pool.run(namespace, ns_args).stdout
+
     return subprocess.check_output(sudo_wrap(args), encoding='utf-8')
 
 
-def hostport_resolve(name: str):
+def sudo_call_input(args: list[str], input: str):
+    namespace, ns_args = ns_unwrap(args)
+    if namespace and ns_worker_pool is not None:
+        return ns_worker_pool.run(namespace, ns_args, input)
+
+    return subprocess.run(sudo_wrap(args), input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, encoding='utf-8')
+
+
+def sudo_iter_lines(args: list[str]):
+    "yield stdout lines (without trailing newline) as the command produces them"
+
+    namespace, ns_args = ns_unwrap(args)
+    if namespace and ns_worker_pool is not None:
+        # workers reply with the complete output
+        yield from ns_worker_pool.run(namespace, ns_args).stdout.splitlines()
+        return
+
+    p = subprocess.Popen(sudo_wrap(args), stdout=subprocess.PIPE, encoding='utf-8')
+    assert p.stdout is not None
+    try:
+        for line in p.stdout:
+            yield line.rstrip('\n')
+    finally:
+        p.stdout.close()
+        if p.poll() is None:
+            # consumer stopped early
+            p.terminate()
+        returncode = p.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, args)
+
+
+def split_hostport(name: str):
+    "host:port, [ipv6]:port or host -> (host, port), port 0 if missing"
+
     if "[" in name and "]" in name:
         # [ipv6]:port
         parts = name.split(']')
@@ -36,17 +98,19 @@ def hostport_resolve(name: str):
             return parts[0][1:], 0
 
         assert len(parts) == 2, "Invalid hostport format, detected invalid [ipv6]:port"
-        return parts[0][1:], int(parts[1])
+        return parts[0][1:], int(parts[1].lstrip(":") or 0)
 
     parts = name.split(':')
     if len(parts) < 2:
-        real_host = socket.gethostbyname(parts[0])
-        return real_host, 0
-    
+        return parts[0], 0
+
     assert(len(parts) == 2), "Invalid hostport format, detected invalid host:port or ipv4:port"
-    
-    real_host = socket.gethostbyname(parts[0])
-    return real_host, int(parts[1])
+    return parts[0], int(parts[1])
+
+
+def hostport_resolve(name: str):
+    host, port = split_hostport(name)
+    return endpoint_resolver.resolve(host), port
 
 
 def human_readable_bytes(b: int):
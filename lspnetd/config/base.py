@@ -1,27 +1,120 @@
 import sqlite3
+import threading
+import weakref
 from contextlib import contextmanager
+from functools import lru_cache
 import sys
-from typing import Any, Sequence, Optional
+from typing import Any, Iterable, Iterator, Sequence, Optional
+
+
+SYNCHRONOUS_LEVELS = ("off", "normal", "full", "extra")
+
+
+@lru_cache(maxsize=256)
+def _build_insert_sql(verb: str, table_name: str, table_struct: tuple[str, ...], conflict: str) -> str:
+    # same (table, columns) always maps to the same string, so sqlite3's per-connection statement cache hits too
+    return "{} into {}({}) values ({}){}".format(verb, table_name, ','.join(table_struct), ','.join(["?"] * len(table_struct)), conflict)
+
+
+@lru_cache(maxsize=256)
+def _build_upsert_conflict(table_struct: tuple[str, ...], conflict_fields: tuple[str, ...]) -> str:
+    updates = [k for k in table_struct if k not in conflict_fields]
+    if not updates:
+        return " on conflict({}) do nothing".format(','.join(conflict_fields))
+    return " on conflict({}) do update set {}".format(','.join(conflict_fields), ','.join("{0}=excluded.{0}".format(k) for k in updates))
+
+
+class _ThreadConnection:
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+
+def _release_connection(connections: list[sqlite3.Connection], lock: threading.Lock, conn: sqlite3.Connection):
+    # runs when the owning thread's locals are dropped, i.e. the thread exited
+    with lock:
+        if conn in connections:
+            connections.remove(conn)
+    conn.close()
+
 
 class BaseSQLiteDB:
-    def __init__(self, filename: str, debug: bool=False) -> None:
+    def __init__(self, filename: str, debug: bool=False, *, wal: bool=True, synchronous: str="normal", busy_timeout: float=5.0) -> None:
+        if synchronous.lower() not in SYNCHRONOUS_LEVELS:
+            raise ValueError("invalid synchronous level: {}".format(synchronous))
+
+        self._filename = filename
+        self._debug = debug
+        self._wal = wal
+        self._synchronous = synchronous.lower()
+        self._busy_timeout = busy_timeout
+
+        # every thread gets its own connection, so concurrent workers don't share one cursor or one transaction.
+        # in-memory databases are private to their connection, those keep a single shared one.
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._shared_conn = self._connect() if filename == ':memory:' else None
+
+    def _connect(self):
         # python 3.12 adds autocommit= parameter. before that we need to use isolation_level.
         # we just tell python to stop messing with transactions, and "leave the underlying SQLite library in autocommit mode"
 
         if sys.version_info >= (3, 12):
-            self.conn = sqlite3.connect(filename, autocommit=True, isolation_level=None)
+            conn = sqlite3.connect(self._filename, timeout=self._busy_timeout, check_same_thread=False, cached_statements=256, autocommit=True, isolation_level=None)
         else:
-            self.conn = sqlite3.connect(filename, isolation_level=None)
+            conn = sqlite3.connect(self._filename, timeout=self._busy_timeout, check_same_thread=False, cached_statements=256, isolation_level=None)
+
+        conn.row_factory = sqlite3.Row
+        if self._wal and self._filename != ':memory:':
+            # readers don't block the writer and commits only append to the log
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous={}".format(self._synchronous))
+
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._shared_conn is not None:
+            return self._shared_conn
+
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            holder = _ThreadConnection(self._connect())
+            # the finalizer must not reference the database, or a live thread would keep it alive
+            weakref.finalize(holder, _release_connection, self._connections, self._connections_lock, holder.conn)
+            self._local.holder = holder
+        return holder.conn
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None or cursor.connection is not self.conn:
+            cursor = self.conn.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+        self._shared_conn = None
 
-        self.conn.row_factory = sqlite3.Row
-        self.cursor = self.conn.cursor()
-        self._debug = debug
-    
     def _wrap_execute(self, sql: str, params: Sequence[Any] = ()):
         if self._debug:
             print(sql, params)
         self.cursor.execute(sql, params)
 
+    def _wrap_executemany(self, sql: str, params_list: Iterable[Sequence[Any]]):
+        if self._debug:
+            print(sql, "(many)")
+        self.cursor.executemany(sql, params_list)
+
     def __enter__(self):
         if self.conn.in_transaction:
             raise RuntimeError('nested with statement is not allowed')
@@ -83,6 +176,15 @@ class BaseSQLiteDB:
             # inner with statement
             yield self
 
+    @contextmanager
+    def _inner_enter_immediate(self):
+        if not self.conn.in_transaction:
+            # writers take the lock up front instead of upgrading a read lock halfway through
+            with self.immediate():
+                yield self
+        else:
+            yield self
+
     # sqlite3.Row supports indexing via idx or key.
     # To convert it to pure dict, use dict(row).
     def query(self, sql: str, params: Sequence[Any] = ()) -> list[sqlite3.Row]:
@@ -95,23 +197,66 @@ class BaseSQLiteDB:
             self._wrap_execute(sql, params)
             return self.cursor.fetchone()
 
+    def iter_query(self, sql: str, params: Sequence[Any] = (), batch_size: int = 256) -> Iterator[sqlite3.Row]:
+        "yield rows as they are read instead of building the whole list. uses its own cursor, other queries may run in between."
+
+        if self._debug:
+            print(sql, params)
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            cursor.close()
+
     def execute(self, sql: str, params: Sequence[Any] = ()) -> int:
         with self._inner_enter():
             self._wrap_execute(sql, params)
             return self.cursor.rowcount
 
+    def executemany(self, sql: str, params_list: Iterable[Sequence[Any]]) -> int:
+        with self._inner_enter_immediate():
+            self._wrap_executemany(sql, params_list)
+            return self.cursor.rowcount
+
     def insert_into(self, table_name: str, sql_fields: dict[str, Any], *, ignore: bool=False):
-        table_struct = sorted(sql_fields.keys())
-        sql = "insert into {}({}) values ({})".format(table_name, ','.join(table_struct), ','.join(["?"] * len(table_struct)))
-        if ignore:
-            # insert or ignore will not raise error even if constraints are violated. Use on conflict instead.
-            sql += " on conflict do nothing"
+        table_struct = tuple(sorted(sql_fields.keys()))
+        # insert or ignore will not raise error even if constraints are violated. Use on conflict instead.
+        sql = _build_insert_sql("insert", table_name, table_struct, " on conflict do nothing" if ignore else "")
         return self.execute(sql, [sql_fields[k] for k in table_struct])
 
     def replace_into(self, table_name: str, sql_fields: dict[str, Any]):
-        table_struct = sorted(sql_fields.keys())
-        return self.execute("replace into {}({}) values ({})".format(
-            table_name,
-            ','.join(table_struct),
-            ','.join(["?"] * len(table_struct))
-        ), [sql_fields[k] for k in table_struct])
+        table_struct = tuple(sorted(sql_fields.keys()))
+        return self.execute(_build_insert_sql("replace", table_name, table_struct, ""), [sql_fields[k] for k in table_struct])
+
+    def _write_many(self, table_name: str, rows: Iterable[dict[str, Any]], conflict_fields: tuple[str, ...] | None, ignore: bool):
+        # rows are grouped by column set, each group is one executemany. everything runs in one transaction.
+        total = 0
+        with self._inner_enter_immediate():
+            groups: dict[tuple[str, ...], list[list[Any]]] = {}
+            for row in rows:
+                table_struct = tuple(sorted(row.keys()))
+                groups.setdefault(table_struct, []).append([row[k] for k in table_struct])
+
+            for table_struct, params_list in groups.items():
+                if conflict_fields is not None:
+                    conflict = _build_upsert_conflict(table_struct, conflict_fields)
+                elif ignore:
+                    conflict = " on conflict do nothing"
+                else:
+                    conflict = ""
+                self._wrap_executemany(_build_insert_sql("insert", table_name, table_struct, conflict), params_list)
+                total += self.cursor.rowcount
+        return total
+
+    def insert_many(self, table_name: str, rows: Iterable[dict[str, Any]], *, ignore: bool=False) -> int:
+        return self._write_many(table_name, rows, None, ignore)
+
+    def upsert_many(self, table_name: str, rows: Iterable[dict[str, Any]], conflict_fields: Sequence[str]) -> int:
+        "insert rows, updating the other columns of rows that conflict on conflict_fields (a primary key or unique index)"
+
+        return self._write_many(table_name, rows, tuple(conflict_fields), False)
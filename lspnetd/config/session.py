@@ -0,0 +1,48 @@
+import os
+import time
+from typing import Any
+from lspnetd.config.base import BaseSQLiteDB
+
+
+class SecureSessionStore(BaseSQLiteDB):
+    "persisted SecureChannelHTTPClient state, so a restart can resume the session instead of doing a new handshake"
+
+    def __init__(self, filename: str, debug: bool = False, **kwargs: Any) -> None:
+        if filename != ':memory:':
+            # session state contains the shared secret. create the file owner-only before sqlite opens it,
+            # journal files inherit these permissions.
+            fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+            os.close(fd)
+            os.chmod(filename, 0o600)
+
+        super().__init__(filename, debug, **kwargs)
+        self.execute("""create table if not exists secure_sessions (
+            name text not null,
+            domain text not null,
+            state blob not null,
+            expire_at integer not null,
+            updated_at integer not null,
+            primary key (name, domain)
+        )""")
+
+    def load(self, name: str, domain: str, min_ttl: int = 60) -> bytes | None:
+        "state of a session that is still valid for at least min_ttl seconds"
+
+        row = self.queryone("select state from secure_sessions where name=? and domain=? and expire_at>?", [name, domain, int(time.time()) + min_ttl])
+        return bytes(row["state"]) if row else None
+
+    def save(self, name: str, domain: str, state: bytes, expire_at: int):
+        # single statement, committed atomically
+        self.replace_into("secure_sessions", {
+            "name": name,
+            "domain": domain,
+            "state": state,
+            "expire_at": expire_at,
+            "updated_at": int(time.time()),
+        })
+
+    def delete(self, name: str, domain: str):
+        self.execute("delete from secure_sessions where name=? and domain=?", [name, domain])
+
+    def purge_expired(self):
+        return self.execute("delete from secure_sessions where expire_at<=?", [int(time.time())])
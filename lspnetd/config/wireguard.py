@@ -0,0 +1,167 @@
+from dataclasses import dataclass, field
+from typing import Any
+from lspnetd.config.base import BaseSQLiteDB
+from lspnetd.models.config import WireGuardKeySchema, WireGuardPeerSchema
+
+
+KEY_FIELDS = tuple(WireGuardKeySchema.model_fields)
+PEER_FIELDS = tuple(WireGuardPeerSchema.model_fields)
+
+
+def _change_triggers(table: str, kind: str, fields: tuple[str, ...]):
+    # every write to `table` appends to wireguard_changes. updates that change nothing are not logged,
+    # so re-saving the same config does not wake up readers.
+    changed = " or ".join("old.{0} is not new.{0}".format(f) for f in fields)
+    return [
+        """create trigger if not exists {0}_insert after insert on {0} begin
+            insert into wireguard_changes(kind, namespace, name) values ('{1}', new.namespace, new.name);
+        end""".format(table, kind),
+        """create trigger if not exists {0}_update after update on {0} when {2} begin
+            insert into wireguard_changes(kind, namespace, name) values ('{1}', old.namespace, old.name);
+            insert into wireguard_changes(kind, namespace, name) select '{1}', new.namespace, new.name
+                where old.namespace is not new.namespace or old.name is not new.name;
+        end""".format(table, kind, changed),
+        """create trigger if not exists {0}_delete after delete on {0} begin
+            insert into wireguard_changes(kind, namespace, name) values ('{1}', old.namespace, old.name);
+        end""".format(table, kind),
+    ]
+
+
+@dataclass
+class WireGuardPeerChanges:
+    # pass this to the next peers_changed_since call
+    version: int
+    updated: list[WireGuardPeerSchema] = field(default_factory=list)
+    # (namespace, name) of removed peers
+    deleted: list[tuple[str, str]] = field(default_factory=list)
+    # updated holds every peer and deleted is empty: the log no longer reaches back to the requested version
+    # (or it was 0), peers the caller knows that are not in updated are gone
+    full: bool = False
+
+
+class WireGuardConfigStore(BaseSQLiteDB):
+    "WireGuard keys and peers, with a change log so readers only look at what changed since their last pass"
+
+    def __init__(self, filename: str, debug: bool = False, **kwargs: Any) -> None:
+        super().__init__(filename, debug, **kwargs)
+        with self.immediate():
+            self.execute("""create table if not exists wireguard_keys (
+                namespace text not null,
+                name text not null,
+                public_key text not null,
+                private_key text not null,
+                primary key (namespace, name)
+            )""")
+            self.execute("create index if not exists wireguard_keys_public_key on wireguard_keys(public_key)")
+
+            self.execute("""create table if not exists wireguard_peers (
+                namespace text not null,
+                name text not null,
+                public_key text not null,
+                is_static_key integer not null default 0,
+                endpoint text not null default '',
+                is_static_endpoint integer not null default 0,
+                primary key (namespace, name)
+            )""")
+            self.execute("create index if not exists wireguard_peers_public_key on wireguard_peers(public_key)")
+
+            # autoincrement: versions never go back or get reused, even after the newest rows are compacted away
+            self.execute("""create table if not exists wireguard_changes (
+                version integer primary key autoincrement,
+                kind text not null,
+                namespace text not null,
+                name text not null
+            )""")
+            self.execute("create index if not exists wireguard_changes_kind on wireguard_changes(kind, version)")
+            # newest version removed by compact_changes, readers behind it can't get a complete delta
+            self.execute("create table if not exists wireguard_changes_compacted (id integer primary key check (id = 0), version integer not null)")
+            self.execute("insert into wireguard_changes_compacted(id, version) values (0, 0) on conflict do nothing")
+
+            for sql in _change_triggers("wireguard_keys", "key", KEY_FIELDS) + _change_triggers("wireguard_peers", "peer", PEER_FIELDS):
+                self.execute(sql)
+
+    def current_version(self) -> int:
+        row = self.queryone("select seq from sqlite_sequence where name='wireguard_changes'")
+        return row[0] if row else 0
+
+    def compacted_version(self) -> int:
+        row = self.queryone("select version from wireguard_changes_compacted where id=0")
+        return row[0] if row else 0
+
+    def save_key(self, key: WireGuardKeySchema):
+        self.upsert_many("wireguard_keys", [key.model_dump()], ("namespace", "name"))
+
+    def save_keys(self, keys: list[WireGuardKeySchema]):
+        return self.upsert_many("wireguard_keys", (key.model_dump() for key in keys), ("namespace", "name"))
+
+    def get_key(self, namespace: str, name: str) -> WireGuardKeySchema | None:
+        row = self.queryone("select * from wireguard_keys where namespace=? and name=?", [namespace, name])
+        return WireGuardKeySchema.model_construct(**dict(row)) if row else None
+
+    def get_key_by_public_key(self, public_key: str) -> WireGuardKeySchema | None:
+        row = self.queryone("select * from wireguard_keys where public_key=?", [public_key])
+        return WireGuardKeySchema.model_construct(**dict(row)) if row else None
+
+    def delete_key(self, namespace: str, name: str):
+        return self.execute("delete from wireguard_keys where namespace=? and name=?", [namespace, name])
+
+    def load_keys(self, namespace: str | None = None) -> list[WireGuardKeySchema]:
+        # rows were validated when they were written, skip validation on the way back
+        if namespace is None:
+            rows = self.iter_query("select * from wireguard_keys")
+        else:
+            rows = self.iter_query("select * from wireguard_keys where namespace=?", [namespace])
+        return [WireGuardKeySchema.model_construct(**dict(row)) for row in rows]
+
+    def save_peer(self, peer: WireGuardPeerSchema):
+        self.upsert_many("wireguard_peers", [peer.model_dump()], ("namespace", "name"))
+
+    def save_peers(self, peers: list[WireGuardPeerSchema]):
+        return self.upsert_many("wireguard_peers", (peer.model_dump() for peer in peers), ("namespace", "name"))
+
+    def get_peer(self, namespace: str, name: str) -> WireGuardPeerSchema | None:
+        row = self.queryone("select * from wireguard_peers where namespace=? and name=?", [namespace, name])
+        return WireGuardPeerSchema.model_construct(**dict(row)) if row else None
+
+    def find_peers_by_public_key(self, public_key: str) -> list[WireGuardPeerSchema]:
+        return [WireGuardPeerSchema.model_construct(**dict(row)) for row in self.iter_query("select * from wireguard_peers where public_key=?", [public_key])]
+
+    def delete_peer(self, namespace: str, name: str):
+        return self.execute("delete from wireguard_peers where namespace=? and name=?", [namespace, name])
+
+    def load_peers(self, namespace: str | None = None) -> list[WireGuardPeerSchema]:
+        if namespace is None:
+            rows = self.iter_query("select * from wireguard_peers")
+        else:
+            rows = self.iter_query("select * from wireguard_peers where namespace=?", [namespace])
+        return [WireGuardPeerSchema.model_construct(**dict(row)) for row in rows]
+
+    def peers_changed_since(self, version: int) -> WireGuardPeerChanges:
+        "peers written or deleted after `version`. version 0, or one older than the compacted log, returns every peer with full set."
+
+        with self._inner_enter():
+            # read version and changes in one transaction, so a write in between is not missed next time
+            result = WireGuardPeerChanges(self.current_version())
+            if version <= 0 or version < self.compacted_version():
+                result.updated = self.load_peers()
+                result.full = True
+                return result
+
+            rows = self.query("""select c.namespace as change_namespace, c.name as change_name, p.*
+                from (select distinct namespace, name from wireguard_changes where kind='peer' and version>? and version<=?) c
+                left join wireguard_peers p on p.namespace=c.namespace and p.name=c.name""", [version, result.version])
+            for row in rows:
+                if row["public_key"] is None:
+                    result.deleted.append((row["change_namespace"], row["change_name"]))
+                else:
+                    result.updated.append(WireGuardPeerSchema.model_construct(**{k: row[k] for k in PEER_FIELDS}))
+            return result
+
+    def compact_changes(self, before_version: int):
+        "drop change log entries up to before_version. readers still behind it get a full reload from peers_changed_since."
+
+        with self._inner_enter_immediate():
+            # versions past the newest one don't exist yet, nothing was removed for them
+            before_version = min(before_version, self.current_version())
+            self.execute("update wireguard_changes_compacted set version=max(version, ?) where id=0", [before_version])
+            return self.execute("delete from wireguard_changes where version<=?", [before_version])
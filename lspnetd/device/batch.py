@@ -0,0 +1,130 @@
+import subprocess
+from dataclasses import dataclass, field
+from lspnetd.common.utils import sudo_call_input
+from lspnetd.device.cache import state_cache
+
+
+@dataclass
+class IPBatchOperation:
+    namespace: str
+    args: list[str]
+    # filled after flush. '' means success.
+    error: str = ''
+    executed: bool = False
+
+    def to_line(self) -> str:
+        return ' '.join(self.args)
+
+
+class IPBatchError(RuntimeError):
+    def __init__(self, failed: list[IPBatchOperation], skipped: list[IPBatchOperation]):
+        self.failed = failed
+        self.skipped = skipped
+        super().__init__("ip batch failed: {}".format('; '.join(f"[{op.namespace or 'default'}] ip {op.to_line()}: {op.error}" for op in failed)))
+
+
+@dataclass
+class IPBatch:
+    """
+    Collects `ip` operations and flushes them through one `ip [-n <ns>] -batch -` per namespace.
+    Default namespace is flushed first, other namespaces follow in the order they were first used,
+    so links created in the default namespace (and moved away) can be configured in the same flush.
+    """
+    force: bool = False
+    operations: dict[str, list[IPBatchOperation]] = field(default_factory=dict)
+
+    def add(self, namespace: str, args: list[str]):
+        self.operations.setdefault(namespace, []).append(IPBatchOperation(namespace, args))
+
+    def link_add(self, namespace: str, name: str, link_type: str, extra_args: list[str] | None = None):
+        self.add(namespace, ["link", "add", name] + (extra_args or []) + ["type", link_type])
+
+    def link_set_netns(self, namespace: str, name: str, target_namespace: str):
+        self.add(namespace, ["link", "set", "dev", name, "netns", target_namespace])
+
+    def link_set_mtu(self, namespace: str, name: str, mtu: int):
+        self.add(namespace, ["link", "set", "dev", name, "mtu", str(mtu)])
+
+    def link_set_up(self, namespace: str, name: str):
+        self.add(namespace, ["link", "set", "dev", name, "up"])
+
+    def link_set_down(self, namespace: str, name: str):
+        self.add(namespace, ["link", "set", "dev", name, "down"])
+
+    def link_delete(self, namespace: str, name: str):
+        self.add(namespace, ["link", "delete", "dev", name])
+
+    def address_add(self, namespace: str, name: str, address: str):
+        self.add(namespace, ["address", "add", "dev", name, address])
+
+    def address_delete(self, namespace: str, name: str, address: str):
+        self.add(namespace, ["address", "delete", "dev", name, address])
+
+    def __len__(self):
+        return sum(len(ops) for ops in self.operations.values())
+
+    def _flush_namespace(self, namespace: str, ops: list[IPBatchOperation]) -> bool:
+        call_args = ["ip"]
+        if namespace:
+            call_args += ["-n", namespace]
+        if self.force:
+            call_args += ["-force"]
+        call_args += ["-batch", "-"]
+
+        try:
+            sudo_call_input(call_args, ''.join(op.to_line() + '\n' for op in ops))
+            for op in ops:
+                op.executed = True
+            return True
+        except subprocess.CalledProcessError as e:
+            # ip reports each failure as "<error message>\nCommand failed -:<lineno>"
+            errors: dict[int, str] = {}
+            pending: list[str] = []
+            for line in (e.stderr or '').splitlines():
+                if line.startswith('Command failed -:'):
+                    errors[int(line.rsplit(':', 1)[1])] = ' '.join(pending)
+                    pending = []
+                elif line:
+                    pending.append(line)
+
+            # without -force ip stops at the first failed line
+            last_line = len(ops) if self.force else max(errors, default=len(ops))
+            for lineno, op in enumerate(ops, start=1):
+                op.executed = lineno <= last_line
+                op.error = errors.get(lineno, '')
+
+            if not errors:
+                # failed before reading any command (e.g. namespace does not exist)
+                for op in ops:
+                    op.executed = False
+                ops[0].error = ' '.join(pending) or str(e)
+
+            return False
+
+    def flush(self):
+        pending = sorted(self.operations.items(), key=lambda item: item[0] != '')
+        self.operations = {}
+
+        failed: list[IPBatchOperation] = []
+        skipped: list[IPBatchOperation] = []
+        for namespace, ops in pending:
+            if failed and not self.force:
+                skipped.extend(ops)
+                continue
+
+            try:
+                if not self._flush_namespace(namespace, ops):
+                    failed.extend(op for op in ops if op.error)
+                    skipped.extend(op for op in ops if not op.executed and not op.error)
+            finally:
+                state_cache.invalidate(namespace)
+                for op in ops:
+                    # links created in or moved to other namespaces
+                    for i, arg in enumerate(op.args[:-1]):
+                        if arg == "netns":
+                            state_cache.invalidate(op.args[i + 1])
+
+        if failed:
+            raise IPBatchError(failed, skipped)
+
+        return [op for _, ops in pending for op in ops]
@@ -0,0 +1,68 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from lspnetd.models.device import NetworkInterfaceState, WireGuardDeviceState
+
+
+@dataclass
+class NamespaceStateSnapshot:
+    interfaces: dict[str, NetworkInterfaceState] | None = None
+    interfaces_at: float = 0
+    wireguard: dict[str, WireGuardDeviceState] | None = None
+    wireguard_at: float = 0
+
+
+@dataclass
+class NamespaceStateCache:
+    """
+    Per-namespace interface/WireGuard state, refreshed at most once per `ttl` seconds.
+    Our own mutating helpers (create_*, destroy_interface, assign_wg_device, IPBatch.flush) invalidate it.
+    A dump stores into the snapshot it started with, so one racing an invalidate lands in a dropped snapshot.
+    """
+    ttl: float = 5.0
+    snapshots: dict[str, NamespaceStateSnapshot] = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def _snapshot(self, namespace: str):
+        with self.lock:
+            return self.snapshots.setdefault(namespace, NamespaceStateSnapshot())
+
+    def interfaces(self, namespace: str) -> dict[str, NetworkInterfaceState]:
+        from lspnetd.device.interface import dump_all_interface_state
+
+        snapshot = self._snapshot(namespace)
+        interfaces = snapshot.interfaces
+        if interfaces is None or time.monotonic() - snapshot.interfaces_at > self.ttl:
+            interfaces = {iface.name: iface for iface in dump_all_interface_state(namespace)}
+            snapshot.interfaces = interfaces
+            snapshot.interfaces_at = time.monotonic()
+        return interfaces
+
+    def interface(self, namespace: str, name: str):
+        return self.interfaces(namespace).get(name)
+
+    def wireguard_devices(self, namespace: str) -> dict[str, WireGuardDeviceState]:
+        from lspnetd.device.wireguard import dump_all_wireguard_state
+
+        snapshot = self._snapshot(namespace)
+        devices = snapshot.wireguard
+        if devices is None or time.monotonic() - snapshot.wireguard_at > self.ttl:
+            devices = {state.name: state for state in dump_all_wireguard_state(namespace)}
+            snapshot.wireguard = devices
+            snapshot.wireguard_at = time.monotonic()
+        return devices
+
+    def wireguard_device(self, namespace: str, name: str):
+        return self.wireguard_devices(namespace).get(name)
+
+    def invalidate(self, namespace: str | None = None):
+        "drop cached state of one namespace, or all namespaces if namespace is None."
+
+        with self.lock:
+            if namespace is None:
+                self.snapshots.clear()
+            else:
+                self.snapshots.pop(namespace, None)
+
+
+state_cache = NamespaceStateCache()
@@ -1,9 +1,13 @@
-from lspnetd.common.utils import sudo_call
+from lspnetd.device.batch import IPBatch
 
 
-def create_dummy_device(name: str, address: str, mtu: int, up: bool = True):
-    sudo_call(["ip", "link", "add", name, "type", "dummy"])
-    sudo_call(["ip", "address", "add", "dev", name, address])
-    sudo_call(["ip", "link", "set", "dev", name, "mtu", str(mtu)])
+def create_dummy_device(name: str, address: str, mtu: int, up: bool = True, batch: IPBatch | None = None):
+    ops = batch if batch is not None else IPBatch()
+    ops.link_add("", name, "dummy")
+    ops.address_add("", name, address)
+    ops.link_set_mtu("", name, mtu)
     if up:
-        sudo_call(["ip", "link", "set", "dev", name, "up"])
+        ops.link_set_up("", name)
+
+    if batch is None:
+        ops.flush()
@@ -1,42 +1,71 @@
 import json
+from typing import Any
 from lspnetd.common.utils import ns_wrap, sudo_call_output
+from lspnetd.device.cache import state_cache
+from lspnetd.device.netlink import netlink_dump_all_interface_state
 from lspnetd.models.device import NetworkInterfaceState
 
 
-def dump_interface_state(namespace: str, name: str):
-    addr_output = sudo_call_output(ns_wrap(namespace, ["ip", "-j", "addr", "show", "dev", name]))
-    addr_output = json.loads(addr_output)[0]
+# "iproute2": parse `ip -j addr show` output. "netlink": read RTM_GETLINK/RTM_GETADDR dumps directly (requires CAP_SYS_ADMIN for other namespaces)
+INTERFACE_BACKENDS = ("iproute2", "netlink")
+interface_backend = "iproute2"
+
+
+def set_interface_backend(backend: str):
+    global interface_backend
+
+    if backend not in INTERFACE_BACKENDS:
+        raise ValueError("unknown interface backend: {}".format(backend))
+    interface_backend = backend
+
+
+def parse_ip_addr_entry(addr_output: dict[str, Any]):
+    "one interface of `ip -j addr show` output -> NetworkInterfaceState"
 
     return NetworkInterfaceState(
-        name=name,
+        name=addr_output['ifname'],
         mtu=addr_output['mtu'],
         up='UP' in addr_output['flags'] and 'LOWER_UP' in addr_output['flags'],
         all_ipv4=[f"{addr['local']}/{addr['prefixlen']}" for addr in addr_output['addr_info'] if addr['family'] == 'inet'],
         all_ipv6=[f"{addr['local']}/{addr['prefixlen']}" for addr in addr_output['addr_info'] if addr['family'] == 'inet6'],
+        admin_up='UP' in addr_output['flags'],
     )
 
 
-def dump_all_interface_state(namespace: str):
+def dump_interface_state(namespace: str, name: str, backend: str = ''):
+    if (backend or interface_backend) == "netlink":
+        for iface in netlink_dump_all_interface_state(namespace):
+            if iface.name == name:
+                return iface
+        raise ValueError('Device "{}" does not exist.'.format(name))
+
+    addr_output = sudo_call_output(ns_wrap(namespace, ["ip", "-j", "addr", "show", "dev", name]))
+    return parse_ip_addr_entry(json.loads(addr_output)[0])
+
+
+def dump_all_interface_state(namespace: str, backend: str = ''):
+    if (backend or interface_backend) == "netlink":
+        return netlink_dump_all_interface_state(namespace)
+
     output = sudo_call_output(ns_wrap(namespace, ["ip", "-j", "addr", "show"]))
-    output = json.loads(output)
-    
-    return [NetworkInterfaceState(
-        name=addr_output['ifname'],
-        mtu=addr_output['mtu'],
-        up='UP' in addr_output['flags'] and 'LOWER_UP' in addr_output['flags'],
-        all_ipv4=[f"{addr['local']}/{addr['prefixlen']}" for addr in addr_output['addr_info'] if addr['family'] == 'inet'],
-        all_ipv6=[f"{addr['local']}/{addr['prefixlen']}" for addr in addr_output['addr_info'] if addr['family'] == 'inet6'],
-    ) for addr_output in output]
+    return [parse_ip_addr_entry(addr_output) for addr_output in json.loads(output)]
 
 
 def up_interface(namespace: str, name: str):
-    sudo_call_output(ns_wrap(namespace, ["ip", "link", "set", "dev", name, "up"]))
+    try:
+        sudo_call_output(ns_wrap(namespace, ["ip", "link", "set", "dev", name, "up"]))
+    finally:
+        # after the command: a reader racing with it must not re-cache the old state
+        state_cache.invalidate(namespace)
 
 
 def destroy_interface(namespace: str, name: str):
-    sudo_call_output(ns_wrap(namespace, ["ip", "link", "delete", "dev", name]))
+    try:
+        sudo_call_output(ns_wrap(namespace, ["ip", "link", "delete", "dev", name]))
+    finally:
+        state_cache.invalidate(namespace)
 
 
 def destroy_interface_if_exists(namespace: str, name: str):
-    if [iface for iface in dump_all_interface_state(namespace) if iface.name == name]:
+    if state_cache.interface(namespace, name):
         destroy_interface(namespace, name)
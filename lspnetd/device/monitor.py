@@ -0,0 +1,328 @@
+import asyncio
+import copy
+import errno
+import os
+import select
+import socket
+import struct
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable
+from lspnetd.common.logger import get_logger
+from lspnetd.common.utils import sudo_wrap
+from lspnetd.device.cache import state_cache
+from lspnetd.device.interface import dump_all_interface_state
+from lspnetd.device.netlink import (NLMSG_ERROR, RTM_DELADDR, RTM_DELLINK, RTM_NEWADDR, RTM_NEWLINK,
+                                    RTMGRP_IPV4_IFADDR, RTMGRP_IPV6_IFADDR, RTMGRP_LINK, build_interface_states_by_index,
+                                    dump_link_and_addr, iter_netlink_messages, open_netlink_socket, parse_addr_message, parse_link_message)
+from lspnetd.models.device import NetworkInterfaceState
+
+
+logger = get_logger("monitor")
+
+MONITOR_BACKENDS = ("netlink", "iproute2")
+# the iproute2 backend waits for `ip monitor` to stay quiet this long before re-dumping, but no longer than the max delay
+IPROUTE2_IDLE = 0.05
+IPROUTE2_MAX_DELAY = 1.0
+
+EVENT_LINK_NEW = "link_new"
+EVENT_LINK_CHANGED = "link_changed"
+EVENT_LINK_DELETED = "link_deleted"
+EVENT_ADDRESS_ADDED = "address_added"
+EVENT_ADDRESS_REMOVED = "address_removed"
+
+
+@dataclass
+class InterfaceEvent:
+    namespace: str
+    kind: str
+    name: str
+    # interface state after the event, None for deleted links
+    state: NetworkInterfaceState | None
+    # address/prefixlen for address events
+    address: str = ''
+
+
+def diff_interface_states(namespace: str, old: dict[str, NetworkInterfaceState], new: dict[str, NetworkInterfaceState]):
+    "events turning `old` into `new`"
+
+    events: list[InterfaceEvent] = []
+    for name, state in new.items():
+        previous = old.get(name)
+        if previous is None:
+            events.append(InterfaceEvent(namespace, EVENT_LINK_NEW, name, state))
+            previous_addresses: list[str] = []
+        else:
+            if previous.mtu != state.mtu or previous.up != state.up or previous.admin_up != state.admin_up:
+                events.append(InterfaceEvent(namespace, EVENT_LINK_CHANGED, name, state))
+            previous_addresses = previous.all_ipv4 + previous.all_ipv6
+
+        addresses = state.all_ipv4 + state.all_ipv6
+        events += [InterfaceEvent(namespace, EVENT_ADDRESS_REMOVED, name, state, address) for address in previous_addresses if address not in addresses]
+        events += [InterfaceEvent(namespace, EVENT_ADDRESS_ADDED, name, state, address) for address in addresses if address not in previous_addresses]
+
+    events += [InterfaceEvent(namespace, EVENT_LINK_DELETED, name, None) for name in old if name not in new]
+    return events
+
+
+class NamespaceMonitor:
+    """
+    Interface state of one namespace kept current from change notifications instead of polling.
+    "netlink" subscribes to the rtnetlink link/address multicast groups and applies each message to the view.
+    "iproute2" runs `ip monitor link address` and re-dumps the namespace once per burst of output.
+    Callbacks run on the monitor thread. Every change also invalidates state_cache for the namespace.
+    """
+
+    def __init__(self, namespace: str, backend: str = "netlink"):
+        if backend not in MONITOR_BACKENDS:
+            raise ValueError("unknown monitor backend: {}".format(backend))
+
+        self.namespace = namespace
+        self.backend = backend
+        self.lock = threading.Lock()
+        # ifindex -> state. the iproute2 backend does not know indexes and keys by position instead
+        self.states: dict[int, NetworkInterfaceState] = {}
+        self.callbacks: list[Callable[[InterfaceEvent], None]] = []
+        self.stopped = threading.Event()
+        self.thread: threading.Thread | None = None
+        self.sock: socket.socket | None = None
+        self.process: subprocess.Popen[bytes] | None = None
+
+    def add_callback(self, callback: Callable[[InterfaceEvent], None]):
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[InterfaceEvent], None]):
+        self.callbacks.remove(callback)
+
+    def interfaces(self) -> dict[str, NetworkInterfaceState]:
+        "copy of the current view, by interface name"
+
+        with self.lock:
+            return {state.name: copy.deepcopy(state) for state in self.states.values()}
+
+    def interface(self, name: str):
+        return self.interfaces().get(name)
+
+    def _emit(self, events: list[InterfaceEvent]):
+        if not events:
+            return
+
+        state_cache.invalidate(self.namespace)
+        for event in events:
+            for callback in list(self.callbacks):
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception("interface event callback failed")
+
+    def _resync(self):
+        "full dump, replacing the view. emits whatever changed since the last known state."
+
+        if self.backend == "netlink":
+            states = build_interface_states_by_index(*dump_link_and_addr(self.namespace))
+        else:
+            states = dict(enumerate(dump_all_interface_state(self.namespace, backend="iproute2")))
+
+        with self.lock:
+            old = {state.name: state for state in self.states.values()}
+            self.states = states
+            new = {state.name: copy.deepcopy(state) for state in states.values()}
+        return diff_interface_states(self.namespace, old, new)
+
+    def _apply_netlink_message(self, msg_type: int, payload: memoryview):
+        with self.lock:
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK):
+                index, name, mtu, up, admin_up = parse_link_message(payload)
+                state = self.states.get(index)
+                if msg_type == RTM_DELLINK:
+                    if state is None:
+                        return []
+                    del self.states[index]
+                    return [InterfaceEvent(self.namespace, EVENT_LINK_DELETED, state.name, None)]
+
+                if state is None:
+                    state = self.states[index] = NetworkInterfaceState(name=name, mtu=mtu, up=up, all_ipv4=[], all_ipv6=[], admin_up=admin_up)
+                    return [InterfaceEvent(self.namespace, EVENT_LINK_NEW, name, copy.deepcopy(state))]
+                if (state.name, state.mtu, state.up, state.admin_up) == (name, mtu, up, admin_up):
+                    return []
+                state.name, state.mtu, state.up, state.admin_up = name, mtu, up, admin_up
+                return [InterfaceEvent(self.namespace, EVENT_LINK_CHANGED, name, copy.deepcopy(state))]
+
+            index, family, address = parse_addr_message(payload)
+            state = self.states.get(index)
+            if state is None:
+                return []
+            addresses = state.all_ipv4 if family == socket.AF_INET else state.all_ipv6
+            if msg_type == RTM_NEWADDR and address not in addresses:
+                addresses.append(address)
+                return [InterfaceEvent(self.namespace, EVENT_ADDRESS_ADDED, state.name, copy.deepcopy(state), address)]
+            if msg_type == RTM_DELADDR and address in addresses:
+                addresses.remove(address)
+                return [InterfaceEvent(self.namespace, EVENT_ADDRESS_REMOVED, state.name, copy.deepcopy(state), address)]
+            return []
+
+    def _run_netlink(self):
+        assert self.sock is not None
+        while not self.stopped.is_set():
+            try:
+                data = self.sock.recv(1 << 16)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                if self.stopped.is_set():
+                    return
+                if e.errno != errno.ENOBUFS:
+                    raise
+                # receive queue overflowed, some notifications are lost
+                logger.warning("netlink monitor in {!r} overran, resyncing".format(self.namespace))
+                self._emit(self._resync())
+                continue
+
+            events: list[InterfaceEvent] = []
+            try:
+                for msg_type, _, payload in iter_netlink_messages(data):
+                    if msg_type in (RTM_NEWLINK, RTM_DELLINK, RTM_NEWADDR, RTM_DELADDR):
+                        events += self._apply_netlink_message(msg_type, payload)
+                    elif msg_type == NLMSG_ERROR:
+                        logger.warning("netlink monitor in {!r} got an error message".format(self.namespace))
+            except (ValueError, struct.error) as e:
+                # the rest of the datagram is lost, the dump catches up with whatever it carried
+                logger.warning("netlink monitor in {!r} got a malformed message ({}), resyncing".format(self.namespace, e))
+                events += self._resync()
+            self._emit(events)
+
+    def _read_monitor(self, fd: int, timeout: float | None):
+        "output available within `timeout`, b'' if there was none, None at EOF"
+
+        if not select.select([fd], [], [], timeout)[0]:
+            return b''
+        return os.read(fd, 1 << 16) or None
+
+    def _run_iproute2(self):
+        assert self.process is not None and self.process.stdout is not None
+        fd = self.process.stdout.fileno()
+        while not self.stopped.is_set():
+            data = self._read_monitor(fd, 0.5)
+            if data is None:
+                break
+            if not data.strip():
+                continue
+            # read ahead until the pipe is idle, one dump covers the whole burst
+            deadline = time.monotonic() + IPROUTE2_MAX_DELAY
+            while time.monotonic() < deadline:
+                if not self._read_monitor(fd, IPROUTE2_IDLE):
+                    break
+            if self.stopped.is_set():
+                return
+            # `ip monitor` output is only a hint, the dump is the source of truth
+            self._emit(self._resync())
+
+        if not self.stopped.is_set():
+            logger.warning("ip monitor in {!r} exited with {}".format(self.namespace, self.process.wait()))
+
+    def _run(self):
+        try:
+            if self.backend == "netlink":
+                self._run_netlink()
+            else:
+                self._run_iproute2()
+        except Exception:
+            logger.exception("interface monitor for {!r} stopped".format(self.namespace))
+
+    def start(self):
+        "subscribe, then take the initial dump. Changes racing with the dump are queued on the subscription and applied after it."
+
+        if self.backend == "netlink":
+            self.sock = open_netlink_socket(self.namespace, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+            self.sock.settimeout(0.5)
+        else:
+            args = ["ip"] + (["-n", self.namespace] if self.namespace else []) + ["monitor", "link", "address"]
+            self.process = subprocess.Popen(sudo_wrap(args), stdout=subprocess.PIPE, bufsize=0)
+
+        self._resync()
+        self.thread = threading.Thread(target=self._run, name="monitor-{}".format(self.namespace or "root"), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+        if self.thread is not None:
+            self.thread.join()
+        if self.sock is not None:
+            self.sock.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):  # type: ignore
+        self.stop()
+
+    async def events(self) -> AsyncIterator[InterfaceEvent]:
+        "async iterator over events from now on, until the monitor is stopped or the consumer breaks out"
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[InterfaceEvent] = asyncio.Queue()
+
+        def callback(event: InterfaceEvent):
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        self.add_callback(callback)
+        try:
+            while not self.stopped.is_set():
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            self.remove_callback(callback)
+
+
+class InterfaceMonitor:
+    "NamespaceMonitor for each watched namespace, sharing one set of callbacks"
+
+    def __init__(self, backend: str = "netlink"):
+        self.backend = backend
+        self.monitors: dict[str, NamespaceMonitor] = {}
+        self.callbacks: list[Callable[[InterfaceEvent], None]] = []
+        self.lock = threading.Lock()
+
+    def _dispatch(self, event: InterfaceEvent):
+        for callback in list(self.callbacks):
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("interface event callback failed")
+
+    def add_callback(self, callback: Callable[[InterfaceEvent], None]):
+        self.callbacks.append(callback)
+
+    def watch(self, namespace: str):
+        with self.lock:
+            monitor = self.monitors.get(namespace)
+            if monitor is None:
+                monitor = NamespaceMonitor(namespace, self.backend)
+                monitor.add_callback(self._dispatch)
+                monitor.start()
+                self.monitors[namespace] = monitor
+            return monitor
+
+    def unwatch(self, namespace: str):
+        with self.lock:
+            monitor = self.monitors.pop(namespace, None)
+        if monitor is not None:
+            monitor.stop()
+
+    def interfaces(self, namespace: str):
+        return self.watch(namespace).interfaces()
+
+    def stop(self):
+        with self.lock:
+            monitors, self.monitors = list(self.monitors.values()), {}
+        for monitor in monitors:
+            monitor.stop()
@@ -0,0 +1,215 @@
+import os
+import socket
+import struct
+from contextlib import contextmanager
+from typing import Iterator
+from lspnetd.models.device import NetworkInterfaceState
+
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+# multicast groups for open_netlink_socket(groups=...)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+IFF_UP = 0x1
+IFF_LOWER_UP = 0x10000
+
+# struct nlmsghdr { u32 len; u16 type; u16 flags; u32 seq; u32 pid; }
+NLMSGHDR = struct.Struct("=IHHII")
+# struct ifinfomsg { u8 family; u8 pad; u16 type; i32 index; u32 flags; u32 change; }
+IFINFOMSG = struct.Struct("=BxHiII")
+# struct ifaddrmsg { u8 family; u8 prefixlen; u8 flags; u8 scope; u32 index; }
+IFADDRMSG = struct.Struct("=BBBBI")
+# struct rtattr { u16 len; u16 type; }
+RTATTR = struct.Struct("=HH")
+
+
+def _align(length: int):
+    return (length + 3) & ~3
+
+
+def iter_netlink_messages(data: bytes) -> Iterator[tuple[int, int, memoryview]]:
+    "raw netlink stream -> (type, flags, payload)"
+
+    view = memoryview(data)
+    offset = 0
+    while offset + NLMSGHDR.size <= len(view):
+        msg_len, msg_type, msg_flags, _, _ = NLMSGHDR.unpack_from(view, offset)
+        if msg_len < NLMSGHDR.size or offset + msg_len > len(view):
+            raise ValueError("truncated netlink message at offset {}".format(offset))
+
+        yield msg_type, msg_flags, view[offset + NLMSGHDR.size:offset + msg_len]
+        offset += _align(msg_len)
+
+
+def iter_rtattrs(data: memoryview) -> Iterator[tuple[int, memoryview]]:
+    offset = 0
+    while offset + RTATTR.size <= len(data):
+        attr_len, attr_type = RTATTR.unpack_from(data, offset)
+        if attr_len < RTATTR.size or offset + attr_len > len(data):
+            raise ValueError("truncated rtattr at offset {}".format(offset))
+
+        # strip NLA_F_NESTED / NLA_F_NET_BYTEORDER
+        yield attr_type & 0x3fff, data[offset + RTATTR.size:offset + attr_len]
+        offset += _align(attr_len)
+
+
+def parse_link_message(payload: memoryview):
+    "RTM_NEWLINK payload -> (index, name, mtu, up, admin_up)"
+
+    _, _, index, flags, _ = IFINFOMSG.unpack_from(payload)
+    name = ''
+    mtu = 0
+    for attr_type, attr_data in iter_rtattrs(payload[IFINFOMSG.size:]):
+        if attr_type == IFLA_IFNAME:
+            name = bytes(attr_data).rstrip(b'\0').decode()
+        elif attr_type == IFLA_MTU:
+            mtu = struct.unpack_from("=I", attr_data)[0]
+
+    return index, name, mtu, bool(flags & IFF_UP) and bool(flags & IFF_LOWER_UP), bool(flags & IFF_UP)
+
+
+def parse_addr_message(payload: memoryview):
+    "RTM_NEWADDR payload -> (index, family, 'address/prefixlen')"
+
+    family, prefixlen, _, _, index = IFADDRMSG.unpack_from(payload)
+    address = b''
+    local = b''
+    for attr_type, attr_data in iter_rtattrs(payload[IFADDRMSG.size:]):
+        if attr_type == IFA_ADDRESS:
+            address = bytes(attr_data)
+        elif attr_type == IFA_LOCAL:
+            local = bytes(attr_data)
+
+    # same as `ip -j addr`: prefer IFA_LOCAL, point-to-point links carry the peer in IFA_ADDRESS
+    raw_address = local or address
+    return index, family, "{}/{}".format(socket.inet_ntop(family, raw_address), prefixlen)
+
+
+def _check_error(payload: memoryview):
+    errno = struct.unpack_from("=i", payload)[0]
+    if errno:
+        raise OSError(-errno, os.strerror(-errno))
+
+
+def build_interface_states_by_index(link_dump: bytes, addr_dump: bytes) -> dict[int, NetworkInterfaceState]:
+    states: dict[int, NetworkInterfaceState] = {}
+
+    for msg_type, _, payload in iter_netlink_messages(link_dump):
+        if msg_type == NLMSG_ERROR:
+            _check_error(payload)
+        if msg_type != RTM_NEWLINK:
+            continue
+
+        index, name, mtu, up, admin_up = parse_link_message(payload)
+        states[index] = NetworkInterfaceState(name=name, mtu=mtu, up=up, all_ipv4=[], all_ipv6=[], admin_up=admin_up)
+
+    for msg_type, _, payload in iter_netlink_messages(addr_dump):
+        if msg_type == NLMSG_ERROR:
+            _check_error(payload)
+        if msg_type != RTM_NEWADDR:
+            continue
+
+        index, family, address = parse_addr_message(payload)
+        state = states.get(index)
+        if state is None:
+            continue
+
+        if family == socket.AF_INET:
+            state.all_ipv4.append(address)
+        elif family == socket.AF_INET6:
+            state.all_ipv6.append(address)
+
+    return states
+
+
+def build_interface_states(link_dump: bytes, addr_dump: bytes) -> list[NetworkInterfaceState]:
+    return list(build_interface_states_by_index(link_dump, addr_dump).values())
+
+
+def get_netns_path(namespace: str):
+    for base in ("/run/netns", "/var/run/netns"):
+        path = os.path.join(base, namespace)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError("network namespace {} not found".format(namespace))
+
+
+@contextmanager
+def enter_netns(namespace: str):
+    "switch current thread into network namespace. sockets created inside stay in that namespace."
+
+    if not namespace:
+        yield
+        return
+
+    with open("/proc/thread-self/ns/net", "rb") as origin, open(get_netns_path(namespace), "rb") as target:
+        os.setns(target.fileno(), os.CLONE_NEWNET)
+        try:
+            yield
+        finally:
+            os.setns(origin.fileno(), os.CLONE_NEWNET)
+
+
+def open_netlink_socket(namespace: str, groups: int = 0):
+    with enter_netns(namespace):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+
+    try:
+        sock.bind((0, groups))
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def netlink_dump(sock: socket.socket, msg_type: int, body: bytes, seq: int = 1) -> bytes:
+    "send a dump request and return the raw response stream, suitable for recording and replaying into build_interface_states."
+
+    sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + body)
+
+    chunks: list[bytes] = []
+    done = False
+    while not done:
+        data = sock.recv(65536)
+        chunks.append(data)
+        for msg_type, _, payload in iter_netlink_messages(data):
+            if msg_type == NLMSG_DONE:
+                done = True
+            elif msg_type == NLMSG_ERROR:
+                _check_error(payload)
+
+    return b''.join(chunks)
+
+
+def dump_link_and_addr(namespace: str):
+    with open_netlink_socket(namespace) as sock:
+        link_dump = netlink_dump(sock, RTM_GETLINK, IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), seq=1)
+        addr_dump = netlink_dump(sock, RTM_GETADDR, IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), seq=2)
+        return link_dump, addr_dump
+
+
+def netlink_dump_all_interface_state(namespace: str):
+    return build_interface_states(*dump_link_and_addr(namespace))
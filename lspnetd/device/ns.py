@@ -1,4 +1,5 @@
 from lspnetd.common.utils import sudo_call
+from lspnetd.device.cache import state_cache
 
 
 def list_raw_netns_paths():
@@ -9,11 +10,28 @@ def list_raw_netns_paths():
 
 
 def ensure_netns(namespace: str):
+    "returns True if the namespace was created by this call"
+
     if not namespace:
-        return
+        return False
 
     netns_paths = list_raw_netns_paths()
     if f"/run/netns/{namespace}" in netns_paths or f"/var/run/netns/{namespace}" in netns_paths:
-        return
+        return False
 
     sudo_call(["ip", "netns", "add", namespace])
+    return True
+
+
+def destroy_netns(namespace: str):
+    if not namespace:
+        return
+
+    netns_paths = list_raw_netns_paths()
+    if f"/run/netns/{namespace}" not in netns_paths and f"/var/run/netns/{namespace}" not in netns_paths:
+        return
+
+    try:
+        sudo_call(["ip", "netns", "delete", namespace])
+    finally:
+        state_cache.invalidate(namespace)
@@ -1,18 +1,24 @@
-from lspnetd.common.utils import ns_wrap, sudo_call
+from lspnetd.device.batch import IPBatch
 
 
-def create_veth_device(ns1: str, name1: str, addr1: str, ns2: str, name2: str, addr2: str, up: bool = True):
-    call_args: list[str] = ["ip", "link", "add", name1]
+def create_veth_device(ns1: str, name1: str, addr1: str, ns2: str, name2: str, addr2: str, up: bool = True, batch: IPBatch | None = None):
+    ops = batch if batch is not None else IPBatch()
+
+    link_args: list[str] = []
     if ns1:
-        call_args += ["netns", ns1]
-    call_args += ["type", "veth", "peer", name2]
+        link_args += ["netns", ns1]
+    peer_args = ["peer", name2]
     if ns2:
-        call_args += ["netns", ns2]
-    
-    sudo_call(call_args)
-    sudo_call(ns_wrap(ns1, ["ip", "address", "add", "dev", name1, addr1]))
-    sudo_call(ns_wrap(ns2, ["ip", "address", "add", "dev", name2, addr2]))
+        peer_args += ["netns", ns2]
+
+    # ip link add <name1> [netns <ns1>] type veth peer <name2> [netns <ns2>]
+    ops.add("", ["link", "add", name1] + link_args + ["type", "veth"] + peer_args)
+    ops.address_add(ns1, name1, addr1)
+    ops.address_add(ns2, name2, addr2)
 
     if up:
-        sudo_call(ns_wrap(ns1, ["ip", "link", "set", "dev", name1, "up"]))
-        sudo_call(ns_wrap(ns2, ["ip", "link", "set", "dev", name2, "up"]))
+        ops.link_set_up(ns1, name1)
+        ops.link_set_up(ns2, name2)
+
+    if batch is None:
+        ops.flush()
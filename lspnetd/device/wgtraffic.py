@@ -0,0 +1,151 @@
+import time
+from array import array
+from dataclasses import dataclass
+from lspnetd.common.utils import human_readable_bytes, human_readable_duration
+from lspnetd.device.wireguard import dump_all_wireguard_state
+from lspnetd.models.device import WireGuardDeviceState
+
+
+# WireGuard drops session keys after REJECT_AFTER_TIME (180s) without a new handshake
+WG_STALE_AFTER = 180
+
+
+class RingBuffer:
+    __slots__ = ("values", "start", "size")
+
+    def __init__(self, capacity: int):
+        # float32 is enough for rates and keeps history at 4 bytes per sample
+        self.values = array('f', bytes(4 * capacity))
+        self.start = 0
+        self.size = 0
+
+    def append(self, value: float):
+        capacity = len(self.values)
+        self.values[(self.start + self.size) % capacity] = value
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        capacity = len(self.values)
+        for i in range(self.size):
+            yield self.values[(self.start + i) % capacity]
+
+    def last(self):
+        return self.values[(self.start + self.size - 1) % len(self.values)] if self.size else 0.0
+
+
+class _PeerCounters:
+    __slots__ = ("rx", "tx", "at", "seen", "rx_history", "tx_history")
+
+    def __init__(self, rx: int, tx: int, at: float, history_size: int):
+        self.rx = rx
+        self.tx = tx
+        self.at = at
+        self.seen = True
+        self.rx_history = RingBuffer(history_size)
+        self.tx_history = RingBuffer(history_size)
+
+
+@dataclass
+class WireGuardPeerTraffic:
+    device: str
+    public: str
+    rx: int
+    tx: int
+    # bytes per second since the previous snapshot
+    rx_rate: float
+    tx_rate: float
+    # seconds since latest handshake, -1 if never
+    handshake_age: int
+    stale: bool
+    namespace: str = ''
+
+    def describe(self):
+        return "rx {}/s tx {}/s (total rx {} tx {}) handshake {}".format(
+            human_readable_bytes(int(self.rx_rate)),
+            human_readable_bytes(int(self.tx_rate)),
+            human_readable_bytes(self.rx),
+            human_readable_bytes(self.tx),
+            "never" if self.handshake_age < 0 else human_readable_duration(self.handshake_age) + " ago",
+        )
+
+
+class WireGuardTrafficCollector:
+    def __init__(self, history_size: int = 60, stale_after: int = WG_STALE_AFTER):
+        self.history_size = history_size
+        self.stale_after = stale_after
+        # (namespace, device, public key) -> counters
+        self.peers: dict[tuple[str, str, str], _PeerCounters] = {}
+
+    def update(self, states: list[WireGuardDeviceState], now: float | None = None, namespace: str = ''):
+        "states are all WireGuard devices of `namespace`. Peers of other namespaces are not touched."
+
+        if now is None:
+            now = time.time()
+
+        for key, counters in self.peers.items():
+            if key[0] == namespace:
+                counters.seen = False
+
+        result: list[WireGuardPeerTraffic] = []
+        for state in states:
+            table = state.peers
+            # read the counter columns directly instead of materializing a row per peer
+            for row, public in enumerate(table.public):
+                rx = table.rx[row]
+                tx = table.tx[row]
+                latest_handshake = table.latest_handshake[row]
+
+                key = (namespace, state.name, public)
+                counters = self.peers.get(key)
+                rx_rate = tx_rate = 0.0
+
+                if counters is None:
+                    counters = self.peers[key] = _PeerCounters(rx, tx, now, self.history_size)
+                else:
+                    elapsed = now - counters.at
+                    # counters go backwards when the peer or device is re-created
+                    if elapsed > 0 and rx >= counters.rx and tx >= counters.tx:
+                        rx_rate = (rx - counters.rx) / elapsed
+                        tx_rate = (tx - counters.tx) / elapsed
+                        counters.rx_history.append(rx_rate)
+                        counters.tx_history.append(tx_rate)
+                    counters.rx = rx
+                    counters.tx = tx
+                    counters.at = now
+                    counters.seen = True
+
+                handshake_age = int(now - latest_handshake) if latest_handshake else -1
+                result.append(WireGuardPeerTraffic(
+                    device=state.name,
+                    public=public,
+                    rx=rx,
+                    tx=tx,
+                    rx_rate=rx_rate,
+                    tx_rate=tx_rate,
+                    handshake_age=handshake_age,
+                    stale=handshake_age < 0 or handshake_age > self.stale_after,
+                    namespace=namespace,
+                ))
+
+        # forget removed peers so memory stays bounded by the current peer set
+        for key in [key for key, counters in self.peers.items() if key[0] == namespace and not counters.seen]:
+            del self.peers[key]
+
+        return result
+
+    def collect(self, namespace: str):
+        return self.update(dump_all_wireguard_state(namespace), namespace=namespace)
+
+    def history(self, device: str, public: str, namespace: str = ''):
+        "-> (rx rates, tx rates), oldest first"
+
+        counters = self.peers.get((namespace, device, public))
+        if counters is None:
+            return [], []
+        return list(counters.rx_history), list(counters.tx_history)
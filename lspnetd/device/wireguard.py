@@ -1,84 +1,144 @@
-import tempfile
-from lspnetd.common.utils import ns_wrap, sudo_call, sudo_call_output, hostport_resolve
-from lspnetd.models.device import WireGuardDevicePeerState, WireGuardDeviceState
-
-
-def dump_wireguard_state(namespace: str, device_name: str):
-    output = sudo_call_output(ns_wrap(namespace, ["wg", "show", device_name, "dump"]))
-    state: WireGuardDeviceState | None = None
-
-    for line in output.split('\n'):
+from typing import Iterator
+from lspnetd.common.resolver import EndpointResolver, endpoint_resolver
+from lspnetd.common.utils import ns_wrap, split_hostport, sudo_call_input, sudo_iter_lines, hostport_resolve
+from lspnetd.device.batch import IPBatch
+from lspnetd.device.cache import state_cache
+from lspnetd.models.device import WireGuardDevicePeerState, WireGuardDeviceState, WireGuardPeerConfig, WireGuardPeerTable
+
+
+def iter_wireguard_dump(namespace: str, device_name: str = '', devices: set[str] | None = None, public_keys: set[str] | None = None) -> Iterator[tuple[str, WireGuardDeviceState | WireGuardDevicePeerState]]:
+    """
+    Stream `wg show <device|all> dump` line by line, yielding (device name, device state) for interface lines
+    and (device name, peer state) for peer lines. Devices not in `devices` and peers not in `public_keys` are skipped
+    before any object is built. Device states are yielded with an empty peer list.
+    """
+
+    for line in sudo_iter_lines(ns_wrap(namespace, ["wg", "show", device_name or "all", "dump"])):
         if not line:
             continue
         parts = line.split('\t')
+        if device_name:
+            parts.insert(0, device_name)
+
+        if devices is not None and parts[0] not in devices:
+            continue
 
-        if len(parts) == 4:
-            state = WireGuardDeviceState(
-                name=device_name,
-                private=parts[0],
-                public=parts[1],
-                listen=int(parts[2]),
-                fwmark=0 if parts[3] == 'off' else int(parts[3]),
-                peers=[],
+        if len(parts) == 5:
+            yield parts[0], WireGuardDeviceState(
+                name=parts[0],
+                private=parts[1],
+                public=parts[2],
+                listen=int(parts[3]),
+                fwmark=0 if parts[4] == 'off' else int(parts[4], 0),
+                peers=WireGuardPeerTable(),
             )
+            continue
+
+        if public_keys is not None and parts[1] not in public_keys:
+            continue
+
+        yield parts[0], WireGuardDevicePeerState(
+            public=parts[1],
+            preshared='' if parts[2] == '(none)' else parts[2],
+            endpoint='' if parts[3] == '(none)' else parts[3],
+            allowed_ips=parts[4].split(","),
+            latest_handshake=int(parts[5]),
+            rx=int(parts[6]),
+            tx=int(parts[7]),
+            keepalive=0 if parts[8] == 'off' else int(parts[8]),
+        )
+
+
+def dump_wireguard_state(namespace: str, device_name: str, public_keys: set[str] | None = None):
+    state: WireGuardDeviceState | None = None
+
+    for _, item in iter_wireguard_dump(namespace, device_name, public_keys=public_keys):
+        if isinstance(item, WireGuardDeviceState):
+            state = item
         else:
             assert state is not None
-            state.peers.append(WireGuardDevicePeerState(
-                public=parts[0],
-                preshared='' if parts[1] == '(none)' else parts[1],
-                endpoint='' if parts[2] == '(none)' else parts[2],
-                allowed_ips=parts[3].split(","),
-                latest_handshake=int(parts[4]),
-                rx=int(parts[5]),
-                tx=int(parts[6]),
-                keepalive=0 if parts[7] == 'off' else int(parts[7]),
-            ))
+            state.peers.append(item)
 
     return state
 
 
-def dump_all_wireguard_state(namespace: str) -> list[WireGuardDeviceState]:
-    output = sudo_call_output(ns_wrap(namespace, ["wg", "show", "all", "dump"]))
+def dump_all_wireguard_state(namespace: str, devices: set[str] | None = None, public_keys: set[str] | None = None) -> list[WireGuardDeviceState]:
     state_map: dict[str, WireGuardDeviceState] = {}
 
-    for line in output.split('\n'):
-        if not line:
-            continue
-        parts = line.split('\t')
-        if parts[0] not in state_map:
-            # new interface
-            state_map[parts[0]] = WireGuardDeviceState(
-                name=parts[0],
-                private=parts[1],
-                public=parts[2],
-                listen=int(parts[3]),
-                fwmark=0 if parts[4] == 'off' else int(parts[4]),
-                peers=[],    
-            )
+    for name, item in iter_wireguard_dump(namespace, devices=devices, public_keys=public_keys):
+        if isinstance(item, WireGuardDeviceState):
+            state_map[name] = item
         else:
-            state_map[parts[0]].peers.append(WireGuardDevicePeerState(
-                public=parts[1],
-                preshared='' if parts[2] == '(none)' else parts[2],
-                endpoint='' if parts[3] == '(none)' else parts[3],
-                allowed_ips=parts[4].split(","),
-                latest_handshake=int(parts[5]),
-                rx=int(parts[6]),
-                tx=int(parts[7]),
-                keepalive=0 if parts[8] == 'off' else int(parts[8]),
-            ))
+            state_map[name].peers.append(item)
 
     return list(state_map.values())
 
 
-def create_wg_device(namespace: str, name: str, address: str, mtu: int):
-    sudo_call(["ip", "link", "add", "dev", name, "type", "wireguard"])
+def create_wg_device(namespace: str, name: str, address: str, mtu: int, batch: IPBatch | None = None):
+    ops = batch if batch is not None else IPBatch()
+    ops.link_add("", name, "wireguard")
     if namespace:
         # move to namespace. this is required for wireguard to work, because wireguard will "remeber" where the device was created
         # DO NOT change to ip link add <> netns <>
-        sudo_call(["ip", "link", "set", "dev", name, "netns", namespace])
+        ops.link_set_netns("", name, namespace)
+
+    ops.address_add(namespace, name, address)
+    ops.link_set_mtu(namespace, name, mtu)
+
+    if batch is None:
+        ops.flush()
+
+
+def _format_wg_endpoint(address: str, port: int):
+    if ':' in address:
+        return f"[{address}]:{port or 51820}"
+    return f"{address}:{port or 51820}"
+
+
+def resolve_wg_endpoint(endpoint: str):
+    return _format_wg_endpoint(*hostport_resolve(endpoint))
+
 
-    sudo_call(ns_wrap(namespace, ["ip", "address", "add", "dev", name, address]))
-    sudo_call(ns_wrap(namespace, ["ip", "link", "set", "dev", name, "mtu", str(mtu)]))
+def resolve_wg_endpoints(peers: list[WireGuardPeerConfig]):
+    "public key -> resolved endpoint for every peer with an endpoint. Host names are looked up concurrently."
+
+    endpoint_resolver.resolve_many(split_hostport(peer.endpoint)[0] for peer in peers if peer.endpoint)
+    return {peer.public: resolve_wg_endpoint(peer.endpoint) for peer in peers if peer.endpoint}
+
+
+def refresh_wg_endpoints(namespace: str, name: str, peers: list[WireGuardPeerConfig], resolver: EndpointResolver = endpoint_resolver):
+    """
+    Re-resolve peer endpoints and re-apply only those whose DNS answer changed since the last refresh
+    (and that differ from what the device uses), with one `wg set`. Peers that roamed on their own are left alone
+    while their name keeps resolving to the same address. Returns public keys of updated peers.
+    A failed `wg set` leaves the changes pending, the next refresh tries them again.
+    """
+
+    hostports = {peer.public: split_hostport(peer.endpoint) for peer in peers if peer.endpoint}
+    changed = resolver.refresh_changes({(namespace, name, public): host for public, (host, _) in hostports.items()})
+    if not changed:
+        return []
+
+    current = state_cache.wireguard_device(namespace, name)
+    config_args: list[str] = []
+    updated: list[str] = []
+    for (_, _, public), address in changed.items():
+        if address is None:
+            continue
+        endpoint = _format_wg_endpoint(address, hostports[public][1])
+        current_peer = current.peers.get(public) if current is not None else None
+        if current_peer is not None and current_peer.endpoint == endpoint:
+            continue
+        config_args.extend(["peer", public, "endpoint", endpoint])
+        updated.append(public)
+
+    if config_args:
+        try:
+            sudo_call_input(ns_wrap(namespace, ["wg", "set", name] + config_args), "")
+        finally:
+            state_cache.invalidate(namespace)
+    resolver.commit_changes(changed)
+    return updated
 
 
 def assign_wg_device(namespace: str, name: str, private_key: str, listen_port: int, peer: str, endpoint: str, keepalive: int, allowed_ips: list[str] | str):
@@ -89,17 +149,89 @@ def assign_wg_device(namespace: str, name: str, private_key: str, listen_port: i
     if peer:
         config_args.extend(["peer", peer])
         if endpoint:
-            host, port = hostport_resolve(endpoint)
-            config_args.extend(["endpoint", f"{host}:{port or 51820}"])
+            config_args.extend(["endpoint", resolve_wg_endpoint(endpoint)])
         if keepalive:
             config_args.extend(["persistent-keepalive", str(keepalive)])
         if allowed_ips:
             config_args.extend(["allowed-ips", ",".join(allowed_ips) if isinstance(allowed_ips, list) else allowed_ips])
 
-    with tempfile.NamedTemporaryFile(mode='w+b', delete=False) as f:
-        temp_filename = f.name
-        f.write(private_key.encode())
-        f.flush()
-        config_args = ["private-key", temp_filename] + config_args
+    # key is passed through stdin, never touches the disk
+    try:
+        sudo_call_input(ns_wrap(namespace, ["wg", "set", name, "private-key", "/dev/stdin"] + config_args), private_key + "\n")
+    finally:
+        state_cache.invalidate(namespace)
 
-        sudo_call(ns_wrap(namespace, ["wg", "set", name] + config_args))
+
+def render_wg_config(private_key: str, listen_port: int, fwmark: int, peers: list[WireGuardPeerConfig], resolved_endpoints: dict[str, str]):
+    lines = ["[Interface]", f"PrivateKey = {private_key}"]
+    if listen_port:
+        lines.append(f"ListenPort = {listen_port}")
+    if fwmark:
+        lines.append(f"FwMark = {fwmark}")
+
+    for peer in peers:
+        lines += ["", "[Peer]", f"PublicKey = {peer.public}"]
+        if peer.preshared:
+            lines.append(f"PresharedKey = {peer.preshared}")
+        if peer.public in resolved_endpoints:
+            lines.append(f"Endpoint = {resolved_endpoints[peer.public]}")
+        if peer.keepalive:
+            lines.append(f"PersistentKeepalive = {peer.keepalive}")
+        if peer.allowed_ips:
+            lines.append(f"AllowedIPs = {', '.join(peer.allowed_ips)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _wg_peer_changed(current: WireGuardDevicePeerState, peer: WireGuardPeerConfig, endpoint: str):
+    return (current.preshared != peer.preshared
+            or (endpoint and current.endpoint != endpoint)
+            or current.keepalive != peer.keepalive
+            or sorted(ip for ip in current.allowed_ips if ip != '(none)') != sorted(peer.allowed_ips))
+
+
+def diff_wg_device(current: WireGuardDeviceState | None, private_key: str, listen_port: int, peers: list[WireGuardPeerConfig], fwmark: int, resolved_endpoints: dict[str, str]):
+    "-> (device settings changed, public keys of peers added/changed/removed). listen_port/fwmark 0 means keep current."
+
+    if current is None:
+        return True, [peer.public for peer in peers]
+
+    device_changed = (current.private != private_key
+                      or (listen_port and current.listen != listen_port)
+                      or (fwmark and current.fwmark != fwmark))
+
+    current_peers = current.peers
+    desired_peers = {peer.public for peer in peers}
+    changed_peers: list[str] = []
+    for peer in peers:
+        current_peer = current_peers.get(peer.public)
+        if current_peer is None or _wg_peer_changed(current_peer, peer, resolved_endpoints.get(peer.public, '')):
+            changed_peers.append(peer.public)
+    changed_peers += [public for public in current_peers.public if public not in desired_peers]
+    return bool(device_changed), changed_peers
+
+
+def sync_wg_device(namespace: str, name: str, private_key: str, listen_port: int, peers: list[WireGuardPeerConfig], fwmark: int = 0):
+    """
+    Apply the full device config (key, listen port, every peer) with one `wg syncconf` fed through stdin.
+    Peers not listed are removed. Nothing is run when the device already matches.
+    Returns public keys of peers that were added, changed or removed.
+    """
+
+    resolved_endpoints = resolve_wg_endpoints(peers)
+
+    current = state_cache.wireguard_device(namespace, name)
+    device_changed, changed_peers = diff_wg_device(current, private_key, listen_port, peers, fwmark, resolved_endpoints)
+    if not device_changed and not changed_peers:
+        return []
+
+    if current is not None:
+        listen_port = listen_port or current.listen
+        fwmark = fwmark or current.fwmark
+
+    config = render_wg_config(private_key, listen_port, fwmark, peers, resolved_endpoints)
+    try:
+        sudo_call_input(ns_wrap(namespace, ["wg", "syncconf", name, "/dev/stdin"]), config)
+    finally:
+        state_cache.invalidate(namespace)
+    return changed_peers
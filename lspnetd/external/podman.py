@@ -1,5 +1,7 @@
 import json
-from lspnetd.common.utils import sudo_call, sudo_call_output, get_tempdir_path
+import subprocess
+from typing import Any
+from lspnetd.common.utils import sudo_call, sudo_wrap, get_tempdir_path
 from lspnetd.common.logger import get_logger
 from lspnetd.models.container import ContainerBindMountStatus, ContainerStatus
 
@@ -7,38 +9,51 @@ from lspnetd.models.container import ContainerBindMountStatus, ContainerStatus
 logger = get_logger("podman")
 
 
+def parse_container_inspect(container_inspect_result: dict[str, Any]):
+    "one entry of `podman container inspect` output (or the libpod REST API inspect body) -> ContainerStatus"
+
+    mounts: list[ContainerBindMountStatus] = []
+    for bind_mount in container_inspect_result["HostConfig"].get("Binds") or []:
+        parts = bind_mount.split(':')
+        mounts.append(ContainerBindMountStatus(
+            source=parts[0],
+            target=parts[1],
+            flags=parts[2].split(',') if len(parts) > 2 else []
+        ))
+
+    return ContainerStatus(
+        id=container_inspect_result['Id'],
+        bind_mounts=mounts,
+        state=(container_inspect_result.get("State") or {}).get("Status", ""),
+    )
+
+
 def inspect_podman_container(container_name: str):
-    container_list = sudo_call_output(["podman", "ps", "-a", "--format=json"])
-    container_list = json.loads(container_list)
-
-    for container_info in container_list:
-        if container_name in container_info['Names']:
-            container_inspect_result = sudo_call_output(["podman", "container", "inspect", container_info['Id']])
-            container_inspect_result = json.loads(container_inspect_result)
-            
-            mounts: list[ContainerBindMountStatus] = []
-            for bind_mount in container_inspect_result[0]["HostConfig"]["Binds"]:
-                parts = bind_mount.split(':')
-                mounts.append(ContainerBindMountStatus(
-                    source=parts[0],
-                    target=parts[1],
-                    flags=parts[2:].split(',')
-                ))
-            
-            return ContainerStatus(
-                id=container_info['Id'],
-                bind_mounts=mounts
-            )
+    try:
+        output = subprocess.run(sudo_wrap(["podman", "container", "inspect", container_name]), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, encoding='utf-8').stdout
+    except subprocess.CalledProcessError as e:
+        if 'no such container' not in e.stderr.lower():
+            raise
+        return None
 
+    container_inspect_result = json.loads(output)
+    if not container_inspect_result:
+        return None
+    return parse_container_inspect(container_inspect_result[0])
 
-def shutdown_podman_router(namespace: str):
-    container_status = inspect_podman_container(f"{namespace}-router")
-    if not container_status:
-        return
 
-    logger.info('removing container: {}'.format(container_status.id))
-    sudo_call(["podman", "rm", "-f", container_status.id])
+def get_router_container_name(namespace: str):
+    return f"{namespace}-router"
+
+
+def get_router_run_args(namespace: str):
+    return ["--network", f"ns:/var/run/netns/{namespace}",
+            "--cap-add", "NET_ADMIN", "--cap-add", "CAP_NET_BIND_SERVICE", "--cap-add", "NET_RAW", "--cap-add", "NET_BROADCAST",
+            "-v", f"{get_tempdir_path(namespace)}/router:/data:ro", "--name", get_router_container_name(namespace),
+            "-d", "bird-router"]
+
 
+def cleanup_router_tempdirs(namespace: str, container_status: ContainerStatus):
     # make sure legacy mount/tmpfiles are cleared
     for mount in container_status.bind_mounts:
         if mount.source.startswith(get_tempdir_path(namespace)):
@@ -46,9 +61,30 @@ def shutdown_podman_router(namespace: str):
             sudo_call(["rm", "-rf", mount.source])
 
 
+def shutdown_podman_router(namespace: str):
+    container_status = inspect_podman_container(get_router_container_name(namespace))
+    if not container_status:
+        return
+
+    logger.info('removing container: {}'.format(container_status.id))
+    sudo_call(["podman", "rm", "-f", container_status.id])
+    cleanup_router_tempdirs(namespace, container_status)
+
+
+def ensure_podman_router(namespace: str):
+    "start the router container unless it already exists. returns True if it was created by this call"
+
+    container_status = inspect_podman_container(get_router_container_name(namespace))
+    if container_status is None:
+        start_podman_router(namespace)
+        return True
+
+    if container_status.state != "running":
+        logger.info('starting existing container: {}'.format(container_status.id))
+        sudo_call(["podman", "start", container_status.id])
+    return False
+
+
 def start_podman_router(namespace: str):
     logger.info('starting router with namespace {}'.format(namespace))
-    sudo_call(["podman", "run", "--network", f"ns:/var/run/netns/{namespace}", 
-               "--cap-add", "NET_ADMIN", "--cap-add", "CAP_NET_BIND_SERVICE", "--cap-add", "NET_RAW", "--cap-add", "NET_BROADCAST",
-               "-v", f"{get_tempdir_path(namespace)}/router:/data:ro", "--name", f"{namespace}-router",
-               "-d", "bird-router"])
+    sudo_call(["podman", "run"] + get_router_run_args(namespace))
@@ -0,0 +1,251 @@
+import http.client
+import json
+import os
+import socket
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from lspnetd.common.logger import get_logger
+from lspnetd.common.utils import get_tempdir_path, sudo_call
+from lspnetd.external.podman import (cleanup_router_tempdirs, get_router_container_name, inspect_podman_container,
+                                     parse_container_inspect, shutdown_podman_router, start_podman_router)
+from lspnetd.models.container import ContainerStatus
+
+
+logger = get_logger("podman_api")
+
+# rootful podman.socket, lspnetd manages network namespaces as root anyway
+DEFAULT_PODMAN_SOCKET = "/run/podman/podman.sock"
+PODMAN_API_VERSION = "v4.0.0"
+
+
+def get_default_podman_socket():
+    container_host = os.environ.get("CONTAINER_HOST", "")
+    if container_host.startswith("unix://"):
+        return container_host[len("unix://"):]
+    return DEFAULT_PODMAN_SOCKET
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 30):
+        # host only ends up in the Host header
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class PodmanAPIError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__("podman API error {}: {}".format(status, message))
+        self.status = status
+
+
+class PodmanClient:
+    """
+    libpod REST API over the podman unix socket: one request per operation instead of a podman process.
+    Every call falls back to the podman CLI (a single by-name command) when the socket can't be reached.
+    """
+
+    def __init__(self, socket_path: str = '', timeout: float = 30, api_version: str = PODMAN_API_VERSION):
+        self.socket_path = socket_path or get_default_podman_socket()
+        self.timeout = timeout
+        self.api_version = api_version
+
+    def _request(self, method: str, path: str, body: Any = None, query: dict[str, str] | None = None):
+        "-> (status, decoded JSON body or None). Raises OSError if the socket is not reachable."
+
+        url = "/{}/libpod{}".format(self.api_version, path)
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+
+        conn = UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, url, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        finally:
+            conn.close()
+
+        try:
+            decoded = json.loads(data) if data else None
+        except ValueError:
+            decoded = data.decode(errors="replace")
+        return response.status, decoded
+
+    @staticmethod
+    def _error(status: int, data: Any):
+        message = data.get("message", "") if isinstance(data, dict) else str(data)
+        return PodmanAPIError(status, message)
+
+    def _api(self, func: Callable[[], Any], fallback: Callable[[], Any]):
+        try:
+            return func()
+        except OSError as e:
+            # missing socket, refused, no permission or the service went away mid-request
+            logger.debug("podman socket {} not usable ({}), using podman CLI".format(self.socket_path, e))
+            return fallback()
+
+    def ping(self):
+        try:
+            status, _ = self._request("GET", "/_ping")
+        except OSError:
+            return False
+        return status == 200
+
+    def inspect(self, container_name: str) -> ContainerStatus | None:
+        def api():
+            status, data = self._request("GET", "/containers/{}/json".format(urllib.parse.quote(container_name, safe='')))
+            if status == 404:
+                return None
+            if status != 200:
+                raise self._error(status, data)
+            return parse_container_inspect(data)
+
+        return self._api(api, lambda: inspect_podman_container(container_name))
+
+    def remove(self, container_name: str, force: bool = True):
+        "remove the container, returns False if it did not exist"
+
+        def api():
+            status, data = self._request("DELETE", "/containers/{}".format(urllib.parse.quote(container_name, safe='')), query={"force": "true" if force else "false"})
+            if status == 404:
+                return False
+            if status not in (200, 204):
+                raise self._error(status, data)
+            return True
+
+        return self._api(api, lambda: self._remove_cli(container_name))
+
+    @staticmethod
+    def _remove_cli(container_name: str):
+        if inspect_podman_container(container_name) is None:
+            return False
+        sudo_call(["podman", "rm", "-f", container_name])
+        return True
+
+    def create(self, spec: dict[str, Any]) -> str:
+        "create a container from a libpod SpecGenerator document, returns its id"
+
+        status, data = self._request("POST", "/containers/create", body=spec)
+        if status != 201:
+            raise self._error(status, data)
+        return data["Id"]
+
+    def start(self, container_id: str):
+        status, data = self._request("POST", "/containers/{}/start".format(urllib.parse.quote(container_id, safe='')))
+        # 304: already running
+        if status not in (204, 304):
+            raise self._error(status, data)
+
+
+def get_router_spec(namespace: str):
+    "libpod SpecGenerator equivalent of get_router_run_args"
+
+    return {
+        "name": get_router_container_name(namespace),
+        "image": "bird-router",
+        "netns": {"nsmode": "path", "value": f"/var/run/netns/{namespace}"},
+        "cap_add": ["NET_ADMIN", "CAP_NET_BIND_SERVICE", "NET_RAW", "NET_BROADCAST"],
+        "mounts": [{"destination": "/data", "source": f"{get_tempdir_path(namespace)}/router", "type": "bind", "options": ["ro"]}],
+    }
+
+
+class PodmanRouterManager:
+    """
+    Router containers of many namespaces. Container state is cached per namespace and only refreshed
+    when asked to or after we changed it. start/stop run on a bounded thread pool.
+    """
+
+    def __init__(self, client: PodmanClient | None = None, max_workers: int = 4):
+        self.client = client or PodmanClient()
+        self.max_workers = max_workers
+        # namespace -> container status, None if there is no router container
+        self.cache: dict[str, ContainerStatus | None] = {}
+        self.lock = threading.Lock()
+
+    def status(self, namespace: str, refresh: bool = False):
+        with self.lock:
+            if not refresh and namespace in self.cache:
+                return self.cache[namespace]
+
+        container_status = self.client.inspect(get_router_container_name(namespace))
+        with self.lock:
+            self.cache[namespace] = container_status
+        return container_status
+
+    def invalidate(self, namespace: str | None = None):
+        with self.lock:
+            if namespace is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(namespace, None)
+
+    def start(self, namespace: str):
+        "create and start the router container. Existing containers are only started if they are not running."
+
+        container_status = self.status(namespace)
+        try:
+            if container_status is not None and container_status.state == "running":
+                return
+
+            try:
+                if container_status is None:
+                    logger.info('starting router with namespace {}'.format(namespace))
+                    container_id = self.client.create(get_router_spec(namespace))
+                else:
+                    container_id = container_status.id
+                self.client.start(container_id)
+            except OSError as e:
+                logger.debug("podman socket {} not usable ({}), using podman CLI".format(self.client.socket_path, e))
+                if container_status is not None:
+                    shutdown_podman_router(namespace)
+                start_podman_router(namespace)
+        finally:
+            self.invalidate(namespace)
+
+    def stop(self, namespace: str):
+        "remove the router container and its temp directories"
+
+        container_status = self.status(namespace, refresh=True)
+        try:
+            if container_status is None:
+                return
+
+            logger.info('removing container: {}'.format(container_status.id))
+            self.client.remove(container_status.id)
+            cleanup_router_tempdirs(namespace, container_status)
+        finally:
+            self.invalidate(namespace)
+
+    def _run_all(self, func: Callable[[str], None], namespaces: list[str]):
+        "-> namespace -> error message, '' on success"
+
+        def run(namespace: str):
+            try:
+                func(namespace)
+                return ''
+            except Exception as e:
+                logger.exception("podman operation failed for namespace {}".format(namespace))
+                return str(e) or type(e).__name__
+
+        if not namespaces:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(namespaces)), thread_name_prefix="podman") as executor:
+            return dict(zip(namespaces, executor.map(run, namespaces)))
+
+    def start_all(self, namespaces: list[str]):
+        return self._run_all(self.start, namespaces)
+
+    def stop_all(self, namespaces: list[str]):
+        return self._run_all(self.stop, namespaces)
@@ -12,3 +12,5 @@ class ContainerBindMountStatus:
 class ContainerStatus:
     id: str
     bind_mounts: list[ContainerBindMountStatus]
+    # podman state, e.g. running, exited, created
+    state: str = ''
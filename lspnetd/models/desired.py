@@ -0,0 +1,62 @@
+from typing import Literal
+from pydantic import BaseModel, Field
+
+
+class DummyDeviceSpec(BaseModel):
+    name: str
+    addresses: list[str] = Field(default_factory=list)
+    # 0: leave the kernel default
+    mtu: int = 0
+    up: bool = True
+
+
+class VethDeviceSpec(BaseModel):
+    name: str
+    # the other end, '' is the root namespace
+    peer_namespace: str
+    peer_name: str
+    addresses: list[str] = Field(default_factory=list)
+    peer_addresses: list[str] = Field(default_factory=list)
+    # applied to both ends
+    mtu: int = 0
+    up: bool = True
+
+
+class WireGuardPeerSpec(BaseModel):
+    public: str
+    endpoint: str = ''
+    allowed_ips: list[str] = Field(default_factory=list)
+    keepalive: int = 0
+    preshared: str = ''
+
+
+class WireGuardDeviceSpec(BaseModel):
+    name: str
+    private_key: str
+    listen_port: int = 0
+    fwmark: int = 0
+    addresses: list[str] = Field(default_factory=list)
+    mtu: int = 0
+    up: bool = True
+    peers: list[WireGuardPeerSpec] = Field(default_factory=list)
+
+
+class IptablesChainSpec(BaseModel):
+    table: Literal["raw", "mangle", "nat", "filter", "security"]
+    chain: str
+    # None: only make sure the chain exists
+    rules: list[list[str]] | None = None
+    jump_from: str = ''
+
+
+class NamespaceSpec(BaseModel):
+    # '' is the root namespace
+    name: str
+    dummy: list[DummyDeviceSpec] = Field(default_factory=list)
+    veth: list[VethDeviceSpec] = Field(default_factory=list)
+    wireguard: list[WireGuardDeviceSpec] = Field(default_factory=list)
+    iptables: list[IptablesChainSpec] = Field(default_factory=list)
+
+
+class DesiredState(BaseModel):
+    namespaces: list[NamespaceSpec] = Field(default_factory=list)
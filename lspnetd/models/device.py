@@ -1,7 +1,12 @@
-from dataclasses import dataclass
+import ipaddress
+from array import array
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from typing import overload
 
 
-@dataclass
+# frozen: rows handed out by WireGuardPeerTable are copies, writing to one would be silently lost
+@dataclass(slots=True, frozen=True)
 class WireGuardDevicePeerState:
     public: str
     preshared: str
@@ -13,6 +18,105 @@ class WireGuardDevicePeerState:
     keepalive: int
 
 
+class WireGuardPeerTable(Sequence[WireGuardDevicePeerState]):
+    """
+    Column-oriented peer list. Counters live in typed arrays, lookups by public key and
+    longest-prefix match on allowed IPs are O(1) / O(prefix lengths in use).
+    Indexing and iteration build read-only WireGuardDevicePeerState rows on the fly.
+    """
+
+    __slots__ = ("public", "preshared", "endpoint", "allowed_ips", "latest_handshake", "rx", "tx", "keepalive", "_by_public", "_by_prefix")
+
+    def __init__(self, peers: Iterable[WireGuardDevicePeerState] = ()):
+        self.public: list[str] = []
+        self.preshared: list[str] = []
+        self.endpoint: list[str] = []
+        self.allowed_ips: list[tuple[str, ...]] = []
+        self.latest_handshake = array('q')
+        self.rx = array('Q')
+        self.tx = array('Q')
+        self.keepalive = array('I')
+        self._by_public: dict[str, int] = {}
+        # ip version -> prefix length -> network bits -> row
+        self._by_prefix: dict[int, dict[int, dict[int, int]]] = {4: {}, 6: {}}
+
+        for peer in peers:
+            self.append(peer)
+
+    def append(self, peer: WireGuardDevicePeerState):
+        row = len(self.public)
+        self.public.append(peer.public)
+        self.preshared.append(peer.preshared)
+        self.endpoint.append(peer.endpoint)
+        self.allowed_ips.append(tuple(peer.allowed_ips))
+        self.latest_handshake.append(peer.latest_handshake)
+        self.rx.append(peer.rx)
+        self.tx.append(peer.tx)
+        self.keepalive.append(peer.keepalive)
+        self._by_public[peer.public] = row
+
+        for allowed_ip in peer.allowed_ips:
+            if allowed_ip == '(none)':
+                continue
+            network = ipaddress.ip_network(allowed_ip, strict=False)
+            self._by_prefix[network.version].setdefault(network.prefixlen, {})[int(network.network_address) >> (network.max_prefixlen - network.prefixlen)] = row
+
+    def __len__(self):
+        return len(self.public)
+
+    def _row(self, row: int):
+        return WireGuardDevicePeerState(
+            public=self.public[row],
+            preshared=self.preshared[row],
+            endpoint=self.endpoint[row],
+            allowed_ips=list(self.allowed_ips[row]),
+            latest_handshake=self.latest_handshake[row],
+            rx=self.rx[row],
+            tx=self.tx[row],
+            keepalive=self.keepalive[row],
+        )
+
+    @overload
+    def __getitem__(self, index: int) -> WireGuardDevicePeerState: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[WireGuardDevicePeerState]: ...
+
+    def __getitem__(self, index: int | slice):
+        if isinstance(index, slice):
+            return [self._row(row) for row in range(len(self))[index]]
+        return self._row(range(len(self))[index])
+
+    def __eq__(self, other: object):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def __repr__(self):
+        return repr(self.to_list())
+
+    def to_list(self) -> list[WireGuardDevicePeerState]:
+        return [self._row(row) for row in range(len(self))]
+
+    def index_of(self, public: str):
+        "row of peer with given public key, -1 if not found"
+        return self._by_public.get(public, -1)
+
+    def get(self, public: str):
+        row = self._by_public.get(public)
+        return None if row is None else self._row(row)
+
+    def lookup_address(self, address: str):
+        "peer whose allowed IPs route the given address (longest prefix match), like WireGuard cryptokey routing"
+
+        ip = ipaddress.ip_address(address)
+        prefixes = self._by_prefix[ip.version]
+        for prefixlen in sorted(prefixes, reverse=True):
+            row = prefixes[prefixlen].get(int(ip) >> (ip.max_prefixlen - prefixlen))
+            if row is not None:
+                return self._row(row)
+        return None
+
+
 @dataclass
 class WireGuardDeviceState:
     name: str
@@ -20,16 +124,24 @@ class WireGuardDeviceState:
     public: str
     listen: int
     fwmark: int
-    peers: list[WireGuardDevicePeerState]
+    # any iterable of peer states is converted, WireGuardPeerTable.to_list() gives the list-of-dataclasses view back
+    peers: WireGuardPeerTable = field(default_factory=WireGuardPeerTable)
+
+    def __post_init__(self):
+        if not isinstance(self.peers, WireGuardPeerTable):
+            self.peers = WireGuardPeerTable(self.peers)
 
 
 @dataclass
 class NetworkInterfaceState:
     name: str
     mtu: int
+    # administratively up and with carrier
     up: bool
     all_ipv4: list[str]
     all_ipv6: list[str]
+    # administratively up (IFF_UP), whether or not there is carrier
+    admin_up: bool = False
 
     @property
     def ipv4(self) -> str:
@@ -38,3 +150,12 @@ class NetworkInterfaceState:
     @property
     def ipv6(self) -> str:
         return self.all_ipv6[0] if self.all_ipv6 else ""
+
+
+@dataclass
+class WireGuardPeerConfig:
+    public: str
+    endpoint: str = ''
+    allowed_ips: list[str] = field(default_factory=list)
+    keepalive: int = 0
+    preshared: str = ''
@@ -0,0 +1,90 @@
+import asyncio
+from typing import Any
+from lspnetd.config.session import SecureSessionStore
+from lspnetd.secure.http_client import SecureChannelHTTPClient
+
+
+class AsyncSecureChannelHTTPClient:
+    """
+    asyncio front-end of SecureChannelHTTPClient. Same protocol and session state, requests run on a
+    bounded keep-alive pool: at most `max_connections` sends are in flight, the rest wait for a free connection.
+    This is a thread-pool adapter, not native async I/O: every blocking call (HTTP sends, session store reads and
+    writes) runs in asyncio.to_thread, and the semaphore caps how many sends occupy a worker thread at once.
+    """
+
+    def __init__(self, client_hostname: str, domain: str,
+                 client_private_sign_key_der_bytes: bytes,
+                 peer_public_sign_key_der_bytes: bytes,
+                 *, scheme: str = "https", max_connections: int = 10, timeout: float = 30, protocol_version: int = 1,
+                 session_store: SecureSessionStore | None = None):
+        self.client = SecureChannelHTTPClient(client_hostname, domain,
+                                              client_private_sign_key_der_bytes, peer_public_sign_key_der_bytes,
+                                              scheme=scheme, pool_size=max_connections, timeout=timeout,
+                                              protocol_version=protocol_version)
+        # the stored session is loaded off the event loop by the first ensure()
+        self.client.session_store = session_store
+        self.resume_pending = session_store is not None
+        self.semaphore = asyncio.Semaphore(max_connections)
+        self.handshake_lock = asyncio.Lock()
+
+    def get_persistent_state(self) -> bytes:
+        return self.client.get_persistent_state()
+
+    def load_persistent_state(self, state: bytes):
+        self.resume_pending = False
+        self.client.load_persistent_state(state)
+
+    async def _post(self, path: str, **kwargs: Any):
+        async with self.semaphore:
+            r = await asyncio.to_thread(self.client.session.post, f"{self.client.base_url}{path}", timeout=self.client.timeout, **kwargs)
+        return r.status_code, r.content
+
+    async def handshake(self):
+        status_code, content = await self._post("/node/connect", json=self.client.get_handshake_request())
+        await asyncio.to_thread(self.client.complete_handshake, status_code, content)
+
+    async def ensure(self):
+        if not self.resume_pending and not self.client.need_handshake():
+            return
+
+        async with self.handshake_lock:
+            if self.resume_pending:
+                self.resume_pending = False
+                await asyncio.to_thread(self.client.resume_session)
+            if not self.client.need_handshake():
+                return
+            self.client.reset()
+            await self.handshake()
+
+    async def send(self, data: dict[Any, Any]):
+        await self.ensure()
+        connection_id = self.client.channel.connection_id
+        status_code, content = await self._post("/node/send", data=self.client.encode_message(data))
+        if status_code != 200 and await self.rejected_resumed_session(status_code, connection_id):
+            status_code, content = await self._post("/node/send", data=self.client.encode_message(data))
+        elif status_code == 200:
+            self.client.resumed = False
+        return self.client.decode_response(status_code, content)
+
+    async def rejected_resumed_session(self, status_code: int, connection_id: int):
+        if not 400 <= status_code < 500:
+            return False
+
+        async with self.handshake_lock:
+            if self.client.channel.connection_id != connection_id:
+                return True
+            if not self.client.resumed:
+                return False
+
+            self.client.reset()
+            await self.handshake()
+            return True
+
+    async def close(self):
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):  # type: ignore
+        await self.close()
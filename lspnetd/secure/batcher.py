@@ -0,0 +1,171 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+from lspnetd.secure.http_client import SecureChannelHTTPClient
+from lspnetd.common.logger import get_logger
+
+
+logger = get_logger("batcher")
+
+# {"$batch": [msg, ...]} -> {"$batch": [reply, ...]}, replies are in request order
+BATCH_KEY = "$batch"
+# advertised by controllers that accept the envelope above, otherwise messages are sent one by one
+BATCH_FEATURE = "batch"
+
+
+class _PendingMessage:
+    __slots__ = ("payload", "future", "callback")
+
+    def __init__(self, payload: str, future: Future[Any] | None, callback: Callable[[Any], None] | None):
+        self.payload = payload
+        self.future = future
+        self.callback = callback
+
+
+class SecureChannelBatcher:
+    """
+    Coalesces queued messages into one encrypted envelope per round-trip.
+    A batch is sent when it reaches `max_messages` or `max_bytes` of JSON, or when its oldest message is `max_delay` seconds old.
+    """
+
+    def __init__(self, client: SecureChannelHTTPClient, max_messages: int = 64, max_bytes: int = 256 * 1024, max_delay: float = 0.05):
+        self.client = client
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+
+        self.queue: list[_PendingMessage] = []
+        self.queue_bytes = 0
+        self.oldest_at = 0.0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.send_lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def _enqueue(self, data: Any, future: Future[Any] | None, callback: Callable[[Any], None] | None):
+        # serialized once here, the envelope is assembled by joining the pieces
+        payload = json.dumps(data)
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("batcher is closed")
+            if not self.queue:
+                self.oldest_at = time.monotonic()
+            self.queue.append(_PendingMessage(payload, future, callback))
+            self.queue_bytes += len(payload)
+            # first message starts the max_delay timer of an idle worker
+            if len(self.queue) == 1 or len(self.queue) >= self.max_messages or self.queue_bytes >= self.max_bytes:
+                self.cond.notify()
+
+    def submit(self, data: Any) -> Future[Any]:
+        "queue a message and get a future resolving to its reply"
+
+        future: Future[Any] = Future()
+        self._enqueue(data, future, None)
+        return future
+
+    async def asubmit(self, data: Any):
+        return await asyncio.wrap_future(self.submit(data))
+
+    def post(self, data: Any, callback: Callable[[Any], None] | None = None):
+        "fire-and-forget. callback, if given, is called with the reply from the batcher thread"
+
+        self._enqueue(data, None, callback)
+
+    def _take(self):
+        batch = self.queue[:self.max_messages]
+        self.queue = self.queue[self.max_messages:]
+        self.queue_bytes = sum(len(m.payload) for m in self.queue)
+        self.oldest_at = time.monotonic()
+        return batch
+
+    def _send(self, batch: list[_PendingMessage]):
+        # claim futures so ones cancelled while queued are dropped instead of sent
+        batch = [m for m in batch if m.future is None or m.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        with self.send_lock:
+            try:
+                self.client.ensure()
+                if BATCH_FEATURE not in self.client.features:
+                    for m in batch:
+                        self._send_one(m)
+                    return
+
+                envelope = '{{"{}":[{}]}}'.format(BATCH_KEY, ','.join(m.payload for m in batch))
+                replies = self.client.send_plaintext(envelope.encode())[BATCH_KEY]
+                if len(replies) != len(batch):
+                    raise RuntimeError("batch reply size mismatch: sent {} got {}".format(len(batch), len(replies)))
+            except Exception as e:
+                for m in batch:
+                    self._fail(m, e)
+                return
+
+        for m, reply in zip(batch, replies):
+            self._reply(m, reply)
+
+    def _send_one(self, m: _PendingMessage):
+        try:
+            reply = self.client.send_plaintext(m.payload.encode())
+        except Exception as e:
+            self._fail(m, e)
+            return
+        self._reply(m, reply)
+
+    def _fail(self, m: _PendingMessage, e: Exception):
+        if m.future is None:
+            logger.warning("failed to send fire-and-forget message: {}".format(e))
+        elif not m.future.done():
+            m.future.set_exception(e)
+
+    def _reply(self, m: _PendingMessage, reply: Any):
+        if m.future is not None:
+            m.future.set_result(reply)
+        elif m.callback is not None:
+            try:
+                m.callback(reply)
+            except Exception:
+                logger.exception("batch reply callback failed")
+
+    def flush(self):
+        "send everything queued right now, in the calling thread"
+
+        while True:
+            with self.cond:
+                batch = self._take()
+            if not batch:
+                return
+            self._send(batch)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.closed:
+                    if len(self.queue) >= self.max_messages or self.queue_bytes >= self.max_bytes:
+                        break
+                    if self.queue:
+                        wait = self.oldest_at + self.max_delay - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self.cond.wait(wait)
+                    else:
+                        self.cond.wait()
+
+                if self.closed and not self.queue:
+                    return
+                batch = self._take()
+
+            self._send(batch)
+
+    def close(self):
+        "flush pending messages and stop the batcher thread"
+
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.worker.join()
+        self.flush()
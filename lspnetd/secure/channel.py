@@ -1,5 +1,6 @@
 import hashlib
 import secrets
+import threading
 import time
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
@@ -7,7 +8,38 @@ from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from .message import SecureMessage
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from typing import BinaryIO, Iterable, Iterator
+from .message import SecureMessage, SecureMessageV2
+from .stream import (DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE, RECORD_AAD_SUFFIX, RECORD_FINAL_FLAG, RECORD_LENGTH,
+                     STREAM_HEADER, STREAM_SIGNATURE_SIZE, StreamReader, iter_source_chunks)
+
+
+REPLAY_WINDOW_SIZE = 64
+# receive keys of recent peer epochs kept around for messages still in flight after a rekey
+MAX_PEER_EPOCHS = 4
+
+
+class ReplayWindow:
+    __slots__ = ("highest", "bitmap")
+
+    def __init__(self):
+        self.highest = -1
+        self.bitmap = 0
+
+    def check(self, counter: int) -> bool:
+        if counter > self.highest:
+            return True
+        offset = self.highest - counter
+        return offset < REPLAY_WINDOW_SIZE and not (self.bitmap >> offset) & 1
+
+    def update(self, counter: int):
+        if counter > self.highest:
+            shift = counter - self.highest
+            self.bitmap = ((self.bitmap << shift) | 1) & ((1 << REPLAY_WINDOW_SIZE) - 1)
+            self.highest = counter
+        else:
+            self.bitmap |= 1 << (self.highest - counter)
 
 
 class SecureChannelClient:
@@ -21,10 +53,28 @@ class SecureChannelClient:
         self.shared_secret: bytes = b''
         self.connection_id: int = 0
 
+        # v1: per-message HKDF + Ed25519 signature. v2: per-direction session keys, counter nonces
+        self.version = 1
+        self.send_epoch = b''
+        self.send_cipher: AESGCM | None = None
+        self.send_counter = 0
+        self.send_lock = threading.Lock()
+        self.recv_lock = threading.Lock()
+        # peer epoch -> (cipher, replay window)
+        self.recv_ciphers: dict[bytes, tuple[AESGCM, ReplayWindow]] = {}
+        # newest peer epoch accepted in this session. unknown epochs at or below it are never accepted again
+        self.recv_newest_epoch = b''
+
     def reset(self):
         self.handshake_private_key = X25519PrivateKey.generate()
         self.shared_secret = b''
         self.connection_id = 0
+        self.version = 1
+        self.send_epoch = b''
+        self.send_cipher = None
+        self.send_counter = 0
+        self.recv_ciphers = {}
+        self.recv_newest_epoch = b''
 
     def get_handshake(self):
         if not self.handshake_private_key:
@@ -98,3 +148,153 @@ class SecureChannelClient:
 
         plaintext_bytes = decryptor.update(message.ciphertext) + decryptor.finalize()
         return plaintext_bytes
+
+    def _derive_session_key(self, epoch: bytes, sender_sign_key_hash: str):
+        return AESGCM(HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=epoch,
+            info=b"SecureChannelv2" + bytes.fromhex(sender_sign_key_hash),
+        ).derive(self.shared_secret))
+
+    def enable_session_keys(self):
+        "switch to v2 with a fresh send epoch and no known peer epochs"
+
+        if not self.shared_secret:
+            raise ValueError('Handshake not completed')
+
+        self.version = 2
+        self.recv_ciphers = {}
+        self.recv_newest_epoch = b''
+        self.rekey()
+
+    def rekey(self):
+        """
+        Start a new send epoch. Epochs are nanosecond timestamps followed by random bytes, so they strictly increase
+        across restarts of a resumed session and counters never repeat under one key.
+        """
+
+        with self.send_lock:
+            previous = int.from_bytes(self.send_epoch[:8], 'big') if self.send_epoch else 0
+            self.send_epoch = max(time.time_ns(), previous + 1).to_bytes(8, 'big') + secrets.token_bytes(8)
+            self.send_cipher = self._derive_session_key(self.send_epoch, self.sign_key_hash)
+            self.send_counter = 0
+
+    def encrypt_v2(self, plaintext_bytes: bytes):
+        if self.send_cipher is None:
+            raise ValueError('Session keys not enabled')
+
+        with self.send_lock:
+            counter = self.send_counter
+            self.send_counter += 1
+            epoch, cipher = self.send_epoch, self.send_cipher
+
+        message = SecureMessageV2(cid=self.connection_id, epoch=epoch, counter=counter, ciphertext=b'')
+        nonce = counter.to_bytes(12, 'big')
+        message.ciphertext = cipher.encrypt(nonce, plaintext_bytes, message.get_associated_data())
+        return message
+
+    def decrypt_v2(self, message: SecureMessageV2):
+        if not self.shared_secret or self.version != 2:
+            raise ValueError('Session keys not enabled')
+        if message.cid != self.connection_id:
+            raise ValueError('Connection id mismatch')
+
+        with self.recv_lock:
+            entry = self.recv_ciphers.get(message.epoch)
+            if entry is None and message.epoch <= self.recv_newest_epoch:
+                # evicted or never seen, a fresh replay window would accept old messages again
+                raise ValueError('Stale epoch')
+
+            cipher, window = entry if entry else (self._derive_session_key(message.epoch, self.peer_sign_key_hash), ReplayWindow())
+            if not window.check(message.counter):
+                raise ValueError('Replayed message')
+
+            plaintext_bytes = cipher.decrypt(message.counter.to_bytes(12, 'big'), message.ciphertext, message.get_associated_data())  # raise exception if invalid
+
+            window.update(message.counter)
+            if entry is None:
+                # only a message authenticated under the new epoch announces it
+                if len(self.recv_ciphers) >= MAX_PEER_EPOCHS:
+                    self.recv_ciphers.pop(next(iter(self.recv_ciphers)))
+                self.recv_ciphers[message.epoch] = (cipher, window)
+                self.recv_newest_epoch = message.epoch
+            return plaintext_bytes
+
+    def _derive_stream_key(self, salt: bytes, sender_sign_key_hash: str):
+        return AESGCM(HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            info=b"SecureChannelStream" + bytes.fromhex(sender_sign_key_hash),
+        ).derive(self.shared_secret))
+
+    def encrypt_stream(self, source: Iterable[bytes] | BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Encrypt a payload of unknown size chunk by chunk. Each chunk is sealed with its sequence number and a
+        final flag in the associated data, so reordered, dropped or truncated chunks fail to decrypt.
+        Memory use is bounded by chunk_size.
+        """
+
+        if not self.shared_secret:
+            raise ValueError('Handshake not completed')
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError('Invalid chunk size {}'.format(chunk_size))
+
+        salt = secrets.token_bytes(32)
+        nonce_prefix = secrets.token_bytes(4)
+        header = STREAM_HEADER.pack(self.connection_id, int(time.time() * 1000), salt, nonce_prefix, chunk_size)
+        cipher = self._derive_stream_key(salt, self.sign_key_hash)
+        yield header + self.private_sign_key.sign(header)
+
+        def seal(seq: int, chunk: bytes, final: bool):
+            ciphertext = cipher.encrypt(nonce_prefix + seq.to_bytes(8, 'big'), chunk, header + RECORD_AAD_SUFFIX.pack(seq, final))
+            return RECORD_LENGTH.pack(len(ciphertext) | (RECORD_FINAL_FLAG if final else 0)) + ciphertext
+
+        # one chunk of look-ahead to know which one is final
+        seq = 0
+        previous: bytes | None = None
+        for chunk in iter_source_chunks(source, chunk_size):
+            if previous is not None:
+                yield seal(seq, previous, False)
+                seq += 1
+            previous = chunk
+        yield seal(seq, previous or b'', True)
+
+    def decrypt_stream(self, source: Iterable[bytes] | BinaryIO) -> Iterator[bytes]:
+        if not self.shared_secret:
+            raise ValueError('Handshake not completed')
+
+        reader = StreamReader(source)
+        header = reader.read_exact(STREAM_HEADER.size)
+        signature = reader.read_exact(STREAM_SIGNATURE_SIZE)
+        self.peer_public_sign_key.verify(signature, header)  # raise exception if invalid
+
+        cid, _, salt, nonce_prefix, chunk_size = STREAM_HEADER.unpack(header)
+        if cid != self.connection_id:
+            raise ValueError('Connection id mismatch')
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError('Invalid chunk size {}'.format(chunk_size))
+
+        cipher = self._derive_stream_key(salt, self.peer_sign_key_hash)
+        seq = 0
+        while True:
+            record_length = RECORD_LENGTH.unpack(reader.read_exact(RECORD_LENGTH.size))[0]
+            # the flag is also part of the associated data, flipping it fails authentication
+            final = bool(record_length & RECORD_FINAL_FLAG)
+            record_size = record_length & ~RECORD_FINAL_FLAG
+            if record_size > chunk_size + 16:
+                raise ValueError('Oversized stream record {}'.format(record_size))
+            ciphertext = reader.read_exact(record_size)
+
+            nonce = nonce_prefix + seq.to_bytes(8, 'big')
+            plaintext = cipher.decrypt(nonce, ciphertext, header + RECORD_AAD_SUFFIX.pack(seq, final))  # raise exception if invalid
+
+            if plaintext:
+                yield plaintext
+            if final:
+                break
+            seq += 1
+
+        if not reader.at_eof():
+            raise ValueError('Trailing data after final stream record')
@@ -1,30 +1,53 @@
 import base64
 import json
+import threading
 import time
-from typing import Any
+from typing import Any, BinaryIO, Iterable, Iterator
 import requests
+from requests.adapters import HTTPAdapter
 from lspnetd.secure.channel import SecureChannelClient
-from lspnetd.secure.message import SecureMessage
+from lspnetd.secure.message import SecureMessage, SecureMessageV2
+from lspnetd.secure.stream import DEFAULT_CHUNK_SIZE
+from lspnetd.config.session import SecureSessionStore
+from lspnetd.common.logger import get_logger
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
 from pydantic import BaseModel
 
 
+logger = get_logger("http_client")
+
+
 class HandshakeResponseSchema(BaseModel):
     cid: int
     key: str
     sign: str
     data: str
+    # negotiated channel version, controllers without v2 support do not send it
+    version: int = 1
+    # optional protocol extensions the controller accepts, e.g. "batch"
+    features: list[str] = []
 
 
 class SecureChannelHTTPClient:
     def __init__(self, client_hostname: str, domain: str, 
                  client_private_sign_key_der_bytes: bytes,
-                 peer_public_sign_key_der_bytes: bytes):
+                 peer_public_sign_key_der_bytes: bytes,
+                 *, scheme: str = "https", pool_size: int = 10, timeout: float = 30, protocol_version: int = 1,
+                 session_store: SecureSessionStore | None = None):
         self.name = client_hostname
+        self.protocol_version = protocol_version
         self.domain = domain
+        self.base_url = f"{scheme}://{domain}"
+        self.timeout = timeout
         self.issue_at = 0
         self.expire_at = 0
+        self.handshake_lock = threading.Lock()
+        self.features: set[str] = set()
+
+        # keep-alive connections to the controller, shared by all requests of this client
+        self.session = requests.Session()
+        self.session.mount(f"{scheme}://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
 
         client_private_sign_key = serialization.load_der_private_key(client_private_sign_key_der_bytes, None)
         peer_public_sign_key = serialization.load_der_public_key(peer_public_sign_key_der_bytes)
@@ -33,31 +56,59 @@ class SecureChannelHTTPClient:
         assert isinstance(peer_public_sign_key, Ed25519PublicKey), "invalid peer public sign key"
 
         self.channel = SecureChannelClient(client_private_sign_key, peer_public_sign_key)
-    
+
+        # session loaded from the store and not yet accepted by the controller
+        self.resumed = False
+        self.session_store = session_store
+        if session_store is not None:
+            self.resume_session()
+
+    def resume_session(self):
+        "pick up the session saved in session_store for this client and domain, if any"
+
+        assert self.session_store is not None
+        state = self.session_store.load(self.name, self.domain)
+        if state:
+            logger.info("resuming secure session with {}".format(self.domain))
+            self.load_persistent_state(state)
+            self.resumed = True
+
     def get_persistent_state(self) -> bytes:
         if self.issue_at == 0:
             return b""
         
-        return self.issue_at.to_bytes(8, 'big') + self.expire_at.to_bytes(8, 'big') + self.channel.connection_id.to_bytes(8, 'big') + self.channel.shared_secret
+        return self.issue_at.to_bytes(8, 'big') + self.expire_at.to_bytes(8, 'big') + self.channel.connection_id.to_bytes(8, 'big') + self.channel.shared_secret + self.channel.version.to_bytes(1, 'big') + ','.join(sorted(self.features)).encode()
 
     def load_persistent_state(self, state: bytes):
         self.issue_at = int.from_bytes(state[:8], 'big')
         self.expire_at = int.from_bytes(state[8:16], 'big')
         self.channel.connection_id = int.from_bytes(state[16:24], 'big')
-        self.channel.shared_secret = state[24:]
+        # X25519 shared secret is 32 bytes. states written before v2 existed have no version byte
+        self.channel.shared_secret = state[24:56]
         self.channel.handshake_private_key = None
+        if len(state) > 56 and state[56] == 2:
+            self.channel.enable_session_keys()
+        self.features = set(filter(None, state[57:].decode().split(',')))
 
-    def handshake(self):
+    def close(self):
+        self.session.close()
+
+    def get_handshake_request(self):
         handshake_bytes, handshake_sign_bytes = self.channel.get_handshake()
-        r = requests.post(f"https://{self.domain}/node/connect", json={
+        request: dict[str, Any] = {
             "name": self.name,
             "key": base64.b64encode(handshake_bytes).decode(),
             "sign": base64.b64encode(handshake_sign_bytes).decode(),
-        })
-        if r.status_code != 200:
-            raise RuntimeError(f"Handshake failed. status: {r.status_code} body: {r.content.decode()}")
+        }
+        if self.protocol_version > 1:
+            request["version"] = self.protocol_version
+        return request
+
+    def complete_handshake(self, status_code: int, content: bytes):
+        if status_code != 200:
+            raise RuntimeError(f"Handshake failed. status: {status_code} body: {content.decode()}")
 
-        response = HandshakeResponseSchema.model_validate_json(r.content)
+        response = HandshakeResponseSchema.model_validate_json(content)
         self.channel.complete_handshake(
             peer_public_key_bytes=base64.b64decode(response.key),
             peer_public_key_sign_bytes=base64.b64decode(response.sign),
@@ -69,26 +120,115 @@ class SecureChannelHTTPClient:
         self.issue_at = int(first_message["iat"])
         self.expire_at = int(first_message["exp"])
 
-    def ensure(self):
-        if time.time() + 60 < self.expire_at:
-            return
-        
+        if min(response.version, self.protocol_version) >= 2:
+            self.channel.enable_session_keys()
+        self.features = set(response.features)
+
+        if self.session_store is not None:
+            self.session_store.save(self.name, self.domain, self.get_persistent_state(), self.expire_at)
+
+    def handshake(self):
+        r = self.session.post(f"{self.base_url}/node/connect", json=self.get_handshake_request(), timeout=self.timeout)
+        self.complete_handshake(r.status_code, r.content)
+
+    def need_handshake(self):
+        return time.time() + 60 >= self.expire_at
+
+    def reset(self):
         self.issue_at = 0
         self.expire_at = 0
+        self.resumed = False
+        self.features = set()
         self.channel.reset()
-        self.handshake()
+
+    def ensure(self):
+        if not self.need_handshake():
+            return
+        
+        with self.handshake_lock:
+            # another thread may have completed the handshake while we were waiting
+            if not self.need_handshake():
+                return
+            self.reset()
+            self.handshake()
+
+    def rejected_resumed_session(self, status_code: int, connection_id: int):
+        """
+        A resumed session may have been forgotten by the controller. On a client error for it, do a fresh handshake
+        and return True so the caller retries once.
+        """
+
+        if not 400 <= status_code < 500:
+            return False
+
+        with self.handshake_lock:
+            if self.channel.connection_id != connection_id:
+                # another thread already replaced the session
+                return True
+            if not self.resumed:
+                return False
+
+            logger.warning("controller rejected resumed session (status {}), doing a new handshake".format(status_code))
+            self.reset()
+            self.handshake()
+            return True
+
+    def encode_message(self, data: dict[Any, Any]):
+        return self.encode_plaintext(json.dumps(data).encode())
+
+    def encode_plaintext(self, plaintext_bytes: bytes):
+        if self.channel.version == 2:
+            return self.channel.encrypt_v2(plaintext_bytes).to_bytes()
+
+        sec_message = self.channel.encrypt(plaintext_bytes)
+        return sec_message.to_bytes()
+
+    def decode_response(self, status_code: int, content: bytes):
+        if status_code != 200:
+            raise RuntimeError(f"Failed to send message. status: {status_code} body: {content.decode()}")
+
+        if self.channel.version == 2:
+            plaintext_bytes = self.channel.decrypt_v2(SecureMessageV2.from_bytes(content))
+        else:
+            plaintext_bytes = self.channel.decrypt(SecureMessage.from_bytes(content))
+        return json.loads(plaintext_bytes)
 
     def send(self, data: dict[Any, Any]):
+        return self.send_plaintext(json.dumps(data).encode())
+
+    def send_plaintext(self, plaintext_bytes: bytes):
+        "send already serialized JSON"
+
         self.ensure()
-        plaintext_bytes = json.dumps(data).encode()
-        sec_message = self.channel.encrypt(plaintext_bytes)
-        payload = sec_message.to_bytes()
+        connection_id = self.channel.connection_id
+        r = self.session.post(f"{self.base_url}/node/send", data=self.encode_plaintext(plaintext_bytes), timeout=self.timeout)
+        if r.status_code != 200 and self.rejected_resumed_session(r.status_code, connection_id):
+            r = self.session.post(f"{self.base_url}/node/send", data=self.encode_plaintext(plaintext_bytes), timeout=self.timeout)
+        elif r.status_code == 200:
+            self.resumed = False
+        return self.decode_response(r.status_code, r.content)
+
+    def send_stream(self, source: dict[Any, Any] | Iterable[bytes] | BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Stream a large payload to /node/stream as chunked AEAD records and return an iterator over the decrypted response.
+        The request is sent before this returns. dict payloads are JSON-encoded incrementally.
+        The response must be consumed before the next request.
+        """
 
-        r = requests.post(f"https://{self.domain}/node/send", data=payload)
+        self.ensure()
+        if isinstance(source, dict):
+            source = (piece.encode() for piece in json.JSONEncoder().iterencode(source))
+
+        r = self.session.post(f"{self.base_url}/node/stream", data=self.channel.encrypt_stream(source, chunk_size),
+                              headers={"Content-Type": "application/octet-stream"}, stream=True, timeout=self.timeout)
         if r.status_code != 200:
-            raise RuntimeError(f"Failed to send message. status: {r.status_code} body: {r.content.decode()}")
+            body = r.content.decode()
+            r.close()
+            raise RuntimeError(f"Failed to send stream. status: {r.status_code} body: {body}")
+        return self._iter_stream_response(r, chunk_size)
 
-        response_bytes = r.content
-        sec_message = SecureMessage.from_bytes(response_bytes)
-        plaintext_bytes = self.channel.decrypt(sec_message)
-        return json.loads(plaintext_bytes)
+    def _iter_stream_response(self, r: requests.Response, chunk_size: int):
+        try:
+            yield from self.channel.decrypt_stream(r.iter_content(chunk_size))
+        finally:
+            r.close()
@@ -1,4 +1,16 @@
-from dataclasses import dataclass
+import struct
+from dataclasses import dataclass, field
+from typing import Any
+
+
+SIGNATURE_SIZE = 64
+SALT_SIZE = 32
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
+# signature | cid | timestamp | salt | nonce | tag | ciphertext
+FRAME_HEADER = struct.Struct(">64sQQ32s12s16s")
+SIGNED_OFFSET = SIGNATURE_SIZE
 
 
 @dataclass
@@ -8,25 +20,81 @@ class SecureMessage:
     # HKDF
     salt: bytes
     # AES256GCM
-    ciphertext: bytes
+    ciphertext: bytes | memoryview
     nonce: bytes
     tag: bytes
     # Signature of plaintext
     signature: bytes
+    # serialized frame, built once and shared by get_bytes_to_sign and to_bytes. dropped when a signed field changes.
+    _frame: bytearray | memoryview | None = field(default=None, init=False, repr=False, compare=False)
+
+    def __setattr__(self, name: str, value: Any):
+        if name != 'signature' and name != '_frame':
+            object.__setattr__(self, '_frame', None)
+        object.__setattr__(self, name, value)
+
+    def _get_frame(self):
+        if self._frame is None:
+            if len(self.salt) != SALT_SIZE or len(self.nonce) != NONCE_SIZE or len(self.tag) != TAG_SIZE:
+                raise ValueError("invalid field size: salt {} nonce {} tag {}".format(len(self.salt), len(self.nonce), len(self.tag)))
 
-    def get_bytes_to_sign(self) -> bytes:
-        return self.cid.to_bytes(8, 'big') + self.timestamp.to_bytes(8, 'big') + self.salt + self.nonce + self.tag + self.ciphertext
+            frame = bytearray(FRAME_HEADER.size + len(self.ciphertext))
+            FRAME_HEADER.pack_into(frame, 0, b'', self.cid, self.timestamp, self.salt, self.nonce, self.tag)
+            frame[FRAME_HEADER.size:] = self.ciphertext
+            self._frame = frame
+        return self._frame
+
+    def get_bytes_to_sign(self) -> memoryview:
+        return memoryview(self._get_frame())[SIGNED_OFFSET:]
 
     def to_bytes(self) -> bytes:
-        return self.signature + self.cid.to_bytes(8, 'big') + self.timestamp.to_bytes(8, 'big') + self.salt + self.nonce + self.tag + self.ciphertext
+        frame = self._get_frame()
+        if len(self.signature) != SIGNATURE_SIZE:
+            raise ValueError("invalid signature size: {}".format(len(self.signature)))
+
+        if isinstance(frame, bytearray):
+            frame[:SIGNATURE_SIZE] = self.signature
+            return bytes(frame)
+        return bytes(self.signature) + bytes(frame[SIGNED_OFFSET:])
 
     @classmethod
-    def from_bytes(cls, data: bytes):
-        signature = data[:64]
-        cid = int.from_bytes(data[64:72], 'big')
-        timestamp = int.from_bytes(data[72:80], 'big')
-        salt = data[80:112]
-        nonce = data[112:124]
-        tag = data[124:140]
-        ciphertext = data[140:]
-        return cls(cid, timestamp, salt, ciphertext, nonce, tag, signature)
+    def from_bytes(cls, data: bytes | bytearray | memoryview):
+        view = memoryview(data)
+        if len(view) < FRAME_HEADER.size:
+            raise ValueError("truncated message: {} bytes, at least {} expected".format(len(view), FRAME_HEADER.size))
+
+        signature, cid, timestamp, salt, nonce, tag = FRAME_HEADER.unpack_from(view)
+        # ciphertext and the signed region stay views into the received buffer
+        message = cls(cid, timestamp, salt, view[FRAME_HEADER.size:], nonce, tag, signature)
+        message._frame = view
+        return message
+
+
+# cid | epoch | counter | ciphertext+tag
+FRAME_V2_HEADER = struct.Struct(">Q16sQ")
+
+
+@dataclass
+class SecureMessageV2:
+    cid: int
+    # sender key epoch, HKDF salt of the sender's direction key. strictly increasing within a session
+    epoch: bytes
+    counter: int
+    # AES256GCM ciphertext with 16 bytes tag appended
+    ciphertext: bytes | memoryview
+
+    def get_associated_data(self) -> bytes:
+        return FRAME_V2_HEADER.pack(self.cid, self.epoch, self.counter)
+
+    def to_bytes(self) -> bytes:
+        # bytes + buffer copies the ciphertext exactly once
+        return self.get_associated_data() + self.ciphertext
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview):
+        view = memoryview(data)
+        if len(view) < FRAME_V2_HEADER.size + TAG_SIZE:
+            raise ValueError("truncated message: {} bytes, at least {} expected".format(len(view), FRAME_V2_HEADER.size + TAG_SIZE))
+
+        cid, epoch, counter = FRAME_V2_HEADER.unpack_from(view)
+        return cls(cid, epoch, counter, view[FRAME_V2_HEADER.size:])
@@ -0,0 +1,67 @@
+import struct
+from typing import BinaryIO, Iterable, Iterator
+
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# cid | timestamp | salt | nonce prefix | chunk size, followed by the sender's signature over it
+STREAM_HEADER = struct.Struct(">Q Q 32s 4s I")
+STREAM_SIGNATURE_SIZE = 64
+# each record: ciphertext length (high bit: final record) | ciphertext+tag. AAD is header | seq | final flag
+RECORD_LENGTH = struct.Struct(">I")
+RECORD_FINAL_FLAG = 0x80000000
+RECORD_AAD_SUFFIX = struct.Struct(">QB")
+
+
+def iter_source_chunks(source: Iterable[bytes] | BinaryIO, chunk_size: int) -> Iterator[bytes]:
+    "re-chunk an iterable of bytes or a binary file object into pieces of exactly chunk_size (the last one may be shorter)"
+
+    read = getattr(source, "read", None)
+    if read is not None:
+        while True:
+            data = read(chunk_size)
+            if not data:
+                return
+            yield data
+        return
+
+    buffer = bytearray()
+    for data in source:  # type: ignore
+        buffer += data
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class StreamReader:
+    "pull exact-size reads out of an iterable of bytes or a binary file object, buffering at most one incoming piece"
+
+    def __init__(self, source: Iterable[bytes] | BinaryIO):
+        self.read_func = getattr(source, "read", None)
+        self.iterator = None if self.read_func is not None else iter(source)  # type: ignore
+        self.buffer = bytearray()
+
+    def _fill(self, size: int):
+        while len(self.buffer) < size:
+            if self.read_func is not None:
+                data = self.read_func(size - len(self.buffer))
+            else:
+                assert self.iterator is not None
+                data = next(self.iterator, b'')
+            if not data:
+                return False
+            self.buffer += data
+        return True
+
+    def read_exact(self, size: int) -> bytes:
+        if not self._fill(size):
+            raise ValueError("truncated stream: expected {} more bytes, got {}".format(size, len(self.buffer)))
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def at_eof(self):
+        return not self._fill(1)
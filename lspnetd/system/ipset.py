@@ -0,0 +1,283 @@
+import ipaddress
+import json
+from dataclasses import dataclass, field
+from lspnetd.common.expression import PortSet
+from lspnetd.common.logger import get_logger
+from lspnetd.common.utils import ns_wrap, sudo_call_input, sudo_call_output
+
+
+logger = get_logger("ipset")
+
+IPSET_NAME_MAX = 31
+
+
+def _normalize_network(address: str):
+    return str(ipaddress.ip_network(address, strict=False))
+
+
+def _network_version(name: str, networks: list[str]):
+    "4 or 6. a set holds one address family, mixed input is rejected"
+
+    versions = set(ipaddress.ip_network(network, strict=False).version for network in networks)
+    if len(versions) > 1:
+        raise ValueError("set {} mixes IPv4 and IPv6 networks, use one set per family".format(name))
+    return versions.pop() if versions else 4
+
+
+@dataclass
+class IpsetState:
+    set_type: str
+    options: list[str]
+    members: list[str]
+
+
+def parse_ipset_save(output: str):
+    "`ipset save` output -> {set name: IpsetState}"
+
+    sets: dict[str, IpsetState] = {}
+    for line in output.splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and parts[0] == 'create':
+            sets[parts[1]] = IpsetState(parts[2], parts[3:], [])
+        elif len(parts) >= 3 and parts[0] == 'add' and parts[1] in sets:
+            sets[parts[1]].members.append(parts[2])
+    return sets
+
+
+@dataclass
+class IpSet:
+    """
+    Desired content of one ipset. hash:net sets hold networks, bitmap:port sets hold ports.
+    A single `-m set --match-set` rule matches against all members with one hash or bitmap lookup.
+    """
+    name: str
+    set_type: str
+    family: str = "inet"
+    networks: list[str] = field(default_factory=list)
+    ports: PortSet = field(default_factory=PortSet)
+
+    @classmethod
+    def of_networks(cls, name: str, networks: list[str], family: str = ''):
+        normalized = sorted(set(_normalize_network(network) for network in networks))
+        network_family = "inet6" if _network_version(name, normalized) == 6 else "inet"
+        if family and normalized and family != network_family:
+            raise ValueError("set {} is family {} but holds {} networks".format(name, family, network_family))
+        return cls(name, "hash:net", family or network_family, networks=normalized)
+
+    @classmethod
+    def of_ports(cls, name: str, ports: PortSet | str):
+        return cls(name, "bitmap:port", ports=PortSet.parse(ports) if isinstance(ports, str) else ports)
+
+    def create_line(self, name: str = ''):
+        if self.set_type == "bitmap:port":
+            return "create {} bitmap:port range 0-65535".format(name or self.name)
+        return "create {} {} family {}".format(name or self.name, self.set_type, self.family)
+
+    def member_lines(self, name: str = ''):
+        if self.set_type == "bitmap:port":
+            return ["add {} {}-{}".format(name or self.name, begin_port, end_port) for begin_port, end_port in self.ports.segments]
+        return ["add {} {}".format(name or self.name, network) for network in self.networks]
+
+    def plan(self, current: IpsetState | None) -> list[str]:
+        "ipset restore lines turning `current` into this set, empty if nothing changes"
+
+        if current is None:
+            return [self.create_line()] + self.member_lines()
+
+        current_family = current.options[current.options.index("family") + 1] if "family" in current.options else "inet"
+        if current.set_type != self.set_type or (self.set_type != "bitmap:port" and current_family != self.family):
+            # the kernel only swaps sets of the same type and family, and a set referenced by rules can't be destroyed
+            raise ValueError("ipset {} is {} family {}, can't change it to {} family {} in place. remove the rules using it and destroy the set first".format(
+                self.name, current.set_type, current_family, self.set_type, self.family))
+
+        if self.set_type == "bitmap:port":
+            current_ports = PortSet.parse(",".join(current.members))
+            return (["del {} {}-{}".format(self.name, b, e) for b, e in (current_ports - self.ports).segments] +
+                    ["add {} {}-{}".format(self.name, b, e) for b, e in (self.ports - current_ports).segments])
+
+        current_networks = set(_normalize_network(member) for member in current.members)
+        desired_networks = set(self.networks)
+        return (["del {} {}".format(self.name, network) for network in sorted(current_networks - desired_networks)] +
+                ["add {} {}".format(self.name, network) for network in sorted(desired_networks - current_networks)])
+
+    def match_args(self, direction: str = "src"):
+        "iptables arguments matching packets against this set. For port sets, direction picks source or destination port."
+        return ["-m", "set", "--match-set", self.name, direction]
+
+
+class IpsetCollection:
+    "ipsets of one namespace, synced with one `ipset save` and at most one `ipset restore`"
+
+    def __init__(self, namespace: str = ''):
+        self.namespace = namespace
+        self.sets: dict[str, IpSet] = {}
+
+    def add_set(self, ipset: IpSet):
+        if len(ipset.name) > IPSET_NAME_MAX:
+            raise ValueError("ipset name too long: {}".format(ipset.name))
+        self.sets[ipset.name] = ipset
+        return ipset
+
+    def snapshot(self):
+        return parse_ipset_save(sudo_call_output(ns_wrap(self.namespace, ["ipset", "save"])))
+
+    def plan(self, snapshot: dict[str, IpsetState]):
+        lines: list[str] = []
+        for ipset in self.sets.values():
+            lines.extend(ipset.plan(snapshot.get(ipset.name)))
+        return ''.join(line + '\n' for line in lines)
+
+    def sync(self):
+        "returns True if anything changed. Chains are never touched, rules referencing the sets see new members immediately."
+
+        restore_input = self.plan(self.snapshot())
+        if not restore_input:
+            return False
+
+        logger.info("applying ipset delta in {!r}: {} lines".format(self.namespace, restore_input.count('\n')))
+        sudo_call_input(ns_wrap(self.namespace, ["ipset", "restore", "-exist"]), restore_input)
+        return True
+
+
+NFT_ADDRESS_TYPES = {"ipv4_addr": 4, "ipv6_addr": 6}
+
+
+def _parse_nft_address_element(element: object) -> list[str]:
+    if isinstance(element, str):
+        return [_normalize_network(element)]
+    if isinstance(element, dict):
+        if "prefix" in element:
+            return [_normalize_network("{}/{}".format(element["prefix"]["addr"], element["prefix"]["len"]))]
+        if "range" in element:
+            begin, end = element["range"]
+            return [str(network) for network in ipaddress.summarize_address_range(ipaddress.ip_address(begin), ipaddress.ip_address(end))]
+        if "elem" in element:
+            return _parse_nft_address_element(element["elem"]["val"])
+    raise ValueError("unsupported nft set element: {!r}".format(element))
+
+
+def _parse_nft_port_element(element: object) -> tuple[int, int]:
+    if isinstance(element, int):
+        return element, element
+    if isinstance(element, dict):
+        if "range" in element:
+            return int(element["range"][0]), int(element["range"][1])
+        if "elem" in element:
+            return _parse_nft_port_element(element["elem"]["val"])
+    raise ValueError("unsupported nft set element: {!r}".format(element))
+
+
+def parse_nft_sets(output: str):
+    "`nft -j list ruleset` output -> {(family, table, set name): (type, elements)}. Elements are network strings or port ranges."
+
+    sets: dict[tuple[str, str, str], tuple[str, list[str] | list[tuple[int, int]]]] = {}
+    for item in json.loads(output or '{}').get("nftables", []):
+        nft_set = item.get("set")
+        if nft_set is None:
+            continue
+        set_type = nft_set["type"]
+        elements = nft_set.get("elem", [])
+        if set_type in NFT_ADDRESS_TYPES:
+            sets[(nft_set["family"], nft_set["table"], nft_set["name"])] = (set_type, [network for element in elements for network in _parse_nft_address_element(element)])
+        elif set_type == "inet_service":
+            sets[(nft_set["family"], nft_set["table"], nft_set["name"])] = (set_type, [_parse_nft_port_element(element) for element in elements])
+    return sets
+
+
+@dataclass
+class NftSet:
+    "Desired content of one nftables named interval set, ipv4_addr / ipv6_addr networks or inet_service ports"
+    table: str
+    name: str
+    set_type: str
+    family: str = "inet"
+    networks: list[str] = field(default_factory=list)
+    ports: PortSet = field(default_factory=PortSet)
+
+    @classmethod
+    def of_networks(cls, table: str, name: str, networks: list[str], family: str = "inet"):
+        version = _network_version(name, networks)
+        parsed = [ipaddress.ip_network(network, strict=False) for network in networks]
+        # interval sets reject overlapping elements, collapse them first
+        collapsed = [str(network) for network in ipaddress.collapse_addresses(parsed)]  # type: ignore
+        return cls(table, name, "ipv6_addr" if version == 6 else "ipv4_addr", family, networks=collapsed)
+
+    @classmethod
+    def of_ports(cls, table: str, name: str, ports: PortSet | str, family: str = "inet"):
+        return cls(table, name, "inet_service", family, ports=PortSet.parse(ports) if isinstance(ports, str) else ports)
+
+    @property
+    def key(self):
+        return (self.family, self.table, self.name)
+
+    def _elements(self) -> list[str]:
+        if self.set_type == "inet_service":
+            return [str(b) if b == e else "{}-{}".format(b, e) for b, e in self.ports.segments]
+        return list(self.networks)
+
+    def _element_block(self, elements: list[str]):
+        return "{} {} {} {{ {} }}".format(self.family, self.table, self.name, ", ".join(elements))
+
+    def plan(self, current: tuple[str, list[str] | list[tuple[int, int]]] | None) -> list[str]:
+        "nft -f lines turning `current` into this set, empty if nothing changes"
+
+        lines: list[str] = []
+        desired = self._elements()
+        if current is not None and current[0] != self.set_type:
+            # a set referenced by rules can't be deleted, and the type of an existing set can't change
+            raise ValueError("nft set {} {} {} is {}, can't change it to {} in place. remove the rules using it and delete the set first".format(
+                self.family, self.table, self.name, current[0], self.set_type))
+
+        if current is None:
+            lines.append("add table {} {}".format(self.family, self.table))
+            lines.append("add set {} {} {} {{ type {}; flags interval; }}".format(self.family, self.table, self.name, self.set_type))
+            current_elements: list[str] = []
+        elif self.set_type == "inet_service":
+            current_elements = [str(b) if b == e else "{}-{}".format(b, e) for b, e in current[1]]  # type: ignore
+        else:
+            current_elements = list(current[1])  # type: ignore
+
+        desired_set = set(desired)
+        current_set = set(current_elements)
+        removed = [element for element in current_elements if element not in desired_set]
+        added = [element for element in desired if element not in current_set]
+        # deletes first, an added range may overlap one that is going away
+        if removed:
+            lines.append("delete element " + self._element_block(removed))
+        if added:
+            lines.append("add element " + self._element_block(added))
+        return lines
+
+    def match_expr(self, selector: str):
+        "nft rule expression, e.g. match_expr('ip saddr') -> 'ip saddr @name'"
+        return "{} @{}".format(selector, self.name)
+
+
+class NftSetCollection:
+    "named sets of one namespace, synced with one `nft -j list ruleset` and at most one atomic `nft -f -`"
+
+    def __init__(self, namespace: str = ''):
+        self.namespace = namespace
+        self.sets: dict[tuple[str, str, str], NftSet] = {}
+
+    def add_set(self, nft_set: NftSet):
+        self.sets[nft_set.key] = nft_set
+        return nft_set
+
+    def snapshot(self):
+        return parse_nft_sets(sudo_call_output(ns_wrap(self.namespace, ["nft", "-j", "list", "ruleset"])))
+
+    def plan(self, snapshot: dict[tuple[str, str, str], tuple[str, list[str] | list[tuple[int, int]]]]):
+        lines: list[str] = []
+        for nft_set in self.sets.values():
+            lines.extend(nft_set.plan(snapshot.get(nft_set.key)))
+        return ''.join(line + '\n' for line in lines)
+
+    def sync(self):
+        script = self.plan(self.snapshot())
+        if not script:
+            return False
+
+        logger.info("applying nft set delta in {!r}:\n{}".format(self.namespace, script))
+        sudo_call_input(ns_wrap(self.namespace, ["nft", "-f", "-"]), script)
+        return True
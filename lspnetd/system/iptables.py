@@ -1,5 +1,6 @@
+import shlex
 import subprocess
-from lspnetd.common.utils import sudo_wrap, sudo_call
+from lspnetd.common.utils import ns_wrap, sudo_wrap, sudo_call, sudo_call_input, sudo_call_output
 from lspnetd.common.logger import get_logger
 
 
@@ -45,24 +46,125 @@ def try_flush_iptables_chain(table_name: str, chain_name: str):
         logger.warning(f"Error occured when flush iptables chain {chain_name} table {table_name}, skipping... ({e.stderr})")
 
 
-def ensure_custom_iptables(prefix: str):
-    try_create_iptables_chain("nat", f"{prefix}-POSTROUTING")
-    try_insert_iptables_rule("nat", "POSTROUTING", ["-j", "{}-POSTROUTING".format(prefix)])
-
-    try_create_iptables_chain("nat", f"{prefix}-PREROUTING")
-    try_insert_iptables_rule("nat", "PREROUTING", ["-j", "{}-PREROUTING".format(prefix)])
-
-    try_create_iptables_chain("raw", f"{prefix}-PREROUTING")
-    try_insert_iptables_rule("raw", "PREROUTING", ["-j", "{}-PREROUTING".format(prefix)])
+def parse_iptables_save(output: str):
+    "iptables-save output -> {table: {chain: [rule_args, ...]}}"
+
+    tables: dict[str, dict[str, list[list[str]]]] = {}
+    current: dict[str, list[list[str]]] | None = None
+
+    for line in output.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('*'):
+            current = tables.setdefault(line[1:], {})
+        elif line == 'COMMIT':
+            current = None
+        elif current is None:
+            continue
+        elif line.startswith(':'):
+            current.setdefault(line[1:].split()[0], [])
+        elif line.startswith('-A '):
+            args = shlex.split(line)
+            current.setdefault(args[1], []).append(args[2:])
+
+    return tables
+
+
+def _quote_restore_arg(arg: str):
+    # iptables-restore only understands double quotes
+    if arg and not any(c in arg for c in ' \t"\'\\'):
+        return arg
+    return '"{}"'.format(arg.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+class IptablesRuleset:
+    """
+    Declarative set of custom chains. Rules should be written the way iptables-save prints them
+    (e.g. `-p tcp -m tcp --dport 80`), otherwise the chain is rewritten on every sync.
+    """
+
+    def __init__(self, namespace: str = ''):
+        self.namespace = namespace
+        # (table, chain) -> desired rules. None means only ensure the chain exists and leave its rules alone.
+        self.chains: dict[tuple[str, str], list[list[str]] | None] = {}
+        # (table, builtin chain, custom chain)
+        self.jumps: list[tuple[str, str, str]] = []
+
+    def add_chain(self, table_name: str, chain_name: str, rules: list[list[str]] | None = None, jump_from: str = ''):
+        self.chains[(table_name, chain_name)] = rules
+        if jump_from:
+            self.jumps.append((table_name, jump_from, chain_name))
+
+    def add_rule(self, table_name: str, chain_name: str, rule_args: list[str]):
+        rules = self.chains.get((table_name, chain_name))
+        if rules is None:
+            rules = self.chains[(table_name, chain_name)] = []
+        rules.append(rule_args)
+
+    def snapshot(self):
+        return parse_iptables_save(sudo_call_output(ns_wrap(self.namespace, ["iptables-save"])))
+
+    def plan(self, snapshot: dict[str, dict[str, list[list[str]]]]):
+        "returns iptables-restore --noflush input, or empty string if nothing needs to change."
+
+        table_lines: dict[str, list[str]] = {}
+
+        for (table_name, chain_name), rules in self.chains.items():
+            current_chains = snapshot.get(table_name, {})
+            lines = table_lines.setdefault(table_name, [])
+            if chain_name not in current_chains:
+                lines.append(':{} - [0:0]'.format(chain_name))
+                current_rules: list[list[str]] = []
+            else:
+                current_rules = current_chains[chain_name]
+                if rules is not None and current_rules != rules:
+                    lines.append('-F {}'.format(chain_name))
+                    current_rules = []
+
+            if rules is not None and current_rules != rules:
+                lines.extend('-A {} {}'.format(chain_name, ' '.join(_quote_restore_arg(arg) for arg in rule)) for rule in rules)
+
+        for table_name, builtin_chain, chain_name in self.jumps:
+            if ["-j", chain_name] not in snapshot.get(table_name, {}).get(builtin_chain, []):
+                table_lines.setdefault(table_name, []).append('-I {} -j {}'.format(builtin_chain, chain_name))
+
+        output: list[str] = []
+        for table_name, lines in table_lines.items():
+            if lines:
+                output.extend(['*{}'.format(table_name)] + lines + ['COMMIT'])
+        return ''.join(line + '\n' for line in output)
+
+    def sync(self):
+        "one iptables-save plus at most one iptables-restore. returns True if anything changed."
+
+        restore_input = self.plan(self.snapshot())
+        if not restore_input:
+            return False
+
+        logger.info("applying iptables delta:\n{}".format(restore_input))
+        sudo_call_input(ns_wrap(self.namespace, ["iptables-restore", "--noflush"]), restore_input)
+        return True
+
+
+CUSTOM_IPTABLES_CHAINS = [
+    ("nat", "POSTROUTING"),
+    ("nat", "PREROUTING"),
+    ("raw", "PREROUTING"),
+    ("mangle", "POSTROUTING"),
+    ("filter", "FORWARD"),
+    ("filter", "INPUT"),
+]
+
+
+def get_custom_iptables_ruleset(prefix: str, namespace: str = ''):
+    ruleset = IptablesRuleset(namespace)
+    for table_name, builtin_chain in CUSTOM_IPTABLES_CHAINS:
+        ruleset.add_chain(table_name, f"{prefix}-{builtin_chain}", jump_from=builtin_chain)
+    return ruleset
 
-    try_create_iptables_chain("mangle", f"{prefix}-POSTROUTING")
-    try_insert_iptables_rule("mangle", "POSTROUTING", ["-j", "{}-POSTROUTING".format(prefix)])
 
-    try_create_iptables_chain("filter", f"{prefix}-FORWARD")
-    try_insert_iptables_rule("filter", "FORWARD", ["-j", "{}-FORWARD".format(prefix)])
-
-    try_create_iptables_chain("filter", f"{prefix}-INPUT")
-    try_insert_iptables_rule("filter", "INPUT", ["-j", "{}-INPUT".format(prefix)])
+def ensure_custom_iptables(prefix: str):
+    get_custom_iptables_ruleset(prefix).sync()
 
 
 def clear_custom_iptables(prefix: str):
@@ -0,0 +1,219 @@
+import ipaddress
+from dataclasses import dataclass, field
+from lspnetd.common.logger import get_logger
+from lspnetd.common.utils import ns_wrap, sudo_call_input
+from lspnetd.device.batch import IPBatch
+from lspnetd.device.cache import state_cache
+from lspnetd.device.ns import list_raw_netns_paths
+from lspnetd.device.wireguard import diff_wg_device, resolve_wg_endpoints, sync_wg_device
+from lspnetd.models.desired import DesiredState, WireGuardDeviceSpec
+from lspnetd.models.device import NetworkInterfaceState, WireGuardDeviceState, WireGuardPeerConfig
+from lspnetd.system.iptables import IptablesRuleset
+
+
+logger = get_logger("reconciler")
+
+
+@dataclass
+class NamespaceObservedState:
+    exists: bool
+    interfaces: dict[str, NetworkInterfaceState] = field(default_factory=dict)
+    wireguard: dict[str, WireGuardDeviceState] = field(default_factory=dict)
+    iptables: dict[str, dict[str, list[list[str]]]] = field(default_factory=dict)
+
+
+@dataclass
+class WireGuardSyncOperation:
+    namespace: str
+    spec: WireGuardDeviceSpec
+    device_changed: bool
+    changed_peers: list[str]
+
+
+@dataclass
+class ReconcilePlan:
+    # ip -batch operations, including `netns add` for missing namespaces
+    batch: IPBatch = field(default_factory=IPBatch)
+    # (namespace, ip arguments) of the batch, kept after it is flushed
+    ip_operations: list[tuple[str, list[str]]] = field(default_factory=list)
+    wireguard: list[WireGuardSyncOperation] = field(default_factory=list)
+    # namespace -> iptables-restore --noflush input
+    iptables: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def empty(self):
+        return not self.ip_operations and not self.wireguard and not self.iptables
+
+    def describe(self) -> list[str]:
+        lines = ["ip {}{}".format("-n {} ".format(namespace) if namespace else "", " ".join(args)) for namespace, args in self.ip_operations]
+        for op in self.wireguard:
+            lines.append("wg syncconf {} in {!r}: device {}, peers {}".format(op.spec.name, op.namespace, "changed" if op.device_changed else "unchanged", op.changed_peers))
+        for namespace, restore_input in self.iptables.items():
+            lines.append("iptables-restore --noflush in {!r}: {} lines".format(namespace, restore_input.count("\n")))
+        return lines
+
+
+def _normalize_addresses(addresses: list[str]):
+    return [str(ipaddress.ip_interface(address)) for address in addresses]
+
+
+def _is_link_local(address: str):
+    return ipaddress.ip_interface(address).is_link_local
+
+
+def _to_peer_configs(spec: WireGuardDeviceSpec):
+    return [WireGuardPeerConfig(peer.public, peer.endpoint, peer.allowed_ips, peer.keepalive, peer.preshared) for peer in spec.peers]
+
+
+def _get_iptables_ruleset(namespace: str, desired: DesiredState):
+    ruleset = IptablesRuleset(namespace)
+    for ns_spec in desired.namespaces:
+        if ns_spec.name == namespace:
+            for chain in ns_spec.iptables:
+                ruleset.add_chain(chain.table, chain.chain, [list(rule) for rule in chain.rules] if chain.rules is not None else None, chain.jump_from)
+    return ruleset
+
+
+def observe_state(desired: DesiredState) -> dict[str, NamespaceObservedState]:
+    """
+    One read pass over everything `desired` refers to: mounted namespaces, then per namespace one interface dump,
+    one `wg show all dump` (if it has WireGuard devices) and one iptables-save (if it has chains).
+    Interface and WireGuard state goes through state_cache, so sync_wg_device later reuses it.
+    """
+
+    netns_paths = set(list_raw_netns_paths())
+
+    namespaces: dict[str, tuple[bool, bool]] = {}
+    for ns_spec in desired.namespaces:
+        has_wg, has_iptables = namespaces.get(ns_spec.name, (False, False))
+        namespaces[ns_spec.name] = (has_wg or bool(ns_spec.wireguard), has_iptables or bool(ns_spec.iptables))
+        for veth in ns_spec.veth:
+            namespaces.setdefault(veth.peer_namespace, (False, False))
+
+    observed: dict[str, NamespaceObservedState] = {}
+    for namespace, (has_wg, has_iptables) in namespaces.items():
+        exists = not namespace or f"/run/netns/{namespace}" in netns_paths or f"/var/run/netns/{namespace}" in netns_paths
+        state = observed[namespace] = NamespaceObservedState(exists)
+        if not exists:
+            continue
+
+        state_cache.invalidate(namespace)
+        state.interfaces = state_cache.interfaces(namespace)
+        if has_wg:
+            state.wireguard = state_cache.wireguard_devices(namespace)
+        if has_iptables:
+            state.iptables = IptablesRuleset(namespace).snapshot()
+
+    return observed
+
+
+def _plan_interface(batch: IPBatch, namespace: str, name: str, current: NetworkInterfaceState | None, addresses: list[str], mtu: int, up: bool):
+    "addresses, mtu and link state of an interface that exists (or is created earlier in the same batch)"
+
+    desired_addresses = _normalize_addresses(addresses)
+    current_addresses = _normalize_addresses(current.all_ipv4 + current.all_ipv6) if current is not None else []
+
+    for address in current_addresses:
+        # kernel assigned fe80:: addresses are not ours to manage
+        if address not in desired_addresses and not _is_link_local(address):
+            batch.address_delete(namespace, name, address)
+    for address in desired_addresses:
+        if address not in current_addresses:
+            batch.address_add(namespace, name, address)
+
+    if mtu and (current is None or current.mtu != mtu):
+        batch.link_set_mtu(namespace, name, mtu)
+
+    # compare the admin state, `up` also needs carrier, which a link can lack while set up
+    if up and (current is None or not current.admin_up):
+        batch.link_set_up(namespace, name)
+    elif not up and current is not None and current.admin_up:
+        batch.link_set_down(namespace, name)
+
+
+def plan_reconcile(desired: DesiredState, observed: dict[str, NamespaceObservedState]):
+    "the minimal set of operations turning `observed` into `desired`. Interfaces not in `desired` are left alone."
+
+    plan = ReconcilePlan()
+    batch = plan.batch
+
+    for namespace, state in observed.items():
+        if not state.exists:
+            # runs first: the root namespace batch is flushed before every other namespace
+            batch.add("", ["netns", "add", namespace])
+
+    for ns_spec in desired.namespaces:
+        namespace = ns_spec.name
+        state = observed[namespace]
+
+        for dummy in ns_spec.dummy:
+            current = state.interfaces.get(dummy.name)
+            if current is None:
+                batch.link_add(namespace, dummy.name, "dummy")
+            _plan_interface(batch, namespace, dummy.name, current, dummy.addresses, dummy.mtu, dummy.up)
+
+        for veth in ns_spec.veth:
+            current = state.interfaces.get(veth.name)
+            peer_current = observed[veth.peer_namespace].interfaces.get(veth.peer_name)
+            if current is None:
+                if peer_current is not None:
+                    # half of a veth pair cannot exist on its own, this is a different device
+                    batch.link_delete(veth.peer_namespace, veth.peer_name)
+                    peer_current = None
+
+                link_args = ["link", "add", veth.name] + (["netns", namespace] if namespace else [])
+                peer_args = ["peer", veth.peer_name] + (["netns", veth.peer_namespace] if veth.peer_namespace else [])
+                batch.add("", link_args + ["type", "veth"] + peer_args)
+
+            _plan_interface(batch, namespace, veth.name, current, veth.addresses, veth.mtu, veth.up)
+            _plan_interface(batch, veth.peer_namespace, veth.peer_name, peer_current, veth.peer_addresses, veth.mtu, veth.up)
+
+        for wg in ns_spec.wireguard:
+            current = state.interfaces.get(wg.name)
+            if current is None:
+                # created in the root namespace and moved, so the socket stays in the root namespace (see create_wg_device)
+                batch.link_add("", wg.name, "wireguard")
+                if namespace:
+                    batch.link_set_netns("", wg.name, namespace)
+            _plan_interface(batch, namespace, wg.name, current, wg.addresses, wg.mtu, wg.up)
+
+            peers = _to_peer_configs(wg)
+            resolved_endpoints = resolve_wg_endpoints(peers)
+            device_changed, changed_peers = diff_wg_device(state.wireguard.get(wg.name), wg.private_key, wg.listen_port, peers, wg.fwmark, resolved_endpoints)
+            if device_changed or changed_peers:
+                plan.wireguard.append(WireGuardSyncOperation(namespace, wg, device_changed, changed_peers))
+
+        if ns_spec.iptables and namespace not in plan.iptables:
+            restore_input = _get_iptables_ruleset(namespace, desired).plan(state.iptables)
+            if restore_input:
+                plan.iptables[namespace] = restore_input
+
+    plan.ip_operations = [(namespace, op.args) for namespace, ops in batch.operations.items() for op in ops]
+    return plan
+
+
+def apply_plan(plan: ReconcilePlan):
+    if plan.empty:
+        return
+
+    for line in plan.describe():
+        logger.info("reconcile: {}".format(line))
+
+    # namespaces and links first, wg and iptables refer to them
+    if len(plan.batch):
+        plan.batch.flush()
+
+    for op in plan.wireguard:
+        sync_wg_device(op.namespace, op.spec.name, op.spec.private_key, op.spec.listen_port, _to_peer_configs(op.spec), op.spec.fwmark)
+
+    for namespace, restore_input in plan.iptables.items():
+        sudo_call_input(ns_wrap(namespace, ["iptables-restore", "--noflush"]), restore_input)
+
+
+def reconcile(desired: DesiredState, dry_run: bool = False):
+    "read actual state once, apply only the difference. Returns the plan that was (or with dry_run, would be) applied."
+
+    plan = plan_reconcile(desired, observe_state(desired))
+    if not dry_run:
+        apply_plan(plan)
+    return plan
@@ -0,0 +1,230 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+from lspnetd.common.logger import get_logger
+from lspnetd.device.ns import destroy_netns, ensure_netns
+from lspnetd.external.podman import ensure_podman_router, shutdown_podman_router
+
+
+logger = get_logger("scheduler")
+
+STEP_OK = "ok"
+STEP_FAILED = "failed"
+# not run: an earlier step of the namespace or a dependency failed
+STEP_SKIPPED = "skipped"
+
+
+@dataclass
+class ProvisionStep:
+    namespace: str
+    name: str
+    run: Callable[[], object]
+    # undo for a completed step, called in reverse order when its namespace fails
+    rollback: Callable[[], object] | None = None
+    # (namespace, step name) of steps in other namespaces that must finish first
+    after: list[tuple[str, str]] = field(default_factory=list)
+
+
+@dataclass
+class ProvisionStepResult:
+    namespace: str
+    name: str
+    status: str
+    # seconds since the scheduler started
+    started_at: float = 0
+    seconds: float = 0
+    error: str = ''
+    rolled_back: bool = False
+    rollback_seconds: float = 0
+    rollback_error: str = ''
+
+
+@dataclass
+class ProvisionReport:
+    results: list[ProvisionStepResult]
+    seconds: float
+
+    @property
+    def failed_namespaces(self):
+        return sorted({result.namespace for result in self.results if result.status != STEP_OK})
+
+    @property
+    def ok(self):
+        return all(result.status == STEP_OK for result in self.results)
+
+    def describe(self) -> list[str]:
+        lines: list[str] = []
+        for result in sorted(self.results, key=lambda r: (r.namespace, r.started_at)):
+            line = "{}/{}: {} at {:.3f}s took {:.3f}s".format(result.namespace, result.name, result.status, result.started_at, result.seconds)
+            if result.error:
+                line += " ({})".format(result.error)
+            if result.rolled_back:
+                line += ", rolled back in {:.3f}s".format(result.rollback_seconds)
+            if result.rollback_error:
+                line += ", rollback failed ({})".format(result.rollback_error)
+            lines.append(line)
+        lines.append("total {:.3f}s".format(self.seconds))
+        return lines
+
+
+class ProvisionScheduler:
+    """
+    Runs provisioning steps as a dependency graph on a bounded thread pool.
+    Steps of one namespace run in the order they were added, different namespaces run concurrently
+    unless tied together with `after`. When a step fails, the rest of its namespace (and every step depending on it)
+    is skipped and the completed steps of each affected namespace are rolled back, newest first.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.steps: dict[tuple[str, str], ProvisionStep] = {}
+        self.namespace_steps: dict[str, list[ProvisionStep]] = {}
+
+    def add_step(self, namespace: str, name: str, run: Callable[[], object], rollback: Callable[[], object] | None = None, after: list[tuple[str, str]] | None = None):
+        if (namespace, name) in self.steps:
+            raise ValueError("duplicate step {}/{}".format(namespace, name))
+
+        step = ProvisionStep(namespace, name, run, rollback, list(after or []))
+        self.steps[(namespace, name)] = step
+        self.namespace_steps.setdefault(namespace, []).append(step)
+        return step
+
+    def _dependencies(self):
+        deps: dict[tuple[str, str], set[tuple[str, str]]] = {}
+        for namespace, steps in self.namespace_steps.items():
+            for i, step in enumerate(steps):
+                key = (namespace, step.name)
+                deps[key] = set(step.after)
+                if i > 0:
+                    deps[key].add((namespace, steps[i - 1].name))
+                for dep in step.after:
+                    if dep not in self.steps:
+                        raise ValueError("step {}/{} depends on unknown step {}/{}".format(namespace, step.name, *dep))
+
+        # Kahn's algorithm, only to reject cycles before anything runs
+        remaining = {key: set(value) for key, value in deps.items()}
+        while remaining:
+            ready = [key for key, value in remaining.items() if not value]
+            if not ready:
+                raise ValueError("dependency cycle between steps: {}".format(", ".join("{}/{}".format(*key) for key in sorted(remaining))))
+            for key in ready:
+                del remaining[key]
+            for value in remaining.values():
+                value.difference_update(ready)
+
+        return deps
+
+    def _rollback(self, namespace: str, results: dict[tuple[str, str], ProvisionStepResult]):
+        for step in reversed(self.namespace_steps[namespace]):
+            result = results.get((namespace, step.name))
+            if result is None or result.status != STEP_OK or step.rollback is None:
+                continue
+
+            started = time.perf_counter()
+            try:
+                step.rollback()
+                result.rolled_back = True
+            except Exception as e:
+                logger.exception("rollback of {}/{} failed".format(namespace, step.name))
+                result.rollback_error = str(e) or type(e).__name__
+            result.rollback_seconds = time.perf_counter() - started
+
+    def run(self):
+        deps = self._dependencies()
+        results: dict[tuple[str, str], ProvisionStepResult] = {}
+        failed_namespaces: set[str] = set()
+        rolled_back: set[str] = set()
+        started = time.perf_counter()
+
+        def run_step(step: ProvisionStep):
+            result = ProvisionStepResult(step.namespace, step.name, STEP_OK, time.perf_counter() - started)
+            step_started = time.perf_counter()
+            try:
+                step.run()
+            except Exception as e:
+                logger.exception("step {}/{} failed".format(step.namespace, step.name))
+                result.status = STEP_FAILED
+                result.error = str(e) or type(e).__name__
+            result.seconds = time.perf_counter() - step_started
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="provision") as executor:
+            running: dict[Future[ProvisionStepResult], tuple[str, str]] = {}
+            rollbacks: dict[Future[None], str] = {}
+
+            while True:
+                # skip everything that can no longer run
+                scheduled = set(running.values())
+                changed = True
+                while changed:
+                    changed = False
+                    for key, step in self.steps.items():
+                        if key in results or key in scheduled:
+                            continue
+                        if step.namespace in failed_namespaces or any(dep in results and results[dep].status != STEP_OK for dep in deps[key]):
+                            results[key] = ProvisionStepResult(step.namespace, step.name, STEP_SKIPPED, time.perf_counter() - started)
+                            failed_namespaces.add(step.namespace)
+                            changed = True
+
+                # a failed namespace is rolled back once none of its steps is running anymore
+                busy_namespaces = {namespace for namespace, _ in scheduled}
+                for namespace in sorted(failed_namespaces - rolled_back - busy_namespaces):
+                    rolled_back.add(namespace)
+                    rollbacks[executor.submit(self._rollback, namespace, results)] = namespace
+
+                for key, step in self.steps.items():
+                    if key in results or key in scheduled:
+                        continue
+                    if all(dep in results and results[dep].status == STEP_OK for dep in deps[key]):
+                        running[executor.submit(run_step, step)] = key
+
+                if not running and not rollbacks:
+                    break
+
+                done, _ = wait([*running, *rollbacks], return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in rollbacks:
+                        rollbacks.pop(future)  # type: ignore
+                        continue
+
+                    key = running.pop(future)  # type: ignore
+                    result: ProvisionStepResult = future.result()  # type: ignore
+                    results[key] = result
+                    if result.status != STEP_OK:
+                        failed_namespaces.add(result.namespace)
+
+        return ProvisionReport(list(results.values()), time.perf_counter() - started)
+
+
+def add_router_namespace(scheduler: ProvisionScheduler, namespace: str,
+                         setup_devices: Callable[[], object], teardown_devices: Callable[[], object] | None = None,
+                         start_router: bool = True, after: list[tuple[str, str]] | None = None):
+    """
+    The usual router namespace: netns -> devices and addresses -> bird container.
+    Step names are "netns", "devices" and "router". A failure removes the container and the namespace again,
+    but only if this run created them.
+    """
+
+    created: set[str] = set()
+
+    def create_netns():
+        if ensure_netns(namespace):
+            created.add("netns")
+
+    def remove_netns():
+        if "netns" in created:
+            destroy_netns(namespace)
+
+    def create_router():
+        if ensure_podman_router(namespace):
+            created.add("router")
+
+    def remove_router():
+        if "router" in created:
+            shutdown_podman_router(namespace)
+
+    scheduler.add_step(namespace, "netns", create_netns, remove_netns)
+    scheduler.add_step(namespace, "devices", setup_devices, teardown_devices, after)
+    if start_router:
+        scheduler.add_step(namespace, "router", create_router, remove_router)
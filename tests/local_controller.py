@@ -0,0 +1,206 @@
+import base64
+import itertools
+import json
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from lspnetd.secure.batcher import BATCH_FEATURE, BATCH_KEY
+from lspnetd.secure.channel import SecureChannelClient
+from lspnetd.secure.http_client import SecureChannelHTTPClient
+from lspnetd.secure.message import SecureMessage, SecureMessageV2
+from lspnetd.common.logger import get_logger
+
+
+logger = get_logger("local_controller")
+
+
+class LocalController:
+    """
+    In-process stand-in for the controller, implementing /node/connect, /node/send and /node/stream over plain HTTP.
+    Meant for tests and benchmarks: point SecureChannelHTTPClient at `address` with scheme="http".
+    """
+
+    def __init__(self, private_sign_key: Ed25519PrivateKey, clients: dict[str, Ed25519PublicKey],
+                 handler: Callable[[str, Any], Any] | None = None, session_ttl: int = 3600, host: str = "127.0.0.1", port: int = 0,
+                 features: Iterable[str] = (BATCH_FEATURE,)):
+        self.private_sign_key = private_sign_key
+        self.clients = clients
+        # (client name, request) -> response. echo by default
+        self.handler = handler or (lambda name, data: data)
+        self.session_ttl = session_ttl
+        self.features = list(features)
+        # cid -> (client name, server side channel)
+        self.sessions: dict[int, tuple[str, SecureChannelClient]] = {}
+        self.lock = threading.Lock()
+
+        controller = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            # keep-alive
+            protocol_version = "HTTP/1.1"
+            # headers and body are written separately, avoid Nagle + delayed ACK stalls
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: Any):
+                pass
+
+            def iter_body(self):
+                if self.headers.get("Transfer-Encoding", "").lower() != "chunked":
+                    yield self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    return
+
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0], 16)
+                    if size == 0:
+                        # trailers
+                        while self.rfile.readline().strip():
+                            pass
+                        return
+                    yield self.rfile.read(size)
+                    self.rfile.readline()
+
+            def do_POST(self):
+                try:
+                    if self.path == "/node/stream":
+                        status, content = controller.stream(self.iter_body())
+                    else:
+                        status, content = controller.dispatch(self.path, b''.join(self.iter_body()))
+                except Exception as e:
+                    logger.warning("local controller failed to handle {}: {}".format(self.path, e))
+                    status, content = 400, str(e).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        self.server = ThreadingHTTPServer((host, port), RequestHandler)
+        self.server.daemon_threads = True
+        self.thread: threading.Thread | None = None
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):  # type: ignore
+        self.stop()
+
+    def dispatch(self, path: str, body: bytes) -> tuple[int, bytes]:
+        if path == "/node/connect":
+            return 200, self.connect(json.loads(body))
+        if path == "/node/send":
+            return self.send(body)
+        return 404, b"not found"
+
+    def connect(self, request: dict[str, Any]):
+        client_sign_key = self.clients[request["name"]]
+        client_key_bytes = base64.b64decode(request["key"])
+        client_sign_key.verify(base64.b64decode(request["sign"]), client_key_bytes)
+
+        client_public_key = serialization.load_der_public_key(client_key_bytes)
+        assert isinstance(client_public_key, X25519PublicKey), "invalid handshake key"
+
+        handshake_private_key = X25519PrivateKey.generate()
+        public_key_bytes = handshake_private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        cid = secrets.randbits(63) or 1
+
+        channel = SecureChannelClient(self.private_sign_key, client_sign_key)
+        channel.shared_secret = handshake_private_key.exchange(client_public_key)
+        channel.connection_id = cid
+        channel.handshake_private_key = None
+
+        with self.lock:
+            self.sessions[cid] = (request["name"], channel)
+
+        now = int(time.time())
+        first_message = channel.encrypt(json.dumps({"iat": now, "exp": now + self.session_ttl}).encode())
+
+        version = min(int(request.get("version", 1)), 2)
+        if version == 2:
+            channel.enable_session_keys()
+
+        return json.dumps({
+            "version": version,
+            "cid": cid,
+            "key": base64.b64encode(public_key_bytes).decode(),
+            "sign": base64.b64encode(self.private_sign_key.sign(public_key_bytes + cid.to_bytes(8, 'big'))).decode(),
+            "data": base64.b64encode(first_message.to_bytes()).decode(),
+            "features": self.features,
+        }).encode()
+
+    def get_session(self, cid: int):
+        with self.lock:
+            return self.sessions.get(cid)
+
+    def send(self, body: bytes) -> tuple[int, bytes]:
+        # v2 frames start with the cid, v1 frames with the signature
+        session = self.get_session(int.from_bytes(body[:8], 'big'))
+        if session is not None and session[1].version == 2:
+            name, channel = session
+            request = json.loads(channel.decrypt_v2(SecureMessageV2.from_bytes(body)))
+        else:
+            message = SecureMessage.from_bytes(body)
+            session = self.get_session(message.cid)
+            if session is None:
+                return 403, b"unknown connection"
+
+            name, channel = session
+            request = json.loads(channel.decrypt(message))
+
+        if BATCH_FEATURE in self.features and isinstance(request, dict) and list(request) == [BATCH_KEY]:
+            response = {BATCH_KEY: [self.handler(name, item) for item in request[BATCH_KEY]]}
+        else:
+            response = self.handler(name, request)
+        response_bytes = json.dumps(response).encode()
+        if channel.version == 2:
+            return 200, channel.encrypt_v2(response_bytes).to_bytes()
+        return 200, channel.encrypt(response_bytes).to_bytes()
+
+    def stream(self, body: Iterable[bytes]) -> tuple[int, bytes]:
+        reader = iter(body)
+        first = next(reader, b'')
+        # stream header starts with the cid
+        session = self.get_session(int.from_bytes(first[:8], 'big'))
+        if session is None:
+            return 403, b"unknown connection"
+
+        name, channel = session
+        plaintext = b''.join(channel.decrypt_stream(itertools.chain([first], reader)))
+        response = self.handler(name, json.loads(plaintext))
+        return 200, b''.join(channel.encrypt_stream([json.dumps(response).encode()]))
+
+
+@contextmanager
+def connected_client(handler: Callable[[str, Any], Any] | None = None, features: Iterable[str] = (BATCH_FEATURE,), protocol_version: int = 2):
+    "a SecureChannelHTTPClient talking to a fresh LocalController"
+
+    client_key = Ed25519PrivateKey.generate()
+    server_key = Ed25519PrivateKey.generate()
+    client_key_der = client_key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    server_public_der = server_key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    with LocalController(server_key, {"test": client_key.public_key()}, handler, features=features) as controller:
+        client = SecureChannelHTTPClient("test", controller.address, client_key_der, server_public_der, scheme="http", protocol_version=protocol_version)
+        try:
+            yield client
+        finally:
+            client.close()
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+from pathlib import Path
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from lspnetd.config.session import SecureSessionStore
+from lspnetd.secure.async_client import AsyncSecureChannelHTTPClient
+from tests.local_controller import LocalController
+
+
+def test_session_store_io_runs_off_the_event_loop(tmp_path: Path):
+    client_key = Ed25519PrivateKey.generate()
+    server_key = Ed25519PrivateKey.generate()
+    client_key_der = client_key.private_bytes(serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    server_public_der = server_key.public_key().public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    store = SecureSessionStore(str(tmp_path / "sessions.db"))
+    store_threads: list[threading.Thread] = []
+    load, save = store.load, store.save
+    store.load = lambda *args: store_threads.append(threading.current_thread()) or load(*args)  # type: ignore
+    store.save = lambda *args: store_threads.append(threading.current_thread()) or save(*args)  # type: ignore
+
+    with LocalController(server_key, {"test": client_key.public_key()}) as controller:
+        async def run():
+            async with AsyncSecureChannelHTTPClient("test", controller.address, client_key_der, server_public_der,
+                                                    scheme="http", protocol_version=2, session_store=store) as client:
+                # nothing is read from the store until the first request
+                assert store_threads == []
+                assert await asyncio.gather(*(client.send({"n": n}) for n in range(4))) == [{"n": n} for n in range(4)]
+                connection_id = client.client.channel.connection_id
+
+            # a second client resumes the saved session
+            async with AsyncSecureChannelHTTPClient("test", controller.address, client_key_der, server_public_der,
+                                                    scheme="http", protocol_version=2, session_store=store) as client:
+                assert await client.send({"n": 4}) == {"n": 4}
+                assert client.client.channel.connection_id == connection_id
+
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(run())
+
+    # load, save, load: a single handshake, all on worker threads
+    assert len(store_threads) == 3
+    assert loop_thread not in store_threads
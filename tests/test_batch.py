@@ -0,0 +1,125 @@
+import subprocess
+import pytest
+from lspnetd.device import batch as batch_module
+from lspnetd.device.batch import IPBatch, IPBatchError
+from lspnetd.device.cache import NamespaceStateSnapshot, state_cache
+
+
+class FakeIP:
+    "records `ip -batch` calls, failing with the given stderr for some namespaces"
+
+    def __init__(self, stderr_by_namespace: dict[str, str] | None = None):
+        self.calls: list[tuple[list[str], str]] = []
+        self.stderr_by_namespace = stderr_by_namespace or {}
+
+    def __call__(self, args: list[str], input: str):
+        self.calls.append((args, input))
+        namespace = args[args.index("-n") + 1] if "-n" in args else ""
+        if namespace in self.stderr_by_namespace:
+            raise subprocess.CalledProcessError(1, args, "", self.stderr_by_namespace[namespace])
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    state_cache.invalidate()
+    yield
+    state_cache.invalidate()
+
+
+def test_batch_text_per_namespace(monkeypatch: pytest.MonkeyPatch):
+    fake = FakeIP()
+    monkeypatch.setattr(batch_module, "sudo_call_input", fake)
+
+    batch = IPBatch()
+    batch.address_add("ns1", "veth0", "10.0.0.1/30")
+    batch.link_add("", "wg0", "wireguard")
+    batch.link_set_netns("", "wg0", "ns1")
+    batch.link_set_mtu("ns1", "veth0", 1420)
+    batch.link_set_up("ns2", "lo")
+    assert len(batch) == 5
+    ops = batch.flush()
+
+    # the default namespace goes first, then namespaces in first-use order
+    assert fake.calls == [
+        (["ip", "-batch", "-"], "link add wg0 type wireguard\nlink set dev wg0 netns ns1\n"),
+        (["ip", "-n", "ns1", "-batch", "-"], "address add dev veth0 10.0.0.1/30\nlink set dev veth0 mtu 1420\n"),
+        (["ip", "-n", "ns2", "-batch", "-"], "link set dev lo up\n"),
+    ]
+    assert all(op.executed and not op.error for op in ops)
+    assert len(batch) == 0
+
+    forced = IPBatch(force=True)
+    forced.link_delete("ns1", "veth0")
+    forced.flush()
+    assert fake.calls[-1][0] == ["ip", "-n", "ns1", "-force", "-batch", "-"]
+
+
+def test_failed_lines_are_mapped_to_operations(monkeypatch: pytest.MonkeyPatch):
+    fake = FakeIP({"ns1": "RTNETLINK answers: File exists\nCommand failed -:2\n"})
+    monkeypatch.setattr(batch_module, "sudo_call_input", fake)
+
+    batch = IPBatch()
+    batch.address_add("ns1", "veth0", "10.0.0.1/30")
+    batch.address_add("ns1", "veth0", "10.0.0.2/30")
+    batch.link_set_up("ns1", "veth0")
+    batch.link_set_up("ns2", "lo")
+    with pytest.raises(IPBatchError) as excinfo:
+        batch.flush()
+
+    error = excinfo.value
+    assert [(op.args[-1], op.error) for op in error.failed] == [("10.0.0.2/30", "RTNETLINK answers: File exists")]
+    # ip stops at the failed line, the rest of ns1 and all of ns2 never ran
+    assert [op.to_line() for op in error.skipped] == ["link set dev veth0 up", "link set dev lo up"]
+    assert len(fake.calls) == 1
+    assert "[ns1] ip address add dev veth0 10.0.0.2/30: RTNETLINK answers: File exists" in str(error)
+
+
+def test_force_continues_after_failures(monkeypatch: pytest.MonkeyPatch):
+    fake = FakeIP({"ns1": "Error: any valid prefix is expected rather than \"bad\".\nCommand failed -:1\nCannot find device \"nope\"\nCommand failed -:3\n"})
+    monkeypatch.setattr(batch_module, "sudo_call_input", fake)
+
+    batch = IPBatch(force=True)
+    batch.address_add("ns1", "veth0", "bad")
+    batch.link_set_up("ns1", "veth0")
+    batch.link_set_up("ns1", "nope")
+    batch.link_set_up("ns2", "lo")
+    with pytest.raises(IPBatchError) as excinfo:
+        batch.flush()
+
+    assert [op.error for op in excinfo.value.failed] == ['Error: any valid prefix is expected rather than "bad".', 'Cannot find device "nope"']
+    assert excinfo.value.skipped == []
+    assert len(fake.calls) == 2
+
+
+def test_missing_namespace_fails_before_any_line(monkeypatch: pytest.MonkeyPatch):
+    fake = FakeIP({"gone": "Cannot open network namespace \"gone\": No such file or directory\n"})
+    monkeypatch.setattr(batch_module, "sudo_call_input", fake)
+
+    batch = IPBatch()
+    batch.link_set_up("gone", "lo")
+    batch.link_set_up("gone", "eth0")
+    with pytest.raises(IPBatchError) as excinfo:
+        batch.flush()
+
+    assert [op.error for op in excinfo.value.failed] == ['Cannot open network namespace "gone": No such file or directory']
+    assert [op.to_line() for op in excinfo.value.skipped] == ["link set dev eth0 up"]
+
+
+def test_flush_invalidates_state_cache(monkeypatch: pytest.MonkeyPatch):
+    fake = FakeIP({"ns2": "Cannot find device \"lo0\"\nCommand failed -:1\n"})
+    monkeypatch.setattr(batch_module, "sudo_call_input", fake)
+    for namespace in ("", "ns1", "ns2", "ns3", "untouched"):
+        state_cache.snapshots[namespace] = NamespaceStateSnapshot(interfaces={})
+
+    batch = IPBatch()
+    # moved into ns3, so ns3 changes too
+    batch.link_add("", "wg0", "wireguard")
+    batch.link_set_netns("", "wg0", "ns3")
+    batch.link_set_up("ns1", "lo")
+    batch.link_set_up("ns2", "lo0")
+    with pytest.raises(IPBatchError):
+        batch.flush()
+
+    # a failed namespace is invalidated as well, it may have been partly applied
+    assert set(state_cache.snapshots) == {"untouched"}
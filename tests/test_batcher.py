@@ -0,0 +1,73 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable
+from lspnetd.secure.batcher import BATCH_FEATURE, SecureChannelBatcher
+from tests.local_controller import connected_client
+
+
+@contextmanager
+def make_client(features: Iterable[str] = (BATCH_FEATURE,)):
+    with connected_client(features=features) as client:
+        sent: list[bytes] = []
+        send_plaintext = client.send_plaintext
+
+        def counting_send(plaintext_bytes: bytes):
+            sent.append(plaintext_bytes)
+            return send_plaintext(plaintext_bytes)
+
+        client.send_plaintext = counting_send  # type: ignore
+        yield client, sent
+
+
+def test_single_message_is_flushed_by_delay():
+    with make_client() as (client, sent):
+        batcher = SecureChannelBatcher(client, max_delay=0.05)
+        try:
+            started = time.monotonic()
+            assert batcher.submit({"n": 1}).result(timeout=5) == {"n": 1}
+            assert time.monotonic() - started < 2
+            assert len(sent) == 1
+        finally:
+            batcher.close()
+
+
+def test_messages_are_batched_when_supported():
+    with make_client() as (client, sent):
+        batcher = SecureChannelBatcher(client, max_messages=4, max_delay=10)
+        try:
+            futures = [batcher.submit({"n": n}) for n in range(4)]
+            assert [f.result(timeout=5) for f in futures] == [{"n": n} for n in range(4)]
+            assert len(sent) == 1
+        finally:
+            batcher.close()
+
+
+def test_falls_back_to_single_messages_without_batch_feature():
+    with make_client(features=()) as (client, sent):
+        batcher = SecureChannelBatcher(client, max_messages=3, max_delay=10)
+        try:
+            futures = [batcher.submit({"n": n}) for n in range(3)]
+            assert [f.result(timeout=5) for f in futures] == [{"n": n} for n in range(3)]
+            assert sent == [b'{"n": 0}', b'{"n": 1}', b'{"n": 2}']
+        finally:
+            batcher.close()
+
+
+def test_cancelled_future_is_skipped():
+    with make_client() as (client, sent):
+        batcher = SecureChannelBatcher(client, max_delay=10)
+        try:
+            cancelled = batcher.submit({"n": 0})
+            assert cancelled.cancel()
+            batcher.flush()
+            replies: list[Any] = []
+            done = threading.Event()
+            batcher.post({"n": 1}, lambda reply: (replies.append(reply), done.set()))
+            batcher.flush()
+            assert done.wait(5)
+            assert replies == [{"n": 1}]
+            assert all(b'"n": 0' not in body for body in sent)
+            assert cancelled.cancelled()
+        finally:
+            batcher.close()
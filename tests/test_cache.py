@@ -0,0 +1,103 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from lspnetd.device import cache as cache_module, interface, wireguard
+from lspnetd.device.cache import NamespaceStateCache
+from lspnetd.models.device import NetworkInterfaceState, WireGuardDeviceState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def counting_dump(monkeypatch: pytest.MonkeyPatch, module, name: str, make):
+    calls: list[str] = []
+
+    def dump(namespace: str):
+        calls.append(namespace)
+        return [make(f"{namespace or 'root'}-{len(calls)}")]
+
+    monkeypatch.setattr(module, name, dump)
+    return calls
+
+
+def make_link(name: str):
+    return NetworkInterfaceState(name, 1500, True, [], [], admin_up=True)
+
+
+def test_interfaces_expire_after_ttl(monkeypatch: pytest.MonkeyPatch, clock: FakeClock):
+    calls = counting_dump(monkeypatch, interface, "dump_all_interface_state", make_link)
+    cache = NamespaceStateCache(ttl=5)
+
+    assert list(cache.interfaces("ns1")) == ["ns1-1"]
+    clock.now += 5
+    assert cache.interface("ns1", "ns1-1") is not None
+    assert calls == ["ns1"]
+
+    clock.now += 0.1
+    assert list(cache.interfaces("ns1")) == ["ns1-2"]
+    # namespaces are cached separately
+    assert list(cache.interfaces("")) == ["root-3"]
+    assert calls == ["ns1", "ns1", ""]
+
+
+def test_invalidate(monkeypatch: pytest.MonkeyPatch, clock: FakeClock):
+    links = counting_dump(monkeypatch, interface, "dump_all_interface_state", make_link)
+    devices = counting_dump(monkeypatch, wireguard, "dump_all_wireguard_state",
+                            lambda name: WireGuardDeviceState(name, "priv", "pub", 51820, 0, []))
+    cache = NamespaceStateCache()
+
+    cache.interfaces("ns1")
+    cache.interfaces("ns2")
+    cache.wireguard_devices("ns1")
+    cache.invalidate("ns1")
+    cache.interfaces("ns1")
+    cache.interfaces("ns2")
+    cache.wireguard_devices("ns1")
+    assert links == ["ns1", "ns2", "ns1"]
+    assert devices == ["ns1", "ns1"]
+
+    cache.invalidate()
+    cache.interfaces("ns2")
+    assert links == ["ns1", "ns2", "ns1", "ns2"]
+
+
+def test_read_racing_a_mutation_does_not_cache_stale_state(monkeypatch: pytest.MonkeyPatch, clock: FakeClock):
+    dumping = threading.Event()
+    mutated = threading.Event()
+    state = {"name": "before"}
+
+    def dump(namespace: str):
+        result = [make_link(state["name"])]
+        if threading.current_thread() is not threading.main_thread():
+            dumping.set()
+            assert mutated.wait(5)
+        return result
+
+    monkeypatch.setattr(interface, "dump_all_interface_state", dump)
+    cache = NamespaceStateCache()
+    stale: list[dict] = []
+    reader = threading.Thread(target=lambda: stale.append(cache.interfaces("ns1")))
+    reader.start()
+    assert dumping.wait(5)
+
+    # the mutation finishes and invalidates while the reader is still dumping
+    state["name"] = "after"
+    cache.invalidate("ns1")
+    mutated.set()
+    reader.join(5)
+
+    assert list(stale[0]) == ["before"]
+    assert list(cache.interfaces("ns1")) == ["after"]
+    assert list(cache.interfaces("ns1")) == ["after"]
@@ -0,0 +1,87 @@
+import secrets
+import pytest
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+from lspnetd.secure.channel import MAX_PEER_EPOCHS, SecureChannelClient
+from lspnetd.secure.message import SecureMessageV2
+
+
+def make_channel_pair():
+    client_key = Ed25519PrivateKey.generate()
+    server_key = Ed25519PrivateKey.generate()
+    client = SecureChannelClient(client_key, server_key.public_key())
+    server = SecureChannelClient(server_key, client_key.public_key())
+
+    shared_secret = secrets.token_bytes(32)
+    for channel in (client, server):
+        channel.shared_secret = shared_secret
+        channel.connection_id = 1
+        channel.handshake_private_key = None
+        channel.enable_session_keys()
+    return client, server
+
+
+def roundtrip(sender: SecureChannelClient, receiver: SecureChannelClient, plaintext: bytes):
+    return receiver.decrypt_v2(SecureMessageV2.from_bytes(sender.encrypt_v2(plaintext).to_bytes()))
+
+
+def test_replay_in_current_epoch_is_rejected():
+    client, server = make_channel_pair()
+    frame = client.encrypt_v2(b"hello").to_bytes()
+    assert server.decrypt_v2(SecureMessageV2.from_bytes(frame)) == b"hello"
+    with pytest.raises(ValueError, match="Replayed"):
+        server.decrypt_v2(SecureMessageV2.from_bytes(frame))
+
+
+def test_replay_after_epoch_eviction_is_rejected():
+    client, server = make_channel_pair()
+    old_frame = client.encrypt_v2(b"old").to_bytes()
+    assert server.decrypt_v2(SecureMessageV2.from_bytes(old_frame)) == b"old"
+
+    for i in range(MAX_PEER_EPOCHS):
+        client.rekey()
+        assert roundtrip(client, server, str(i).encode()) == str(i).encode()
+
+    with pytest.raises(ValueError, match="Stale epoch"):
+        server.decrypt_v2(SecureMessageV2.from_bytes(old_frame))
+
+
+def test_replay_after_client_restart_is_rejected():
+    client, server = make_channel_pair()
+    old_frame = client.encrypt_v2(b"old").to_bytes()
+    assert server.decrypt_v2(SecureMessageV2.from_bytes(old_frame)) == b"old"
+
+    # a restarted client resumes the session with a newer epoch
+    restarted = SecureChannelClient(client.private_sign_key, client.peer_public_sign_key)
+    restarted.shared_secret = client.shared_secret
+    restarted.connection_id = client.connection_id
+    restarted.handshake_private_key = None
+    restarted.enable_session_keys()
+    assert restarted.send_epoch > client.send_epoch
+    assert roundtrip(restarted, server, b"new") == b"new"
+
+    with pytest.raises(ValueError, match="Replayed"):
+        server.decrypt_v2(SecureMessageV2.from_bytes(old_frame))
+    for _ in range(MAX_PEER_EPOCHS):
+        restarted.rekey()
+        roundtrip(restarted, server, b"")
+    with pytest.raises(ValueError, match="Stale epoch"):
+        server.decrypt_v2(SecureMessageV2.from_bytes(old_frame))
+
+
+def test_unannounced_older_epoch_is_rejected():
+    client, server = make_channel_pair()
+    older = client.encrypt_v2(b"older").to_bytes()
+    client.rekey()
+    assert roundtrip(client, server, b"newer") == b"newer"
+
+    with pytest.raises(ValueError, match="Stale epoch"):
+        server.decrypt_v2(SecureMessageV2.from_bytes(older))
+
+
+def test_forged_epoch_is_not_accepted():
+    client, server = make_channel_pair()
+    message = client.encrypt_v2(b"hello")
+    message.epoch = b"\xff" * 16
+    with pytest.raises(Exception):
+        server.decrypt_v2(SecureMessageV2.from_bytes(message.to_bytes()))
+    assert server.recv_newest_epoch == b''
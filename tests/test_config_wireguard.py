@@ -0,0 +1,76 @@
+from pathlib import Path
+import pytest
+from lspnetd.config.wireguard import WireGuardConfigStore, WireGuardPeerChanges
+from lspnetd.models.config import WireGuardKeySchema, WireGuardPeerSchema
+
+
+def make_peer(name: str, endpoint: str = '', namespace: str = "ns1"):
+    return WireGuardPeerSchema(namespace=namespace, name=name, public_key="pub-" + name, is_static_key=0, endpoint=endpoint, is_static_endpoint=0)
+
+
+@pytest.fixture
+def store(tmp_path: Path):
+    store = WireGuardConfigStore(str(tmp_path / "wg.db"))
+    yield store
+    store.close()
+
+
+def test_triggers_log_only_real_changes(store: WireGuardConfigStore):
+    assert store.current_version() == 0
+    store.save_peer(make_peer("a"))
+    store.save_key(WireGuardKeySchema(namespace="ns1", name="wg0", public_key="pub", private_key="priv"))
+    assert store.current_version() == 2
+
+    # same content again: no log entry
+    store.save_peer(make_peer("a"))
+    assert store.current_version() == 2
+    store.save_peer(make_peer("a", "192.0.2.1:51820"))
+    assert store.current_version() == 3
+
+
+def test_peers_changed_since(store: WireGuardConfigStore):
+    store.save_peers([make_peer("a"), make_peer("b")])
+    first = store.peers_changed_since(0)
+    assert first.full
+    assert sorted(peer.name for peer in first.updated) == ["a", "b"]
+
+    store.save_peer(make_peer("a", "192.0.2.1:51820"))
+    store.delete_peer("ns1", "b")
+    changes = store.peers_changed_since(first.version)
+    assert not changes.full
+    assert [(peer.name, peer.endpoint) for peer in changes.updated] == [("a", "192.0.2.1:51820")]
+    assert changes.deleted == [("ns1", "b")]
+
+    assert store.peers_changed_since(changes.version) == WireGuardPeerChanges(changes.version)
+
+
+def test_reader_behind_compaction_gets_full_reload(store: WireGuardConfigStore):
+    store.save_peer(make_peer("a"))
+    reader_version = store.peers_changed_since(0).version
+    store.save_peer(make_peer("b"))
+    store.delete_peer("ns1", "a")
+    up_to_date = store.peers_changed_since(reader_version).version
+
+    store.compact_changes(up_to_date)
+    assert store.compacted_version() == up_to_date
+    assert store.query("select * from wireguard_changes") == []
+
+    # the deletion of "a" was compacted away: the old reader must reload everything
+    behind = store.peers_changed_since(reader_version)
+    assert behind.full
+    assert [peer.name for peer in behind.updated] == ["b"]
+    assert behind.deleted == []
+
+    # a reader that was caught up keeps getting deltas
+    store.save_peer(make_peer("c"))
+    current = store.peers_changed_since(up_to_date)
+    assert not current.full
+    assert [peer.name for peer in current.updated] == ["c"]
+
+
+def test_compaction_watermark_is_clamped_and_monotonic(store: WireGuardConfigStore):
+    store.save_peer(make_peer("a"))
+    store.compact_changes(100)
+    assert store.compacted_version() == 1
+    store.compact_changes(0)
+    assert store.compacted_version() == 1
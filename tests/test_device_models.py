@@ -0,0 +1,31 @@
+import dataclasses
+import pytest
+from lspnetd.models.device import WireGuardDevicePeerState, WireGuardDeviceState, WireGuardPeerTable
+
+
+def make_peer(public: str, allowed_ips: list[str]):
+    return WireGuardDevicePeerState(public, "", "", allowed_ips, 0, 1, 2, 0)
+
+
+def test_peer_list_is_converted_to_table():
+    state = WireGuardDeviceState("wg0", "priv", "pub", 51820, 0, [make_peer("a", ["10.0.0.0/24"])])
+
+    assert isinstance(state.peers, WireGuardPeerTable)
+    assert state.peers.get("a") == make_peer("a", ["10.0.0.0/24"])
+    assert WireGuardDeviceState("wg1", "priv", "pub", 0, 0).peers == []
+
+
+def test_rows_are_read_only():
+    state = WireGuardDeviceState("wg0", "priv", "pub", 51820, 0, [make_peer("a", [])])
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        state.peers[0].rx = 10  # type: ignore
+
+
+def test_lookup_address_longest_prefix():
+    table = WireGuardPeerTable([make_peer("wide", ["10.0.0.0/8"]), make_peer("narrow", ["10.1.0.0/16"]), make_peer("v6", ["fd00::/64"])])
+
+    assert table.lookup_address("10.1.2.3").public == "narrow"  # type: ignore
+    assert table.lookup_address("10.2.0.1").public == "wide"  # type: ignore
+    assert table.lookup_address("fd00::1").public == "v6"  # type: ignore
+    assert table.lookup_address("192.168.0.1") is None
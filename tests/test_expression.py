@@ -0,0 +1,87 @@
+import random
+import pytest
+from lspnetd.common.expression import PortSet, parse_endpoint_expression, parse_ports_expression, port_segments_to_expression, ports_to_segments
+
+
+def test_adjacent_and_overlapping_ranges_merge():
+    assert PortSet([(10, 13), (14, 20), (30, 40), (35, 50), (60, 60), (5, 5)]).segments == ((5, 5), (10, 20), (30, 50), (60, 60))
+    assert PortSet.parse("80,81-90, 85:100,443").segments == ((80, 100), (443, 443))
+    assert PortSet.parse("10-13,20").format() == "10-13,20"
+    assert PortSet.parse("10-13,20").format(":") == "10:13,20"
+    assert len(PortSet.parse("10-13,20")) == 5
+    assert not PortSet.parse("")
+    with pytest.raises(ValueError):
+        PortSet([(20, 10)])
+    with pytest.raises(ValueError):
+        PortSet.parse("65536")
+
+
+def test_set_operations():
+    a = PortSet.parse("10-20,30-40")
+    b = PortSet.parse("15-35,50")
+    assert (a | b).format() == "10-40,50"
+    assert (a & b).format() == "15-20,30-35"
+    assert (a - b).format() == "10-14,36-40"
+    assert (b - a).format() == "21-29,50"
+    assert PortSet.parse("11-12") <= a
+    assert a >= PortSet.parse("31,39")
+    assert not b <= a
+    # adjacent ranges of both sides merge in a union
+    assert (PortSet.parse("1-9") | PortSet.parse("10-20")).segments == ((1, 20),)
+
+
+def test_set_operations_match_python_sets():
+    rng = random.Random(1)
+
+    def random_set():
+        return PortSet((begin, begin + rng.randrange(5)) for begin in (rng.randrange(1, 200) for _ in range(rng.randrange(8))))
+
+    for _ in range(200):
+        a, b = random_set(), random_set()
+        assert set(a | b) == set(a) | set(b)
+        assert set(a & b) == set(a) & set(b)
+        assert set(a - b) == set(a) - set(b)
+        assert (a | b) == PortSet.from_ports(set(a) | set(b))
+        assert (a - b) == PortSet.from_ports(set(a) - set(b))
+
+
+def test_contains():
+    ports = PortSet.parse("22,80-90,443")
+    assert 22 in ports and 80 in ports and 85 in ports and 90 in ports and 443 in ports
+    assert 21 not in ports and 23 not in ports and 91 not in ports and 444 not in ports
+    assert "22" not in ports
+    assert 1 not in PortSet()
+
+
+def test_multiport_chunks_count_ranges_as_two_slots():
+    singles = PortSet.from_ports(range(1, 32, 2))
+    assert [len(chunk.split(',')) for chunk in singles.multiport_chunks()] == [15, 1]
+
+    # 7 ranges fill 14 slots, an eighth range does not fit in the last one
+    ranges = PortSet((port, port + 1) for port in range(100, 132, 4))
+    chunks = ranges.multiport_chunks()
+    assert len(chunks) == 2
+    assert chunks[0].count(':') == 7 and chunks[1].count(':') == 1
+
+    # a single port still fits in the 15th slot
+    mixed = PortSet([(port, port + 1) for port in range(100, 128, 4)] + [(500, 500)])
+    assert len(mixed.multiport_chunks()) == 1
+    assert mixed.multiport_chunks(limit=4) == ["100:101,104:105", "108:109,112:113", "116:117,120:121", "124:125,500"]
+
+
+def test_iptables_match_args():
+    assert PortSet.parse("80").iptables_match_args() == [["--dport", "80"]]
+    assert PortSet.parse("8000-8100").iptables_match_args("sport") == [["--sport", "8000:8100"]]
+    assert PortSet.parse("80,443,8000-8100").iptables_match_args() == [["-m", "multiport", "--dports", "80,443,8000:8100"]]
+    many = PortSet.from_ports(range(1000, 1020))
+    assert many.iptables_match_args() == [["--dport", "1000:1019"]]
+    assert len(PortSet.from_ports(range(1000, 1040, 2)).iptables_match_args()) == 2
+
+
+def test_legacy_wrappers():
+    assert ports_to_segments([20, 10, 11, 12, 13]) == [(10, 13), (20, 20)]
+    assert port_segments_to_expression([(10, 13), (20, 20)]) == "10-13,20"
+    assert parse_ports_expression("10-13,20") == [10, 11, 12, 13, 20]
+    assert parse_ports_expression("") == []
+    assert parse_endpoint_expression("[fd00::1]:100-101") == ("fd00::1", "fd00::1", [100, 101])
+    assert parse_endpoint_expression("192.0.2.1:51820") == ("192.0.2.1", "192.0.2.1", [51820])
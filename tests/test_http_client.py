@@ -0,0 +1,26 @@
+from typing import Any
+import pytest
+from tests.local_controller import connected_client
+
+
+def test_send_stream_sends_before_iteration():
+    received: list[Any] = []
+
+    def handler(name: str, data: Any):
+        received.append(data)
+        return {"size": len(data["blob"])}
+
+    with connected_client(handler) as client:
+        reply = client.send_stream({"blob": "x" * 100000}, chunk_size=4096)
+        # the request is done even if the reply is never read
+        assert len(received) == 1
+        assert b''.join(reply) == b'{"size": 100000}'
+
+
+def test_send_stream_raises_eagerly_on_error():
+    def handler(name: str, data: Any):
+        raise RuntimeError("rejected")
+
+    with connected_client(handler) as client:
+        with pytest.raises(RuntimeError, match="status: 400"):
+            client.send_stream([b'{}'])
@@ -0,0 +1,87 @@
+from pathlib import Path
+import pytest
+from lspnetd.common.expression import PortSet
+from lspnetd.system.ipset import IpSet, NftSet, parse_ipset_save, parse_nft_sets
+
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+SAVE_OUTPUT = """create allow hash:net family inet hashsize 1024 maxelem 65536
+add allow 10.0.0.0/8
+add allow 192.168.1.0/24
+create ports bitmap:port range 0-65535
+add ports 80
+add ports 8000-8080
+"""
+
+
+def test_plan_creates_missing_set():
+    assert IpSet.of_networks("allow", ["10.0.0.1/8"]).plan(None) == ["create allow hash:net family inet", "add allow 10.0.0.0/8"]
+
+
+def test_plan_is_a_member_delta():
+    current = parse_ipset_save(SAVE_OUTPUT)
+    assert IpSet.of_networks("allow", ["10.0.0.0/8", "172.16.0.0/12"]).plan(current["allow"]) == ["del allow 192.168.1.0/24", "add allow 172.16.0.0/12"]
+    assert IpSet.of_ports("ports", "80,8000-8080").plan(current["ports"]) == []
+
+
+def test_plan_rejects_type_or_family_change():
+    current = parse_ipset_save(SAVE_OUTPUT)
+    with pytest.raises(ValueError, match="family inet6"):
+        IpSet.of_networks("allow", ["fd00::/8"]).plan(current["allow"])
+    with pytest.raises(ValueError, match="bitmap:port"):
+        IpSet.of_networks("ports", ["10.0.0.0/8"]).plan(current["ports"])
+
+
+def test_of_networks_rejects_mixed_families():
+    with pytest.raises(ValueError, match="mixes IPv4 and IPv6"):
+        IpSet.of_networks("mixed", ["10.0.0.0/8", "fd00::/8"])
+    with pytest.raises(ValueError, match="mixes IPv4 and IPv6"):
+        NftSet.of_networks("lspnet", "mixed", ["10.0.0.0/8", "fd00::/8"])
+    with pytest.raises(ValueError, match="family inet"):
+        IpSet.of_networks("v6", ["fd00::/8"], family="inet")
+
+
+def load_nft_sets():
+    return parse_nft_sets((FIXTURES / "nft_ruleset.json").read_text())
+
+
+def test_parse_nft_sets():
+    sets = load_nft_sets()
+    assert sets[("inet", "lspnet", "allow4")] == ("ipv4_addr", ["192.0.2.1/32", "10.0.0.0/8", "198.51.100.0/24"])
+    assert sets[("inet", "lspnet", "allow6")] == ("ipv6_addr", ["fd00::/8"])
+    assert sets[("inet", "lspnet", "ports")] == ("inet_service", [(22, 22), (8000, 8080)])
+    assert sets[("inet", "lspnet", "empty")] == ("ipv4_addr", [])
+    assert len(sets) == 4
+
+
+def test_nft_plan_creates_missing_set():
+    nft_set = NftSet.of_networks("lspnet", "new", ["10.0.0.0/9", "10.128.0.0/9"])
+    assert nft_set.networks == ["10.0.0.0/8"]
+    assert nft_set.plan(None) == [
+        "add table inet lspnet",
+        "add set inet lspnet new { type ipv4_addr; flags interval; }",
+        "add element inet lspnet new { 10.0.0.0/8 }",
+    ]
+
+
+def test_nft_plan_is_an_element_delta():
+    sets = load_nft_sets()
+    allow4 = NftSet.of_networks("lspnet", "allow4", ["10.0.0.0/8", "192.0.2.1/32", "203.0.113.0/24"])
+    assert allow4.plan(sets[allow4.key]) == [
+        "delete element inet lspnet allow4 { 198.51.100.0/24 }",
+        "add element inet lspnet allow4 { 203.0.113.0/24 }",
+    ]
+
+    ports = NftSet.of_ports("lspnet", "ports", "22,8000-8080")
+    assert ports.plan(sets[ports.key]) == []
+    ports = NftSet.of_ports("lspnet", "ports", PortSet.parse("22,443"))
+    assert ports.plan(sets[ports.key]) == ["delete element inet lspnet ports { 8000-8080 }", "add element inet lspnet ports { 443 }"]
+
+
+def test_nft_plan_rejects_type_change():
+    sets = load_nft_sets()
+    nft_set = NftSet.of_networks("lspnet", "allow4", ["fd00::/8"])
+    with pytest.raises(ValueError, match="ipv4_addr, can't change it to ipv6_addr"):
+        nft_set.plan(sets[nft_set.key])
@@ -0,0 +1,71 @@
+from pathlib import Path
+from lspnetd.system.iptables import IptablesRuleset, get_custom_iptables_ruleset, parse_iptables_save
+
+
+SNAPSHOT = parse_iptables_save((Path(__file__).parent / "fixtures" / "iptables_save.txt").read_text())
+
+SSH_RULE = ["-p", "tcp", "-m", "tcp", "--dport", "22", "-m", "comment", "--comment", "lspnet allow ssh", "-j", "ACCEPT"]
+WG_RULE = ["-p", "udp", "-m", "udp", "--dport", "51820", "-j", "ACCEPT"]
+
+
+def test_parse_iptables_save():
+    assert set(SNAPSHOT) == {"raw", "nat", "filter"}
+    assert SNAPSHOT["filter"]["lsp-INPUT"] == [SSH_RULE, WG_RULE]
+    assert SNAPSHOT["filter"]["INPUT"] == [["-j", "lsp-INPUT"]]
+    assert SNAPSHOT["filter"]["OUTPUT"] == []
+    assert SNAPSHOT["nat"]["lsp-POSTROUTING"] == [["-s", "10.20.0.0/16", "-o", "eth0", "-j", "MASQUERADE"]]
+    assert SNAPSHOT["raw"]["lsp-PREROUTING"] == []
+
+
+def test_matching_ruleset_plans_nothing():
+    ruleset = IptablesRuleset()
+    ruleset.add_chain("filter", "lsp-INPUT", [SSH_RULE, WG_RULE], jump_from="INPUT")
+    ruleset.add_chain("raw", "lsp-PREROUTING", jump_from="PREROUTING")
+    assert ruleset.plan(SNAPSHOT) == ""
+
+
+def test_missing_chains_and_jumps_are_created():
+    ruleset = get_custom_iptables_ruleset("lsp")
+    assert ruleset.plan(SNAPSHOT) == (
+        "*nat\n"
+        ":lsp-PREROUTING - [0:0]\n"
+        "-I PREROUTING -j lsp-PREROUTING\n"
+        "COMMIT\n"
+        "*mangle\n"
+        ":lsp-POSTROUTING - [0:0]\n"
+        "-I POSTROUTING -j lsp-POSTROUTING\n"
+        "COMMIT\n"
+        "*filter\n"
+        ":lsp-FORWARD - [0:0]\n"
+        "-I FORWARD -j lsp-FORWARD\n"
+        "COMMIT\n"
+    )
+
+
+def test_drifted_chain_is_flushed_and_rewritten():
+    ruleset = IptablesRuleset()
+    ruleset.add_chain("filter", "lsp-INPUT", [WG_RULE, SSH_RULE])
+    ruleset.add_rule("nat", "lsp-POSTROUTING", ["-s", "10.20.0.0/16", "-o", "eth0", "-j", "MASQUERADE"])
+    assert ruleset.plan(SNAPSHOT) == (
+        "*filter\n"
+        "-F lsp-INPUT\n"
+        "-A lsp-INPUT -p udp -m udp --dport 51820 -j ACCEPT\n"
+        '-A lsp-INPUT -p tcp -m tcp --dport 22 -m comment --comment "lspnet allow ssh" -j ACCEPT\n'
+        "COMMIT\n"
+    )
+
+
+def test_new_chain_rules_are_quoted():
+    rules = [["-m", "comment", "--comment", 'say "hi" \\o/', "-j", "ACCEPT"], ["-m", "comment", "--comment", "", "-j", "DROP"]]
+    ruleset = IptablesRuleset()
+    ruleset.add_chain("filter", "lsp-FORWARD", rules)
+    restore_input = ruleset.plan({})
+    assert restore_input == (
+        "*filter\n"
+        ":lsp-FORWARD - [0:0]\n"
+        '-A lsp-FORWARD -m comment --comment "say \\"hi\\" \\\\o/" -j ACCEPT\n'
+        '-A lsp-FORWARD -m comment --comment "" -j DROP\n'
+        "COMMIT\n"
+    )
+    # the quoted restore input parses back to the same arguments
+    assert parse_iptables_save(restore_input)["filter"]["lsp-FORWARD"] == rules
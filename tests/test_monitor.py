@@ -0,0 +1,69 @@
+import os
+import socket
+import sys
+import threading
+import time
+import pytest
+from lspnetd.device.monitor import InterfaceEvent, NamespaceMonitor
+
+
+class FakeSocket:
+    "hands out queued datagrams, then stops the monitor"
+
+    def __init__(self, monitor: NamespaceMonitor, datagrams: list[bytes]):
+        self.monitor = monitor
+        self.datagrams = datagrams
+
+    def recv(self, size: int):
+        if not self.datagrams:
+            self.monitor.stopped.set()
+            raise socket.timeout()
+        return self.datagrams.pop(0)
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="needs rtnetlink")
+def test_malformed_datagram_resyncs_and_keeps_running():
+    monitor = NamespaceMonitor("")
+    events: list[InterfaceEvent] = []
+    monitor.add_callback(events.append)
+    # truncated nlmsghdr, then a length field pointing past the end
+    monitor.sock = FakeSocket(monitor, [b"\x01\x02", b"\xff\x00\x00\x00" + b"\x00" * 12])  # type: ignore
+
+    monitor._run_netlink()
+
+    # the view was rebuilt from a full dump and reported
+    assert "lo" in monitor.interfaces()
+    assert any(event.name == "lo" for event in events)
+    assert monitor.sock.datagrams == []  # type: ignore
+
+
+class FakeProcess:
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def wait(self):
+        return 0
+
+
+def test_iproute2_resyncs_once_per_burst(monkeypatch: pytest.MonkeyPatch):
+    monitor = NamespaceMonitor("", backend="iproute2")
+    resyncs: list[int] = []
+    monkeypatch.setattr(monitor, "_resync", lambda: resyncs.append(1) or [])
+    read_fd, write_fd = os.pipe()
+    monitor.process = FakeProcess(os.fdopen(read_fd, "rb", buffering=0))  # type: ignore
+    thread = threading.Thread(target=monitor._run_iproute2)
+    thread.start()
+    try:
+        os.write(write_fd, b"3: veth0@if2: <BROADCAST,MULTICAST> mtu 1500 state DOWN\n")
+        os.write(write_fd, b"3: veth0    inet 10.0.0.1/30 scope global veth0\n")
+        os.write(write_fd, b"3: veth0    inet6 fe80::1/64 scope link\n")
+        time.sleep(0.5)
+        assert resyncs == [1]
+
+        os.write(write_fd, b"Deleted 3: veth0@if2: <BROADCAST,MULTICAST> mtu 1500 state DOWN\n")
+    finally:
+        os.close(write_fd)
+        thread.join(5)
+    assert not thread.is_alive()
+    assert resyncs == [1, 1]
+    monitor.process.stdout.close()  # type: ignore
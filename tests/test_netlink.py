@@ -0,0 +1,57 @@
+import json
+import os
+import struct
+import pytest
+from lspnetd.device.interface import parse_ip_addr_entry
+from lspnetd.device.netlink import (NLMSGHDR, RTM_NEWADDR, RTM_NEWLINK, build_interface_states, iter_netlink_messages,
+                                    parse_addr_message, parse_link_message)
+
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str, mode: str = "rb"):
+    with open(os.path.join(FIXTURES, name), mode) as f:
+        return f.read()
+
+
+# recorded from one namespace: lo up, veth0 (mtu 1420, two IPv4 and one IPv6 address), veth1 (peer address)
+LINK_DUMP = read_fixture("netlink_link_dump.bin")
+ADDR_DUMP = read_fixture("netlink_addr_dump.bin")
+IP_ADDR_SHOW = json.loads(read_fixture("ip_addr_show.json", "r"))
+
+
+def test_build_interface_states_matches_ip_json():
+    netlink_states = {state.name: state for state in build_interface_states(LINK_DUMP, ADDR_DUMP)}
+    iproute2_states = {state.name: state for state in map(parse_ip_addr_entry, IP_ADDR_SHOW)}
+
+    assert netlink_states == iproute2_states
+
+
+def test_recorded_dump_contents():
+    states = {state.name: state for state in build_interface_states(LINK_DUMP, ADDR_DUMP)}
+
+    assert states["veth0"].mtu == 1420
+    assert states["veth0"].up
+    assert states["veth0"].all_ipv4 == ["10.20.0.1/30", "10.20.1.1/24"]
+    assert "fd00:20::1/64" in states["veth0"].all_ipv6
+    # point-to-point: IFA_LOCAL wins over the peer in IFA_ADDRESS
+    assert states["veth1"].all_ipv4 == ["172.16.5.5/32"]
+    assert states["lo"].all_ipv6 == ["::1/128"]
+
+
+def test_parse_single_messages():
+    links = [parse_link_message(payload) for msg_type, _, payload in iter_netlink_messages(LINK_DUMP) if msg_type == RTM_NEWLINK]
+    assert [name for _, name, _, _, _ in links] == [entry["ifname"] for entry in IP_ADDR_SHOW]
+
+    addresses = [parse_addr_message(payload) for msg_type, _, payload in iter_netlink_messages(ADDR_DUMP) if msg_type == RTM_NEWADDR]
+    assert sum(len(entry["addr_info"]) for entry in IP_ADDR_SHOW) == len(addresses)
+
+
+def test_truncated_dump_is_rejected():
+    msg_len = NLMSGHDR.unpack_from(LINK_DUMP)[0]
+    with pytest.raises(ValueError):
+        list(iter_netlink_messages(LINK_DUMP[:msg_len - 8]))
+
+    with pytest.raises(ValueError):
+        list(iter_netlink_messages(struct.pack("=IHHII", 4, RTM_NEWLINK, 0, 0, 0)))
@@ -0,0 +1,81 @@
+import threading
+import time
+from pathlib import Path
+import pytest
+from lspnetd.common import nsworker
+from lspnetd.common.nsworker import NamespaceWorkerPool
+
+
+# stands in for nsworker_main.py: no setns, answers every request with its namespace.
+# namespaces starting with "slow" take a while to become ready, "broken" never does.
+STUB_WORKER = """
+import json, sys, time
+namespace = sys.argv[1]
+if namespace == "broken":
+    print(json.dumps({"ready": False, "error": "no such namespace"}), flush=True)
+    sys.exit(0)
+if namespace.startswith("slow"):
+    time.sleep(0.5)
+print(json.dumps({"ready": True}), flush=True)
+for line in sys.stdin:
+    print(json.dumps({"returncode": 0, "stdout": namespace, "stderr": ""}), flush=True)
+"""
+
+
+@pytest.fixture
+def pool(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    script = tmp_path / "stub_worker.py"
+    script.write_text(STUB_WORKER)
+    monkeypatch.setattr(nsworker, "WORKER_SCRIPT", str(script))
+    monkeypatch.setattr(nsworker.utils, "sudo_wrap", lambda args: args)
+    pool = NamespaceWorkerPool(idle_timeout=60)
+    yield pool
+    pool.close()
+
+
+def test_workers_are_pooled_per_namespace(pool: NamespaceWorkerPool):
+    assert pool.run("ns1", ["true"]).stdout == "ns1"
+    assert pool.run("ns2", ["true"]).stdout == "ns2"
+    worker = pool.get("ns1")
+    assert pool.run("ns1", ["true"]).stdout == "ns1"
+    assert pool.get("ns1") is worker
+    assert set(pool.workers) == {"ns1", "ns2"}
+
+
+def test_dead_worker_is_closed_and_replaced(pool: NamespaceWorkerPool):
+    worker = pool.get("ns1")
+    worker.process.kill()
+    worker.process.wait()
+
+    replacement = pool.get("ns1")
+    assert replacement is not worker
+    assert replacement.alive()
+    assert worker.process.stdin is not None and worker.process.stdin.closed
+    assert pool.run("ns1", ["true"]).stdout == "ns1"
+
+
+def test_failed_start_is_reported_and_retried(pool: NamespaceWorkerPool):
+    with pytest.raises(RuntimeError, match="no such namespace"):
+        pool.get("broken")
+    assert pool.starting == {} and pool.workers == {}
+    with pytest.raises(RuntimeError, match="no such namespace"):
+        pool.get("broken")
+
+
+def test_startup_runs_in_parallel(pool: NamespaceWorkerPool):
+    results: dict[str, object] = {}
+
+    def get(namespace: str):
+        results[namespace] = pool.get(namespace)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=get, args=(namespace,)) for namespace in ("slow1", "slow2", "slow3", "slow1")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # three 0.5s startups overlap instead of running one after another
+    assert time.monotonic() - started < 1.2
+    assert set(pool.workers) == {"slow1", "slow2", "slow3"}
+    assert results["slow1"] is pool.workers["slow1"]
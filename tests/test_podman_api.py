@@ -0,0 +1,126 @@
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Any, Iterator
+import pytest
+from lspnetd.external import podman_api
+from lspnetd.external.podman_api import PodmanClient, PodmanRouterManager
+from lspnetd.models.container import ContainerStatus
+
+
+INSPECT_BODY = {"Id": "c0ffee", "State": {"Status": "exited"}, "HostConfig": {"Binds": ["/tmp/lspnetd/ns1/router:/data:ro"]}}
+
+
+class StubPodman(socketserver.ThreadingUnixStreamServer):
+    "libpod REST API subset: inspect of one known container, create and start"
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str):
+        self.requests: list[tuple[str, str, Any]] = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any):
+                pass
+
+            def reply(self, status: int, body: Any = None):
+                data = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def handle_request(self, method: str):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length)) if length else None
+                path = self.path.split("?")[0]
+                server.requests.append((method, path, body))
+
+                if method == "GET" and path == "/v4.0.0/libpod/containers/known/json":
+                    self.reply(200, INSPECT_BODY)
+                elif method == "GET" and path.endswith("/json"):
+                    self.reply(404, {"message": "no such container"})
+                elif method == "POST" and path == "/v4.0.0/libpod/containers/create":
+                    self.reply(201, {"Id": "new-id"})
+                elif method == "POST" and path.endswith("/start"):
+                    self.reply(204)
+                else:
+                    self.reply(500, {"message": "unexpected request"})
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+        super().__init__(socket_path, Handler)
+
+
+@pytest.fixture
+def stub_podman(tmp_path: Path) -> Iterator[StubPodman]:
+    server = StubPodman(str(tmp_path / "podman.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_inspect(stub_podman: StubPodman):
+    client = PodmanClient(stub_podman.server_address)  # type: ignore
+    status = client.inspect("known")
+    assert status is not None and status.id == "c0ffee" and status.state == "exited"
+    assert status.bind_mounts[0].source == "/tmp/lspnetd/ns1/router"
+    assert client.inspect("missing") is None
+
+
+def test_start_creates_missing_router(stub_podman: StubPodman):
+    manager = PodmanRouterManager(PodmanClient(stub_podman.server_address))  # type: ignore
+    manager.start("ns1")
+
+    methods_paths = [(method, path) for method, path, _ in stub_podman.requests]
+    assert methods_paths == [
+        ("GET", "/v4.0.0/libpod/containers/ns1-router/json"),
+        ("POST", "/v4.0.0/libpod/containers/create"),
+        ("POST", "/v4.0.0/libpod/containers/new-id/start"),
+    ]
+    assert stub_podman.requests[1][2]["netns"] == {"nsmode": "path", "value": "/var/run/netns/ns1"}
+
+
+class ClosingServer(socketserver.UnixStreamServer):
+    "accepts and hangs up, like a podman service dying mid-request"
+
+    def __init__(self, socket_path: str):
+        super().__init__(socket_path, socketserver.BaseRequestHandler)
+
+
+@pytest.mark.parametrize("broken", ["missing", "closed"])
+def test_falls_back_to_cli(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, broken: str):
+    socket_path = str(tmp_path / "podman.sock")
+    cli_calls: list[str] = []
+
+    def fake_inspect(container_name: str):
+        cli_calls.append(container_name)
+        return ContainerStatus(id="cli-id", bind_mounts=[], state="running")
+
+    monkeypatch.setattr(podman_api, "inspect_podman_container", fake_inspect)
+
+    server = None
+    if broken == "closed":
+        server = ClosingServer(socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = PodmanClient(socket_path)
+        status = client.inspect("known")
+        assert status is not None and status.id == "cli-id"
+        assert cli_calls == ["known"]
+        assert not client.ping()
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,110 @@
+from lspnetd.models.desired import DesiredState, DummyDeviceSpec, NamespaceSpec, VethDeviceSpec, WireGuardDeviceSpec, WireGuardPeerSpec
+from lspnetd.models.device import NetworkInterfaceState, WireGuardDevicePeerState, WireGuardDeviceState
+from lspnetd.system.reconciler import NamespaceObservedState, plan_reconcile
+
+
+def link(name: str, addresses: list[str], mtu: int = 1500, up: bool = True, admin_up: bool | None = None):
+    return NetworkInterfaceState(name, mtu, up, [a for a in addresses if ':' not in a], [a for a in addresses if ':' in a],
+                                 admin_up=up if admin_up is None else admin_up)
+
+
+def desired_state():
+    return DesiredState(namespaces=[NamespaceSpec(
+        name="ns1",
+        dummy=[DummyDeviceSpec(name="dummy0", addresses=["10.0.0.1/32"], mtu=1400)],
+        veth=[VethDeviceSpec(name="veth0", peer_namespace="", peer_name="veth-ns1", addresses=["10.1.0.1/30"], peer_addresses=["10.1.0.2/30"])],
+        wireguard=[WireGuardDeviceSpec(name="wg0", private_key="priv", listen_port=51820, addresses=["10.2.0.1/24"], mtu=1420,
+                                       peers=[WireGuardPeerSpec(public="peer1", endpoint="192.0.2.1:51820", allowed_ips=["10.2.0.2/32"], keepalive=25)])],
+    )])
+
+
+def observed_state():
+    wg_peer = WireGuardDevicePeerState("peer1", "", "192.0.2.1:51820", ["10.2.0.2/32"], 0, 0, 0, 25)
+    return {
+        "ns1": NamespaceObservedState(True, interfaces={
+            "dummy0": link("dummy0", ["10.0.0.1/32"], mtu=1400),
+            "veth0": link("veth0", ["10.1.0.1/30", "fe80::1/64"]),
+            "wg0": link("wg0", ["10.2.0.1/24"], mtu=1420),
+        }, wireguard={"wg0": WireGuardDeviceState("wg0", "priv", "pub", 51820, 0, [wg_peer])}),
+        "": NamespaceObservedState(True, interfaces={"veth-ns1": link("veth-ns1", ["10.1.0.2/30"])}),
+    }
+
+
+def test_unchanged_state_gives_empty_plan():
+    plan = plan_reconcile(desired_state(), observed_state())
+    assert plan.empty
+    assert plan.describe() == []
+
+
+def test_missing_namespace_creates_everything():
+    observed = observed_state()
+    observed["ns1"] = NamespaceObservedState(False)
+    observed[""].interfaces = {}
+    plan = plan_reconcile(desired_state(), observed)
+
+    assert plan.ip_operations[0] == ("", ["netns", "add", "ns1"])
+    root_ops = [args for namespace, args in plan.ip_operations if namespace == ""]
+    assert ["link", "add", "veth0", "netns", "ns1", "type", "veth", "peer", "veth-ns1"] in root_ops
+    assert ["link", "add", "wg0", "type", "wireguard"] in root_ops
+    assert ["link", "set", "dev", "wg0", "netns", "ns1"] in root_ops
+    ns_ops = [args for namespace, args in plan.ip_operations if namespace == "ns1"]
+    assert ns_ops[0] == ["link", "add", "dummy0", "type", "dummy"]
+    assert ["address", "add", "dev", "wg0", "10.2.0.1/24"] in ns_ops
+    assert [(op.spec.name, op.device_changed, op.changed_peers) for op in plan.wireguard] == [("wg0", True, ["peer1"])]
+
+
+def test_missing_veth_end_is_recreated():
+    observed = observed_state()
+    del observed["ns1"].interfaces["veth0"]
+    plan = plan_reconcile(desired_state(), observed)
+
+    assert plan.ip_operations[:2] == [
+        ("", ["link", "delete", "dev", "veth-ns1"]),
+        ("", ["link", "add", "veth0", "netns", "ns1", "type", "veth", "peer", "veth-ns1"]),
+    ]
+
+
+def test_mtu_and_address_drift():
+    observed = observed_state()
+    observed["ns1"].interfaces["dummy0"] = link("dummy0", ["10.0.0.9/32"], mtu=1500)
+    plan = plan_reconcile(desired_state(), observed)
+
+    # the fe80:: address on veth0 is left alone
+    assert plan.ip_operations == [
+        ("ns1", ["address", "delete", "dev", "dummy0", "10.0.0.9/32"]),
+        ("ns1", ["address", "add", "dev", "dummy0", "10.0.0.1/32"]),
+        ("ns1", ["link", "set", "dev", "dummy0", "mtu", "1400"]),
+    ]
+    assert not plan.wireguard
+
+
+def test_wireguard_peer_diff():
+    desired = desired_state()
+    wg = desired.namespaces[0].wireguard[0]
+    wg.peers[0].keepalive = 0
+    wg.peers.append(WireGuardPeerSpec(public="peer2", allowed_ips=["10.2.0.3/32"]))
+    observed = observed_state()
+    current = observed["ns1"].wireguard["wg0"]
+    observed["ns1"].wireguard["wg0"] = WireGuardDeviceState("wg0", "priv", "pub", 51820, 0, [
+        *current.peers, WireGuardDevicePeerState("stale", "", "", ["10.2.0.9/32"], 0, 0, 0, 0)])
+    plan = plan_reconcile(desired, observed)
+
+    assert plan.ip_operations == []
+    assert [(op.device_changed, op.changed_peers) for op in plan.wireguard] == [(False, ["peer1", "peer2", "stale"])]
+
+
+def test_link_state_uses_admin_flag():
+    desired = desired_state()
+    desired.namespaces[0].dummy[0].up = False
+    observed = observed_state()
+    # administratively up without carrier
+    observed["ns1"].interfaces["dummy0"] = link("dummy0", ["10.0.0.1/32"], mtu=1400, up=False, admin_up=True)
+    # no carrier yet, but already set up: nothing to do
+    observed["ns1"].interfaces["veth0"] = link("veth0", ["10.1.0.1/30"], up=False, admin_up=True)
+    plan = plan_reconcile(desired, observed)
+    assert plan.ip_operations == [("ns1", ["link", "set", "dev", "dummy0", "down"])]
+
+    observed["ns1"].interfaces["dummy0"] = link("dummy0", ["10.0.0.1/32"], mtu=1400, up=False, admin_up=False)
+    observed["ns1"].interfaces["veth0"] = link("veth0", ["10.1.0.1/30"], up=False, admin_up=False)
+    plan = plan_reconcile(desired, observed)
+    assert plan.ip_operations == [("ns1", ["link", "set", "dev", "veth0", "up"])]
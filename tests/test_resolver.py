@@ -0,0 +1,98 @@
+import socket
+import types
+import pytest
+from lspnetd.common import resolver as resolver_module
+from lspnetd.common.resolver import EndpointResolver
+from lspnetd.device import wireguard
+from lspnetd.models.device import WireGuardPeerConfig
+
+
+class FakeDNS:
+    def __init__(self):
+        self.records: dict[str, list[str]] = {}
+        self.lookups: list[str] = []
+
+    def __call__(self, host: str) -> list[str]:
+        self.lookups.append(host)
+        if host not in self.records:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return self.records[host]
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch):
+    now = types.SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(resolver_module, "time", types.SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_answers_expire_after_ttl(clock: types.SimpleNamespace):
+    dns = FakeDNS()
+    dns.records["a.example"] = ["2001:db8::1", "192.0.2.1"]
+    resolver = EndpointResolver(ttl=60, resolve_func=dns)
+
+    assert resolver.resolve("a.example") == "192.0.2.1"
+    dns.records["a.example"] = ["192.0.2.2"]
+    clock.value += 59
+    assert resolver.resolve("A.example") == "192.0.2.1"
+    clock.value += 1
+    assert resolver.resolve("a.example") == "192.0.2.2"
+    assert dns.lookups == ["a.example", "a.example"]
+
+
+def test_failures_are_cached_for_negative_ttl(clock: types.SimpleNamespace):
+    dns = FakeDNS()
+    resolver = EndpointResolver(ttl=60, negative_ttl=10, resolve_func=dns)
+
+    with pytest.raises(socket.gaierror, match="Name or service not known"):
+        resolver.resolve("b.example")
+    dns.records["b.example"] = ["192.0.2.3"]
+    clock.value += 9
+    with pytest.raises(socket.gaierror):
+        resolver.resolve("b.example")
+    assert len(dns.lookups) == 1
+
+    clock.value += 1
+    assert resolver.resolve("b.example") == "192.0.2.3"
+
+
+def test_refresh_reports_changes_and_forgets_stale_keys(clock: types.SimpleNamespace):
+    dns = FakeDNS()
+    dns.records["a.example"] = ["192.0.2.1"]
+    dns.records["b.example"] = ["192.0.2.2"]
+    resolver = EndpointResolver(ttl=60, resolve_func=dns, last_seen_ttl=300)
+
+    assert resolver.refresh({"a": "a.example", "b": "b.example"}) == {"a": "192.0.2.1", "b": "192.0.2.2"}
+    dns.records["a.example"] = ["192.0.2.9"]
+    del dns.records["b.example"]
+    assert resolver.refresh({"a": "a.example", "b": "b.example"}) == {"a": "192.0.2.9", "b": None}
+    assert resolver.refresh({"a": "a.example"}) == {}
+
+    clock.value += 300
+    resolver.refresh({"a": "a.example"})
+    assert list(resolver.last_seen) == ["a"]
+    assert set(resolver.cache) == {"a.example"}
+
+
+def test_failed_endpoint_update_is_retried(monkeypatch: pytest.MonkeyPatch):
+    dns = FakeDNS()
+    dns.records["peer.example"] = ["192.0.2.1"]
+    resolver = EndpointResolver(resolve_func=dns)
+    calls: list[list[str]] = []
+
+    def failing_wg_set(args: list[str], input: str):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("wg set failed")
+
+    monkeypatch.setattr(wireguard, "sudo_call_input", failing_wg_set)
+    monkeypatch.setattr(wireguard.state_cache, "wireguard_device", lambda namespace, name: None)
+    peers = [WireGuardPeerConfig("pub1", "peer.example:51820")]
+
+    with pytest.raises(RuntimeError):
+        wireguard.refresh_wg_endpoints("", "wg0", peers, resolver)
+    # the change was not applied, so it is still reported
+    assert wireguard.refresh_wg_endpoints("", "wg0", peers, resolver) == ["pub1"]
+    assert calls[1] == ["wg", "set", "wg0", "peer", "pub1", "endpoint", "192.0.2.1:51820"]
+    assert wireguard.refresh_wg_endpoints("", "wg0", peers, resolver) == []
+    assert len(calls) == 2
@@ -0,0 +1,155 @@
+import os
+import shutil
+import subprocess
+import threading
+import time
+import pytest
+from lspnetd.device.ns import destroy_netns, list_raw_netns_paths
+from lspnetd.system.scheduler import (STEP_FAILED, STEP_OK, STEP_SKIPPED, ProvisionReport, ProvisionScheduler, ProvisionStepResult,
+                                      add_router_namespace)
+
+
+needs_root = pytest.mark.skipif(os.geteuid() != 0 or shutil.which("ip") is None, reason="needs root and iproute2")
+
+
+def netns_exists(namespace: str):
+    return f"/run/netns/{namespace}" in list_raw_netns_paths() or f"/var/run/netns/{namespace}" in list_raw_netns_paths()
+
+
+def fail():
+    raise RuntimeError("device setup failed")
+
+
+@needs_root
+def test_rollback_removes_namespace_it_created():
+    scheduler = ProvisionScheduler()
+    add_router_namespace(scheduler, "lspnetd-test-new", fail, start_router=False)
+    try:
+        scheduler.run()
+        assert not netns_exists("lspnetd-test-new")
+    finally:
+        destroy_netns("lspnetd-test-new")
+
+
+@needs_root
+def test_rollback_keeps_existing_namespace():
+    subprocess.run(["ip", "netns", "add", "lspnetd-test-old"], check=True)
+    try:
+        scheduler = ProvisionScheduler()
+        add_router_namespace(scheduler, "lspnetd-test-old", fail, start_router=False)
+        scheduler.run()
+        assert netns_exists("lspnetd-test-old")
+    finally:
+        destroy_netns("lspnetd-test-old")
+
+
+class Recorder:
+    "thread-safe log of step and rollback calls"
+
+    def __init__(self):
+        self.calls: list[str] = []
+        self.lock = threading.Lock()
+
+    def step(self, label: str, fail: bool = False, delay: float = 0):
+        def run():
+            if delay:
+                time.sleep(delay)
+            with self.lock:
+                self.calls.append(label)
+            if fail:
+                raise RuntimeError("{} failed".format(label))
+        return run
+
+
+def statuses(report: ProvisionReport):
+    return {(result.namespace, result.name): result.status for result in report.results}
+
+
+def test_dependency_ordering():
+    recorder = Recorder()
+    scheduler = ProvisionScheduler(max_workers=4)
+    scheduler.add_step("a", "netns", recorder.step("a/netns", delay=0.05))
+    scheduler.add_step("a", "devices", recorder.step("a/devices"))
+    # b/devices waits for a/devices even though b/netns is done first
+    scheduler.add_step("b", "netns", recorder.step("b/netns"))
+    scheduler.add_step("b", "devices", recorder.step("b/devices"), after=[("a", "devices")])
+    report = scheduler.run()
+
+    assert report.ok
+    calls = recorder.calls
+    assert calls.index("a/netns") < calls.index("a/devices") < calls.index("b/devices")
+    assert calls.index("b/netns") < calls.index("b/devices")
+    # independent namespaces start right away
+    assert calls[0] == "b/netns"
+
+
+def test_cycle_is_rejected_before_running():
+    recorder = Recorder()
+    scheduler = ProvisionScheduler()
+    scheduler.add_step("a", "one", recorder.step("a/one"), after=[("b", "one")])
+    scheduler.add_step("b", "one", recorder.step("b/one"), after=[("a", "one")])
+    with pytest.raises(ValueError, match="dependency cycle"):
+        scheduler.run()
+    assert recorder.calls == []
+
+    scheduler = ProvisionScheduler()
+    scheduler.add_step("a", "one", recorder.step("a/one"), after=[("missing", "step")])
+    with pytest.raises(ValueError, match="unknown step missing/step"):
+        scheduler.run()
+    with pytest.raises(ValueError, match="duplicate step"):
+        scheduler.add_step("a", "one", recorder.step("a/one"))
+
+
+def test_failure_skips_dependents_and_rolls_back_newest_first():
+    recorder = Recorder()
+    scheduler = ProvisionScheduler()
+    scheduler.add_step("a", "netns", recorder.step("a/netns"), recorder.step("undo a/netns"))
+    scheduler.add_step("a", "devices", recorder.step("a/devices"), recorder.step("undo a/devices"))
+    scheduler.add_step("a", "router", recorder.step("a/router", fail=True), recorder.step("undo a/router"))
+    scheduler.add_step("a", "extra", recorder.step("a/extra"))
+    scheduler.add_step("b", "netns", recorder.step("b/netns"), recorder.step("undo b/netns"))
+    scheduler.add_step("b", "devices", recorder.step("b/devices"), recorder.step("undo b/devices"), after=[("a", "router")])
+    scheduler.add_step("c", "netns", recorder.step("c/netns"), recorder.step("undo c/netns"))
+    report = scheduler.run()
+
+    assert not report.ok
+    assert report.failed_namespaces == ["a", "b"]
+    assert statuses(report) == {
+        ("a", "netns"): STEP_OK, ("a", "devices"): STEP_OK, ("a", "router"): STEP_FAILED, ("a", "extra"): STEP_SKIPPED,
+        ("b", "netns"): STEP_OK, ("b", "devices"): STEP_SKIPPED, ("c", "netns"): STEP_OK,
+    }
+    # failed steps are not rolled back, completed ones newest first. c is untouched
+    undo = [call for call in recorder.calls if call.startswith("undo")]
+    assert [call for call in undo if call.startswith("undo a/")] == ["undo a/devices", "undo a/netns"]
+    assert [call for call in undo if call.startswith("undo b/")] == ["undo b/netns"]
+    assert "a/extra" not in recorder.calls and "b/devices" not in recorder.calls
+    assert all(not call.startswith("undo c/") for call in undo)
+
+
+def test_rollback_error_is_reported():
+    recorder = Recorder()
+    scheduler = ProvisionScheduler()
+    scheduler.add_step("a", "netns", recorder.step("a/netns"), recorder.step("undo a/netns", fail=True))
+    scheduler.add_step("a", "devices", recorder.step("a/devices", fail=True))
+    results = {(r.namespace, r.name): r for r in scheduler.run().results}
+
+    assert results[("a", "netns")].rollback_error == "undo a/netns failed"
+    assert not results[("a", "netns")].rolled_back
+    assert results[("a", "devices")].error == "a/devices failed"
+
+
+def test_report_describe():
+    report = ProvisionReport([
+        ProvisionStepResult("b", "netns", STEP_OK, 0.0, 0.25),
+        ProvisionStepResult("a", "devices", STEP_FAILED, 0.5, 0.125, error="boom"),
+        ProvisionStepResult("a", "netns", STEP_OK, 0.0, 0.5, rolled_back=True, rollback_seconds=0.01),
+        ProvisionStepResult("a", "router", STEP_SKIPPED, 0.625, rollback_error="ignored"),
+    ], 1.5)
+
+    assert report.describe() == [
+        "a/netns: ok at 0.000s took 0.500s, rolled back in 0.010s",
+        "a/devices: failed at 0.500s took 0.125s (boom)",
+        "a/router: skipped at 0.625s took 0.000s, rollback failed (ignored)",
+        "b/netns: ok at 0.000s took 0.250s",
+        "total 1.500s",
+    ]
@@ -0,0 +1,36 @@
+import gc
+import threading
+from pathlib import Path
+from lspnetd.config.base import BaseSQLiteDB
+
+
+def test_thread_connection_is_released_on_exit(tmp_path: Path):
+    db = BaseSQLiteDB(str(tmp_path / "test.db"))
+    db.execute("create table t (k integer)")
+    assert len(db._connections) == 1
+
+    def worker():
+        db.insert_into("t", {"k": 1})
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    gc.collect()
+
+    # only the main thread connection is left
+    assert len(db._connections) == 1
+    assert db.queryone("select count(*) as n from t")["n"] == 8  # type: ignore
+    db.close()
+    assert db._connections == []
+
+
+def test_memory_database_is_shared_across_threads():
+    db = BaseSQLiteDB(":memory:")
+    db.execute("create table t (k integer)")
+    t = threading.Thread(target=lambda: db.insert_into("t", {"k": 1}))
+    t.start()
+    t.join()
+    assert db.queryone("select count(*) as n from t")["n"] == 1  # type: ignore
+    db.close()
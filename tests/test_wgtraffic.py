@@ -0,0 +1,39 @@
+from lspnetd.device.wgtraffic import WireGuardTrafficCollector
+from lspnetd.models.device import WireGuardDevicePeerState, WireGuardDeviceState
+
+
+def make_state(device: str, public: str, rx: int, tx: int):
+    return WireGuardDeviceState(device, "priv", "pub", 51820, 0, [WireGuardDevicePeerState(public, "", "", [], 100, rx, tx, 0)])
+
+
+def test_rates_and_history():
+    collector = WireGuardTrafficCollector()
+    collector.update([make_state("wg0", "p1", 0, 0)], now=100, namespace="a")
+    result = collector.update([make_state("wg0", "p1", 1000, 500)], now=110, namespace="a")
+
+    assert result[0].rx_rate == 100
+    assert result[0].tx_rate == 50
+    assert result[0].namespace == "a"
+    assert collector.history("wg0", "p1", "a") == ([100.0], [50.0])
+
+
+def test_namespaces_are_kept_apart():
+    collector = WireGuardTrafficCollector()
+    collector.update([make_state("wg0", "p1", 0, 0)], now=100, namespace="a")
+    collector.update([make_state("wg0", "p1", 0, 0)], now=100, namespace="b")
+    collector.update([make_state("wg0", "p1", 1000, 0)], now=110, namespace="a")
+    # same device and peer name in another namespace: neither merged with nor pruning namespace a
+    collector.update([make_state("wg0", "p1", 5000, 0)], now=110, namespace="b")
+
+    assert collector.history("wg0", "p1", "a") == ([100.0], [0.0])
+    assert collector.history("wg0", "p1", "b") == ([500.0], [0.0])
+
+
+def test_removed_peers_are_pruned_per_namespace():
+    collector = WireGuardTrafficCollector()
+    collector.update([make_state("wg0", "p1", 0, 0)], now=100, namespace="a")
+    collector.update([make_state("wg0", "p2", 0, 0)], now=100, namespace="b")
+    collector.update([], now=110, namespace="b")
+
+    assert ("a", "wg0", "p1") in collector.peers
+    assert ("b", "wg0", "p2") not in collector.peers